@@ -2,10 +2,23 @@
 load_dotenv()
 
 from src.fetch_deals import get_recent_deals_grouped_by_owner
-from src.engagements import fetch_engagements_for_deal
-from src.analyze_deals import analyze_deals
-from src.emailer import send_email_with_csv
-import time
+from src.engagements_async import fetch_engagements_for_deals
+from src.analyze_columnar import analyze_deals_columnar
+from src.alert_state import AlertState
+from src.deal_table import attach_engagements
+from src.pipeline import run_daily_pipeline
+from src.metric_history import MetricHistory
+from src.log import get_logger, stage
+from src.dispatch import DispatchQueue
+from src.emailer import SUMMARY_RECIPIENTS, DailyReports, send_message, summary_rollup
+import os
+
+# "columnar" evaluates the alert rules as NumPy array operations (large portfolios)
+ANALYSIS_ENGINE = os.getenv("ANALYSIS_ENGINE", "serial")
+# "1" also mails each manager in owner_manager.json a digest of their reporting tree
+MANAGER_DIGESTS = os.getenv("MANAGER_DIGESTS", "0") == "1"
+
+log = get_logger("main")
 
 # ✅ Only send to selected owners
 exclude_emails = {
@@ -15,71 +28,74 @@ exclude_emails = {
    "ashvini.jakhar@prozo.com"
  }
 
-# Retry wrapper for email sending
-def safe_send_email(email, deals, role, metrics=None):
-    try:
-        send_email_with_csv(email, deals, role, metrics=metrics)
-        print(f"✅ Email sent to {email}")
-    except Exception as e:
-        print(f"❌ First attempt failed to send email to {email}: {e}")
-        print("🔁 Retrying in 5 seconds...")
-        time.sleep(5)
-        try:
-            send_email_with_csv(email, deals, role, metrics=metrics)
-            print(f"✅ Email sent to {email} on retry")
-        except Exception as e2:
-            print(f"❌ Retry also failed for {email}: {e2}")
+def run_columnar():
+    """Stage-by-stage run for the whole-portal NumPy engine"""
+    deals_by_owner = get_recent_deals_grouped_by_owner(exclude_owner_emails=exclude_emails)
+    if not deals_by_owner:
+        return None
 
-if __name__ == "__main__":
-    print("🚀 Fetching deals...")
-    deals_by_owner = get_recent_deals_grouped_by_owner()
+    all_deals = [
+        deal
+        for owner_email, deals in deals_by_owner.items()
+        if owner_email not in exclude_emails
+        for deal in deals
+    ]
+    with stage(log, "📩 Engagements", deals=len(all_deals)):
+        attach_engagements(all_deals, fetch_engagements_for_deals(all_deals))
 
-    if not deals_by_owner:
-        print("⚠️ No deals found. Exiting.")
-        exit()
+    with stage(log, "🧠 Analysis", deals=len(all_deals)):
+        alert_map, metrics_by_owner = analyze_deals_columnar(all_deals)
+    return all_deals, alert_map, metrics_by_owner
 
-    print("📩 Fetching engagements...")
-    all_deals = []
-    for owner_email, deals in deals_by_owner.items():
-        if owner_email not in exclude_emails:
-            for deal in deals:
-                timestamps, last_note = fetch_engagements_for_deal(deal["id"], deal["name"])
-                deal["engagements"] = timestamps
-                deal["last_note"] = last_note
-                all_deals.append(deal)
+if __name__ == "__main__":
+    with stage(log, "🚀 Daily run", engine=ANALYSIS_ENGINE) as counts:
+        if ANALYSIS_ENGINE == "columnar":
+            run = run_columnar()
+        else:
+            # Deals stream through enrichment, engagements and analysis as their pages arrive
+            run = run_daily_pipeline(exclude_emails, state=AlertState())
+        counts["deals"] = len(run[0]) if run else 0
 
-    print(f"🧠 Analyzing {len(all_deals)} deals...")
-    alert_map, metrics_by_owner = analyze_deals(all_deals)
+    if not run:
+        log.warning("⚠️ No deals found. Exiting.")
+        exit()
+    all_deals, alert_map, metrics_by_owner = run
 
     for deal in all_deals:
         deal["alerts"] = alert_map.get(deal["id"], [])
-        deal["metrics"] = metrics_by_owner.get(deal.get("owner_email", "").lower(), {})
 
-    # 🔶 Group deals by owner email (only if alerts exist)
-    alerts_by_owner = {}
-    for deal in all_deals:
-        if not deal.get("alerts"):
-            continue
-        owner_email = deal.get("owner_email", "").lower()
-        if owner_email:
-            alerts_by_owner.setdefault(owner_email, []).append(deal)
+    # 📈 Keep today's counts so the weekly report can show trends without HubSpot calls
+    recorded = MetricHistory().record(metrics_by_owner)
+    log.info(f"📈 Recorded {recorded} metric count(s) for {len(metrics_by_owner)} owner(s)")
+
+    # 🧮 Owner / manager / org totals, computed once for every summary and digest
+    rollup = summary_rollup(metrics_by_owner)
+    all_alerted_deals = [deal for deal in all_deals if deal.get("alerts")]
+
+    # 🔶 Every report's CSV rows, rendered in one pass over the alerted deals
+    reports = DailyReports(all_alerted_deals, metrics_by_owner, rollup)
 
     # 🖨️ Debug: Email distribution list
-    print("\n📬 Will send to Deal Owners:")
-    for email, deals in alerts_by_owner.items():
-        print(f"   - {email} ({len(deals)} deal(s))")
+    for email, rows in reports.rows.by_owner.items():
+        log.debug(f"📬 Will send to {email} ({len(rows)} deal(s))")
 
-    print("\n📧 Sending Deal Owner emails to selected owners only...")
-    for email, deals in alerts_by_owner.items():
-        if email not in exclude_emails:
-            safe_send_email(email, deals, role="OWNER", metrics=metrics_by_owner.get(email.lower(), {}))
+    # 📧 Every email is queued at once; failed sends retry in the background
+    with stage(log, "📧 Emails") as counts, DispatchQueue() as mail:
+        recipients = [email for email in reports.owners() if email not in exclude_emails]
+        for email in recipients:
+            mail.submit(email, "OWNER", send_message, reports.owner_message(email))
+        counts["owners"] = len(recipients)
 
-    # 📧 Always send summary to Kuldeep
-    print("\n📧 Sending summary email.....")
-    all_alerted_deals = [deal for deal in all_deals if deal.get("alerts")]
-    safe_send_email("kuldeep.thakran@prozo.com", all_alerted_deals, role="SUMMARY", metrics=metrics_by_owner)
-    safe_send_email("ashvini.jakhar@prozo.com", all_alerted_deals, role="SUMMARY", metrics=metrics_by_owner)
-    safe_send_email("rishi.singh@prozo.com", all_alerted_deals, role="SUMMARY", metrics=metrics_by_owner)
-    safe_send_email("gourav.rathi@prozo.com", all_alerted_deals, role="SUMMARY", metrics=metrics_by_owner)
+        # 📧 Always send the summary: rendered once, one message to every SUMMARY_RECIPIENTS address
+        if all_alerted_deals and SUMMARY_RECIPIENTS:
+            mail.submit(", ".join(SUMMARY_RECIPIENTS), "SUMMARY", send_message, reports.summary_message())
+
+        if MANAGER_DIGESTS:
+            leads = [manager for manager in rollup.leads() if manager not in exclude_emails]
+            for manager in leads:
+                digest = reports.manager_message(manager)
+                if digest is not None:
+                    mail.submit(manager, "MANAGER", send_message, digest)
+            counts["managers"] = len(leads)
 
-    print("✅ Process complete. Exiting.")
+    log.info("✅ Process complete. Exiting.")
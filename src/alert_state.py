@@ -0,0 +1,90 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+from src.storage import cache_path
+
+ALERT_STATE_FILE = cache_path("alert_state.sqlite")
+
+
+def deal_fingerprint(deal, rules_signature):
+    """Hash of everything the rules read for a deal, plus the rules themselves"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(rules_signature.encode())
+    digest.update(repr((
+        deal.get("id"), deal.get("name"), deal.get("owner_email"), deal.type.value,
+        deal.assigned_ms, deal.last_activity_ms, deal.last_activity_day_ms, deal.type_history,
+    )).encode())
+    digest.update(deal.engagements.tobytes())
+    return digest.hexdigest()
+
+
+def alert_delta(previous, current):
+    """Split a deal's alerts into new / ongoing / resolved against the last run"""
+    return {
+        "new": [a for a in current if a not in previous],
+        "ongoing": [a for a in current if a in previous],
+        "resolved": [a for a in previous if a not in current],
+    }
+
+
+class AlertState:
+    """Per-deal analysis results from the last run, kept in SQLite.
+
+    Each row holds the deal's input fingerprint, the next time a rule can
+    flip on the clock alone, and the alerts, metric keys and CSV fields it
+    produced. A deal whose fingerprint is unchanged and whose trigger has
+    not passed can reuse its row instead of being re-evaluated.
+    """
+
+    def __init__(self, path=ALERT_STATE_FILE):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS alert_state (
+                    scope TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    next_trigger_ms INTEGER,
+                    alerts TEXT NOT NULL,
+                    metrics TEXT NOT NULL,
+                    fields TEXT NOT NULL,
+                    PRIMARY KEY (scope, id)
+                )""")
+
+    def load(self, scope):
+        rows = self.conn.execute(
+            "SELECT id, fingerprint, next_trigger_ms, alerts, metrics, fields FROM alert_state WHERE scope = ?",
+            (scope,)
+        )
+        return {
+            deal_id: {
+                "fingerprint": fingerprint,
+                "next_trigger_ms": next_trigger_ms,
+                "alerts": json.loads(alerts),
+                "metrics": json.loads(metrics),
+                "fields": json.loads(fields),
+            }
+            for deal_id, fingerprint, next_trigger_ms, alerts, metrics, fields in rows
+        }
+
+    def save(self, scope, updates, seen_ids):
+        """Store re-evaluated deals and forget deals that are no longer analyzed"""
+        rows = [
+            (scope, str(deal_id), s["fingerprint"], s["next_trigger_ms"],
+             json.dumps(s["alerts"]), json.dumps(s["metrics"]), json.dumps(s["fields"]))
+            for deal_id, s in updates.items()
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO alert_state (scope, id, fingerprint, next_trigger_ms, alerts, metrics, fields) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_alert_ids (id TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM seen_alert_ids")
+            self.conn.executemany("INSERT OR IGNORE INTO seen_alert_ids VALUES (?)", ((str(i),) for i in seen_ids))
+            self.conn.execute(
+                "DELETE FROM alert_state WHERE scope = ? AND id NOT IN (SELECT id FROM seen_alert_ids)", (scope,)
+            )
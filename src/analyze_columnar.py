@@ -0,0 +1,184 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from src.deal_record import DealType
+from src.deal_table import DEAL_TYPES, DealTable
+from src.log import get_logger
+
+log = get_logger("columnar")
+
+DAY_MS = 86400 * 1000
+MISSING = np.iinfo(np.int64).min
+METRIC_KEYS = [
+    "first_engagement_pending",
+    "engagement_gap_1_2",
+    "engagement_gap_2_3",
+    "no_activity_3_days",
+    "revived_cold_warm",
+    "hot_to_warm",
+    "warm_to_cold",
+    "hot_to_cold",
+]
+
+
+def epoch_column(values):
+    """Pre-parsed epoch ms (or None) -> (int64 column, valid mask)"""
+    column = np.fromiter((MISSING if v is None else v for v in values), dtype=np.int64, count=len(values))
+    return column, column != MISSING
+
+
+def deal_columns(deal_list):
+    """int64 date columns, DealType column and the flat engagement array with per-deal counts.
+
+    Rows of one fully packed DealTable are gathered straight from its
+    buffers; anything else (Deal records, mixed tables) is read deal by deal.
+    """
+    n = len(deal_list)
+    table = getattr(deal_list[0], "table", None) if n else None
+    packed = isinstance(table, DealTable) and (
+        table.engagement_offsets is None or len(table.engagement_offsets) == len(table) + 1
+    )
+    if packed and all(getattr(d, "table", None) is table for d in deal_list):
+        index = np.fromiter((d.index for d in deal_list), dtype=np.int64, count=n)
+        column = lambda buffer: np.frombuffer(buffer, dtype=np.int64)[index]
+        types = np.array(DEAL_TYPES, dtype=object)[np.frombuffer(table.type_codes, dtype=np.int8)[index]]
+        if table.engagement_offsets is None:
+            counts, eng_ms = np.zeros(n, dtype=np.int64), np.empty(0, dtype=np.int64)
+        else:
+            offsets = np.frombuffer(table.engagement_offsets, dtype=np.int64)
+            starts = offsets[index]
+            counts = offsets[index + 1] - starts
+            within = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+            eng_ms = np.frombuffer(table.engagement_ms, dtype=np.int64)[np.repeat(starts, counts) + within]
+        return (column(table.assigned_ms), column(table.last_activity_day_ms), column(table.last_activity_ms),
+                types, counts, eng_ms)
+
+    engagements = [deal.engagements for deal in deal_list]
+    return (
+        epoch_column([d.assigned_ms for d in deal_list])[0],
+        epoch_column([d.last_activity_day_ms for d in deal_list])[0],
+        epoch_column([d.last_activity_ms for d in deal_list])[0],
+        np.array([deal.type for deal in deal_list], dtype=object),
+        np.array([len(e) for e in engagements], dtype=np.int64),
+        np.concatenate([np.frombuffer(e, dtype=np.int64) for e in engagements] or [np.empty(0, np.int64)]),
+    )
+
+
+def format_minutes(ms, valid):
+    text = np.datetime_as_string(np.where(valid, ms, 0).astype("datetime64[ms]"), unit="m")
+    return np.char.replace(text, "T", " ")
+
+
+def analyze_deals_columnar(deal_list, now=None):
+    """Vectorized equivalent of src.analyze_deals.analyze_deals.
+
+    The deals' pre-parsed dates are loaded into int64 epoch-ms columns and
+    the ragged engagement lists into one flat array with per-deal offsets,
+    then every rule is evaluated as an array expression against a single
+    reference time.
+    """
+    now = now or datetime.now(timezone.utc)
+    now_ms = int(now.timestamp() * 1000)
+    n = len(deal_list)
+
+    ids = [deal.get("id") for deal in deal_list]
+    names = [deal.get("name", "N/A") for deal in deal_list]
+    owners = [deal.get("owner_email", "").lower() for deal in deal_list]
+    assigned_ms, last_day_ms, last_full_ms, types, counts, eng_ms = deal_columns(deal_list)
+    assigned_ok, last_day_ok, last_full_ok = assigned_ms != MISSING, last_day_ms != MISSING, last_full_ms != MISSING
+    hot = types == DealType.HOT
+    cold_or_warm = (types == DealType.COLD) | (types == DealType.WARM)
+
+    # Ragged engagement arrays -> one flat array plus offsets
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    eng_deal = np.repeat(np.arange(n), counts)
+
+    # Engagements on or after assignment; rank each kept one within its deal
+    kept = assigned_ok[eng_deal] & (eng_ms >= assigned_ms[eng_deal])
+    kept_cum = np.cumsum(kept)
+    start_cum = np.concatenate(([0], kept_cum))[offsets[:-1]]
+    rank = kept_cum - start_cum[eng_deal]
+    kept_count = np.bincount(eng_deal[kept], minlength=n)
+
+    nth = []
+    for k in (1, 2, 3):
+        col = np.full(n, MISSING, dtype=np.int64)
+        sel = kept & (rank == k)
+        col[eng_deal[sel]] = eng_ms[sel]
+        nth.append(col)
+    t1, t2, t3 = nth
+
+    # Rules, all against the same reference time
+    hits = {
+        "first_engagement_pending": hot & assigned_ok & (counts == 0) & (now_ms - assigned_ms > DAY_MS),
+        "engagement_gap_1_2": hot & (kept_count >= 2) & (t2 - t1 > 2 * DAY_MS),
+        "engagement_gap_2_3": hot & (kept_count >= 3) & (t3 - t2 > 2 * DAY_MS),
+        "no_activity_3_days": hot & last_day_ok & (now_ms - last_day_ms > 3 * DAY_MS),
+        "revived_cold_warm": cold_or_warm & last_day_ok & (now_ms - last_day_ms <= DAY_MS),
+    }
+
+    # Stage reversal: last two history entries, already parsed and sorted on the Deal
+    stage_change = np.full(n, "N/A", dtype=object)
+    change_from = np.full(n, None, dtype=object)
+    change_to = np.full(n, None, dtype=object)
+    paired = [i for i, deal in enumerate(deal_list) if len(deal.type_history) >= 2]
+    if paired:
+        last_ms, last_ok = epoch_column([deal_list[i].type_history[-1][0] for i in paired])
+        recent = last_ok & (now_ms - last_ms <= DAY_MS)
+        for i in np.asarray(paired)[recent]:
+            (_, prev_type), (_, last_type) = deal_list[i].type_history[-2:]
+            if prev_type is not None and last_type is not None and prev_type != last_type:
+                change_from[i], change_to[i] = prev_type, last_type
+                stage_change[i] = f"{prev_type.label} → {last_type.label}"
+    reversal = stage_change != "N/A"
+    hits["hot_to_warm"] = (change_from == DealType.HOT) & (change_to == DealType.WARM)
+    hits["warm_to_cold"] = (change_from == DealType.WARM) & (change_to == DealType.COLD)
+    hits["hot_to_cold"] = (change_from == DealType.HOT) & (change_to == DealType.COLD)
+
+    # Per-deal display fields, formatted a column at a time
+    first_fmt, second_fmt, third_fmt = (format_minutes(col, col != MISSING) for col in nth)
+    last_fr = format_minutes(last_full_ms, last_full_ok)
+    days_since = np.where(last_day_ok, (now_ms - last_day_ms) // DAY_MS, 0)
+    for i, deal in enumerate(deal_list):
+        engagement_dates = {}
+        if kept_count[i] >= 1:
+            engagement_dates["first"] = str(first_fmt[i])
+        if kept_count[i] >= 2:
+            engagement_dates["second"] = str(second_fmt[i])
+        if kept_count[i] >= 3:
+            engagement_dates["third"] = str(third_fmt[i])
+        deal["engagement_dates"] = engagement_dates
+        deal["days_since_last_activity"] = int(days_since[i]) if last_day_ok[i] else "N/A"
+        deal["last_activity_fr"] = str(last_fr[i]) if last_full_ok[i] else "N/A"
+        deal["stage_change"] = stage_change[i]
+
+    # Assemble outputs in the serial analyzer's order
+    metrics_by_owner = {}
+    for owner in owners:
+        if owner not in metrics_by_owner:
+            metrics_by_owner[owner] = {key: [0, []] for key in METRIC_KEYS}
+
+    alerts = [[] for _ in range(n)]
+    labels = [
+        ("first_engagement_pending", "First engagement pending (1+ days)"),
+        ("engagement_gap_1_2", "Delay between 1st & 2nd engagement"),
+        ("engagement_gap_2_3", "Delay between 2nd & 3rd engagement"),
+        ("no_activity_3_days", "No Activity in Last 3 Days"),
+        ("revived_cold_warm", "Revived Cold/Warm Deal"),
+    ]
+    for key, label in labels:
+        for i in np.flatnonzero(hits[key]):
+            alerts[i].append(label)
+    for i in np.flatnonzero(reversal):
+        alerts[i].append(f"Stage Reversal: {stage_change[i]}")
+
+    for key in METRIC_KEYS:
+        for i in np.flatnonzero(hits[key]):
+            metric = metrics_by_owner[owners[i]][key]
+            metric[0] += 1
+            metric[1].append(names[i])
+
+    alerts_by_deal = {ids[i]: alerts[i] for i in range(n) if alerts[i]}
+    log.info(f"🧮 Columnar analysis flagged {len(alerts_by_deal)} of {n} deals")
+    return alerts_by_deal, metrics_by_owner
@@ -1,203 +1,323 @@
-﻿from datetime import datetime, timedelta
+﻿from datetime import datetime, timezone
+
+from src.alert_state import alert_delta, deal_fingerprint
+from src.deal_record import DealType
+from src.log import get_logger, trace
+from src.rules import RuleSet
+from src.sharding import compact_rows, owner_shards, run_shards
+
+log = get_logger("daily")
+
+METRIC_KEYS = [
+    "first_engagement_pending",
+    "engagement_gap_1_2",
+    "engagement_gap_2_3",
+    "no_activity_3_days",
+    "revived_cold_warm",
+    "hot_to_warm",
+    "warm_to_cold",
+    "hot_to_cold",
+]
+METRIC_LABELS = {
+    "first_engagement_pending": "🕒 First Engagement Pending (1+ Days)",
+    "engagement_gap_1_2": "⏱️ 1st → 2nd Engagement Delay",
+    "engagement_gap_2_3": "⏱️ 2nd → 3rd Engagement Delay",
+    "no_activity_3_days": "🚫 No Activity in Last 3 Days",
+    "revived_cold_warm": "💡 Revived Cold/Warm Deals",
+    "hot_to_warm": "♻️ Stage Reversal: Hot → Warm",
+    "warm_to_cold": "♻️ Stage Reversal: Warm → Cold",
+    "hot_to_cold": "♻️ Stage Reversal: Hot → Cold",
+}
+# Filled in on every deal for the CSV export; the day count moves with the clock and is never reused
+DEAL_FIELDS = ["engagement_dates", "days_since_last_activity", "last_activity_fr", "stage_change"]
+STATE_SCOPE = "daily"
+
+DAY_MS = 86400 * 1000
+
+daily_rules = RuleSet("Daily")
+
+
+def format_ms(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+# ---- Shared inputs (dates come pre-parsed to UTC epoch ms on the Deal) ----
+
+@daily_rules.input("deal_type")
+def deal_type_input(deal, inputs):
+    return deal.type
+
+
+@daily_rules.input("engagement_ms")
+def engagement_ms_input(deal, inputs):
+    """Engagements on or after the owner assignment"""
+    if deal.assigned_ms is None:
+        return []
+    return [ts for ts in deal.engagements if ts >= deal.assigned_ms]
+
+
+@daily_rules.input("stage_change", needs=["now_ms"])
+def stage_change_input(deal, inputs):
+    """(from, to) DealTypes when the deal type changed in the last 24h, else None"""
+    deal_id = deal.get("id")
+    if len(deal.type_history) < 2:
+        return None
+    (_, prev_type), (last_ms, last_type) = deal.type_history[-2:]
+    if last_ms is None or prev_type is None or last_type is None:
+        log.warning(f"❌ Error parsing stage history for deal {deal_id}")
+        return None
+    if inputs["now_ms"] - last_ms > DAY_MS:
+        trace(deal_id, "🕒 Stage change is older than 24h")
+        return None
+    if prev_type == last_type:
+        trace(deal_id, "🔍 No real stage change (from %s to %s)", prev_type.label, last_type.label)
+        return None
+    trace(deal_id, "✅ Detected stage change: %s → %s", prev_type.label, last_type.label)
+    return prev_type, last_type
+
+
+# ---- CSV fields ----
+
+@daily_rules.input("engagement_dates", needs=["engagement_ms"])
+def engagement_dates_input(deal, inputs):
+    engagement_dates = {}
+    for label, ts in zip(["first", "second", "third"], inputs["engagement_ms"]):
+        engagement_dates[label] = format_ms(ts)
+    return engagement_dates
+
+
+@daily_rules.input("days_since_last_activity", needs=["now_ms"])
+def days_since_last_activity_input(deal, inputs):
+    if deal.last_activity_day_ms is None:
+        return "N/A"
+    return (inputs["now_ms"] - deal.last_activity_day_ms) // DAY_MS
+
+
+@daily_rules.input("last_activity_fr")
+def last_activity_fr_input(deal, inputs):
+    return format_ms(deal.last_activity_ms) if deal.last_activity_ms is not None else "N/A"
+
+
+# ---- Rules ----
+
+# X1: First engagement pending
+@daily_rules.rule("X1", needs=["deal_type", "now_ms"], metric="first_engagement_pending")
+def first_engagement_pending(inputs):
+    deal = inputs.deal
+    if inputs["deal_type"] is DealType.HOT and deal.assigned_ms is not None and not deal.engagements:
+        if inputs["now_ms"] - deal.assigned_ms > DAY_MS:
+            return "First engagement pending (1+ days)"
+
+
+# X2/X3: Engagement gaps
+@daily_rules.rule("X2", needs=["deal_type", "engagement_ms"], metric="engagement_gap_1_2")
+def engagement_gap_1_2(inputs):
+    engagement_ms = inputs["engagement_ms"] if inputs["deal_type"] is DealType.HOT else []
+    if len(engagement_ms) >= 2 and engagement_ms[1] - engagement_ms[0] > 2 * DAY_MS:
+        return "Delay between 1st & 2nd engagement"
+
+
+@daily_rules.rule("X3", needs=["deal_type", "engagement_ms"], metric="engagement_gap_2_3")
+def engagement_gap_2_3(inputs):
+    engagement_ms = inputs["engagement_ms"] if inputs["deal_type"] is DealType.HOT else []
+    if len(engagement_ms) >= 3 and engagement_ms[2] - engagement_ms[1] > 2 * DAY_MS:
+        return "Delay between 2nd & 3rd engagement"
+
+
+# X4: Inactive hot deals
+@daily_rules.rule("X4", needs=["deal_type", "now_ms"], metric="no_activity_3_days")
+def no_activity_3_days(inputs):
+    last_day_ms = inputs.deal.last_activity_day_ms
+    if inputs["deal_type"] is DealType.HOT and last_day_ms is not None:
+        if inputs["now_ms"] - last_day_ms > 3 * DAY_MS:
+            return "No Activity in Last 3 Days"
+
+
+# X5: Revived cold/warm
+@daily_rules.rule("X5", needs=["deal_type", "now_ms"], metric="revived_cold_warm")
+def revived_cold_warm(inputs):
+    last_day_ms = inputs.deal.last_activity_day_ms
+    if inputs["deal_type"] in (DealType.COLD, DealType.WARM) and last_day_ms is not None:
+        if inputs["now_ms"] - last_day_ms <= DAY_MS:
+            return "Revived Cold/Warm Deal"
+
+
+# X6–X8: Stage reversal detection (any change alerts; three of them are counted)
+@daily_rules.rule("stage_reversal", needs=["stage_change"])
+def stage_reversal(inputs):
+    if inputs["stage_change"]:
+        return "Stage Reversal: {} → {}".format(*(t.label for t in inputs["stage_change"]))
 
-def analyze_deals(deal_list):
-    alerts_by_deal = {}
-    metrics_by_owner = {}
+
+@daily_rules.rule("X6", needs=["stage_change"], metric="hot_to_warm")
+def hot_to_warm(inputs):
+    return inputs["stage_change"] == (DealType.HOT, DealType.WARM)
+
+
+@daily_rules.rule("X7", needs=["stage_change"], metric="warm_to_cold")
+def warm_to_cold(inputs):
+    return inputs["stage_change"] == (DealType.WARM, DealType.COLD)
+
+
+@daily_rules.rule("X8", needs=["stage_change"], metric="hot_to_cold")
+def hot_to_cold(inputs):
+    return inputs["stage_change"] == (DealType.HOT, DealType.COLD)
+
+
+# ---- Clock thresholds (when a rule can flip with no new data) ----
+
+@daily_rules.trigger("X1")
+def first_engagement_trigger(inputs):
+    assigned_ms = inputs.deal.assigned_ms
+    return assigned_ms + DAY_MS + 1 if assigned_ms is not None else None
+
+
+@daily_rules.trigger("X4")
+def no_activity_trigger(inputs):
+    last_day_ms = inputs.deal.last_activity_day_ms
+    return last_day_ms + 3 * DAY_MS + 1 if last_day_ms is not None else None
+
+
+@daily_rules.trigger("X5")
+def revived_trigger(inputs):
+    last_day_ms = inputs.deal.last_activity_day_ms
+    return last_day_ms + DAY_MS + 1 if last_day_ms is not None else None
+
+
+@daily_rules.trigger("stage_reversal")
+@daily_rules.trigger("X6")
+@daily_rules.trigger("X7")
+@daily_rules.trigger("X8")
+def stage_change_trigger(inputs):
+    """The 24h window of the latest type change"""
+    if not inputs.deal.type_history:
+        return None
+    last_ms = inputs.deal.type_history[-1][0]
+    return last_ms + DAY_MS + 1 if last_ms is not None else None
+
+
+def analyze_shard(deal_list, now, active, previous, has_history):
+    """Analyze one shard of deals in this process.
+
+    previous is the stored AlertState rows for these deals (None without a
+    state). Returns plain data for the caller to merge: alerts and metric
+    keys per deal id, the deal fields to set, the state updates, the
+    reuse count and the plan's counters.
+    """
+    plan = daily_rules.compile(active=active, outputs=DEAL_FIELDS, context=["now_ms"])
+    context = {"now_ms": int(now.timestamp() * 1000)}
+    signature = plan.signature()
+    results, updates, reused = {}, {}, 0
 
     for deal in deal_list:
-        deal_id = deal.get("id")
-        deal_name = deal.get("name", "N/A")
-        owner_email = deal.get("owner_email", "").lower()
-        raw_type = deal.get("deal_type", "").lower()
-
-        # Normalize deal type
-        if raw_type == "true":
-            deal_type = "hot"
-        elif raw_type == "false":
-            deal_type = "warm"
-        elif raw_type == "cold":
-            deal_type = "cold"
+        deal_id = str(deal.get("id"))
+        prior = previous.get(deal_id) if previous is not None else None
+        fingerprint = deal_fingerprint(deal, signature) if previous is not None else None
+        if (prior and prior["fingerprint"] == fingerprint
+                and (prior["next_trigger_ms"] is None or prior["next_trigger_ms"] > context["now_ms"])):
+            alerts, hit_metrics, fields = prior["alerts"], prior["metrics"], dict(prior["fields"])
+            fields["days_since_last_activity"] = days_since_last_activity_input(deal, context)
+            reused += 1
         else:
-            deal_type = "unknown"
-
-        last_activity_str = deal.get("last_activity")
-        owner_assigned_str = deal.get("owner_assignment_date")
-        engagements = deal.get("engagements", [])
-        deal_type_history = deal.get("deal_type_history", [])
-
-        alerts = []
-        metrics = metrics_by_owner.setdefault(owner_email, {
-            "first_engagement_pending": [0,[]],
-            "engagement_gap_1_2": [0,[]],
-            "engagement_gap_2_3": [0,[]],
-            "no_activity_3_days": [0,[]],
-            "revived_cold_warm": [0,[]],
-            "hot_to_warm": [0,[]],
-            "warm_to_cold": [0,[]],
-            "hot_to_cold": [0,[]],
-        })
-                
-        
-        # Convert assignment date (if present)
-        assigned_dt = None
-        if owner_assigned_str and owner_assigned_str != "N/A":
-            try:
-                assigned_dt = datetime.strptime(owner_assigned_str[:19], "%Y-%m-%dT%H:%M:%S")
-            except Exception as e:
-                print(f"❌ Error parsing owner assignment date: {e}")
-
-        # Filter engagements AFTER assignment date
-        engagement_ts = []
-        if assigned_dt:
-            for ts in engagements:
-                try:
-                    ts_dt = datetime.fromtimestamp(ts / 1000)
-                    if ts_dt >= assigned_dt:
-                        engagement_ts.append(ts_dt)
-                except Exception as e:
-                    print(f"❌ Error parsing engagement timestamp: {e}")
-
-
-
-        # Save for CSV export
-        engagement_dates = {}
-        if len(engagement_ts) >= 1:
-            engagement_dates["first"] = engagement_ts[0].strftime("%Y-%m-%d %H:%M")
-        if len(engagement_ts) >= 2:
-            engagement_dates["second"] = engagement_ts[1].strftime("%Y-%m-%d %H:%M")
-        if len(engagement_ts) >= 3:
-            engagement_dates["third"] = engagement_ts[2].strftime("%Y-%m-%d %H:%M")
-        deal["engagement_dates"] = engagement_dates
-
-
-        days_since_last_activity = ""
-        if last_activity_str and last_activity_str != "N/A":
-            try:
-                 last_dt = datetime.strptime(last_activity_str[:10], "%Y-%m-%d")
-                 days_since_last_activity = (datetime.utcnow() - last_dt).days
-            except Exception as e:
-                 print(f"❌ Error calculating days since last activity: {e}")
-                 days_since_last_activity = "N/A"
+            alerts, hit_metrics, inputs = plan.evaluate(deal, context)
+            change = inputs["stage_change"]
+            fields = {
+                "engagement_dates": inputs["engagement_dates"],
+                "last_activity_fr": inputs["last_activity_fr"],
+                "stage_change": "{} → {}".format(*(t.label for t in change)) if change else "N/A",
+            }
+            if previous is not None:
+                updates[deal_id] = {
+                    "fingerprint": fingerprint,
+                    "next_trigger_ms": plan.next_trigger(inputs, context["now_ms"]),
+                    "alerts": alerts,
+                    "metrics": hit_metrics,
+                    "fields": dict(fields),
+                }
+            fields["days_since_last_activity"] = inputs["days_since_last_activity"]
+        if has_history:
+            fields["alert_delta"] = alert_delta(prior["alerts"] if prior else [], alerts)
+        results[deal_id] = (alerts, hit_metrics, fields)
 
-        else:
-            days_since_last_activity = "N/A"
-
-        deal["days_since_last_activity"] = days_since_last_activity
-
-        try:
-            raw_last = deal.get("last_activity")
-            if raw_last and raw_last != "N/A":
-                dt = datetime.strptime(raw_last[:19], "%Y-%m-%dT%H:%M:%S")
-                deal["last_activity_fr"] = dt.strftime("%Y-%m-%d %H:%M")
-            else:
-                deal["last_activity_fr"] = "N/A"
-        except Exception as e:
-            print(f"❌ Error formatting last activity: {e}")
-            deal["last_activity_fr"] = "N/A"
-
-        # X1: First engagement pending
-        if deal_type == "hot" and owner_assigned_str and owner_assigned_str != "N/A":
-            try:
-                assigned = datetime.strptime(owner_assigned_str[:19], "%Y-%m-%dT%H:%M:%S")
-                if not engagements and datetime.utcnow() - assigned > timedelta(days=1):
-                    alerts.append("First engagement pending (1+ days)")
-                    metrics["first_engagement_pending"][0] += 1
-                    metrics["first_engagement_pending"][1].append(deal_name)
-            except Exception as e:
-                print(f"❌ Error parsing owner assignment date: {e}")
-
-        # X2/X3: Engagement gaps
-        if deal_type == "hot":
-            try:
-                if len(engagement_ts) >= 2:
-                    t1 = engagement_ts[0]
-                    t2 = engagement_ts[1]
-                    gap1 = (t2 - t1).total_seconds() / 86400
-                    if gap1 > 2:
-                         alerts.append("Delay between 1st & 2nd engagement")
-                         metrics["engagement_gap_1_2"][0] += 1
-                         metrics["engagement_gap_1_2"][1].append(deal_name)
-
-                if len(engagement_ts) >= 3:
-                    t3 = engagement_ts[2]
-                    t2 = engagement_ts[1]
-                    gap2 = (t3 - t2).total_seconds() / 86400  # t2 is still valid here
-                    if gap2 > 2:
-                       alerts.append("Delay between 2nd & 3rd engagement")
-                       metrics["engagement_gap_2_3"][0] += 1
-                       metrics["engagement_gap_2_3"][1].append(deal_name)
-            except Exception as e:
-                print(f"❌ Error computing engagement gaps for deal {deal.get('id', 'unknown')}: {e}")
-
-        # X4: Inactive hot deals
-        if deal_type == "hot" and last_activity_str and last_activity_str != "N/A":
-            try:
-                last_dt = datetime.strptime(last_activity_str[:10], "%Y-%m-%d")
-                if datetime.utcnow() - last_dt > timedelta(days=3):
-                    alerts.append("No Activity in Last 3 Days")
-                    metrics["no_activity_3_days"][0] += 1
-                    metrics["no_activity_3_days"][1].append(deal_name)
-            except Exception as e:
-                print(f"❌ Error parsing last activity date: {e}")
-
-        # X5: Revived cold/warm
-        if deal_type in ["cold", "warm"] and last_activity_str and last_activity_str != "N/A":
-            try:
-                last_dt = datetime.strptime(last_activity_str[:10], "%Y-%m-%d")
-                if datetime.utcnow() - last_dt <= timedelta(days=1):
-                    alerts.append("Revived Cold/Warm Deal")
-                    metrics["revived_cold_warm"][0] += 1
-                    metrics["revived_cold_warm"][1].append(deal_name)
-            except Exception as e:
-                print(f"❌ Error parsing revival activity: {e}")
-
-        # X6–X8: Stage reversal detection
-        deal["stage_change"] = "N/A"
-        if isinstance(deal_type_history, list) and len(deal_type_history) >= 2:
-            try:
-                valid_entries = [entry for entry in deal_type_history if isinstance(entry, dict) and "timestamp" in entry and "value" in entry]
-                if len(valid_entries) >= 2:
-                    sorted_history = sorted(valid_entries, key=lambda x: x["timestamp"])
-                    last = sorted_history[-1]
-                    prev = sorted_history[-2]
-
-                    last_time = datetime.fromisoformat(last["timestamp"].replace("Z", "+00:00"))
-                    now = datetime.utcnow().replace(tzinfo=last_time.tzinfo)
-
-                    if now - last_time <= timedelta(hours=24):
-                        def normalize(val):
-                            if val == "true": return "hot"
-                            if val == "false": return "warm"
-                            if val == "cold": return "cold"
-                            return "unknown"
-
-                        from_val = normalize(prev["value"].lower())
-                        to_val = normalize(last["value"].lower())
-
-                        if from_val != to_val:
-                            change = f"{from_val} → {to_val}"
-                            alerts.append(f"Stage Reversal: {change}")
-                            deal["stage_change"] = change
-
-                            if from_val == "hot" and to_val == "warm":
-                                metrics["hot_to_warm"][0] += 1
-                                metrics["hot_to_warm"][1].append(deal_name)
-                            elif from_val == "warm" and to_val == "cold":
-                                metrics["warm_to_cold"][0] += 1
-                                metrics["warm_to_cold"][1].append(deal_name)
-                            elif from_val == "hot" and to_val == "cold":
-                                metrics["hot_to_cold"][0] += 1
-                                metrics["hot_to_cold"][1].append(deal_name)
-
-                            print(f"✅ Detected stage change for deal {deal_id}: {change}")
-                        else:
-                            print(f"🔍 No real stage change for deal {deal_id} (from {from_val} to {to_val})")
-                    else:
-                        print(f"🕒 Stage change is older than 24h for deal {deal_id}")
-            except Exception as e:
-                print(f"❌ Error parsing stage history: {e}")
+    return results, updates, reused, plan.stats()
+
+
+def analyze_deals(deal_list, now=None, active=None, state=None, workers=None):
+    """Alerts per deal id and [count, deal names] per owner and metric, for Deal records.
+
+    With an AlertState, deals whose inputs are unchanged since the last run
+    and whose next clock threshold has not passed reuse their stored
+    results, and every deal gets an "alert_delta" of new / ongoing /
+    resolved alerts. Large runs are split by owner across processes
+    (ANALYSIS_WORKERS); the merged result is the same as a serial run.
+    """
+    now = now or datetime.now(timezone.utc)
+    previous = load_previous(state)
+    has_history = bool(previous)
+
+    by_owner = {}
+    for deal in deal_list:
+        by_owner.setdefault(deal.get("owner_email", "").lower(), []).append(deal)
+    shards = owner_shards([(owner, len(deals)) for owner, deals in by_owner.items()], workers)
+    if len(shards) == 1:
+        payloads = [(deal_list, now, active, previous, has_history)]
+    else:
+        payloads = []
+        for owners in shards:
+            deals = [deal for owner in owners for deal in by_owner[owner]]
+            prior = {str(d.get("id")): previous[str(d.get("id"))] for d in deals
+                     if str(d.get("id")) in previous} if previous is not None else None
+            payloads.append((compact_rows(deals), now, active, prior, has_history))
+        log.info(f"🧵 Analyzing {len(deal_list)} deals in {len(shards)} processes")
+    return merge_shard_results(deal_list, run_shards(analyze_shard, payloads), active, state, previous)
+
+
+def load_previous(state):
+    """Stored per-deal rows for analyze_shard (None without a state)"""
+    return state.load(STATE_SCOPE) if state else None
 
+
+def merge_shard_results(deal_list, shard_results, active=None, state=None, previous=None):
+    """Combine analyze_shard results into (alerts_by_deal, metrics_by_owner).
+
+    Merges in the caller's deal order so the output matches a serial run
+    exactly, sets each deal's CSV fields and saves the alert state.
+    """
+    has_history = bool(previous)
+    plan = daily_rules.compile(active=active, outputs=DEAL_FIELDS, context=["now_ms"])
+    results, updates, reused = {}, {}, 0
+    for shard_result, shard_updates, shard_reused, stats in shard_results:
+        results.update(shard_result)
+        updates.update(shard_updates)
+        reused += shard_reused
+        plan.add_stats(stats)
+
+    alerts_by_deal = {}
+    metrics_by_owner = {}
+    delta_counts = {"new": 0, "ongoing": 0, "resolved": 0}
+    for deal in deal_list:
+        deal_id = deal.get("id")
+        owner_email = deal.get("owner_email", "").lower()
+        metrics = metrics_by_owner.setdefault(owner_email, {key: [0, []] for key in METRIC_KEYS})
+        alerts, hit_metrics, fields = results[str(deal_id)]
+        for key in hit_metrics:
+            metrics[key][0] += 1
+            metrics[key][1].append(deal.get("name", "N/A"))
+        for field, value in fields.items():
+            deal[field] = value
+        if has_history:
+            for key in delta_counts:
+                delta_counts[key] += len(fields["alert_delta"][key])
         if alerts:
             alerts_by_deal[deal_id] = alerts
 
+    plan.report()
+    if state:
+        seen_ids = [str(deal.get("id")) for deal in deal_list]
+        gone = set(previous) - set(seen_ids)
+        delta_counts["resolved"] += sum(len(previous[deal_id]["alerts"]) for deal_id in gone)
+        state.save(STATE_SCOPE, updates, seen_ids)
+        log.info(f"♻️ Re-evaluated {len(deal_list) - reused} deal(s), reused {reused} unchanged")
+        if has_history:
+            log.info(f"🔔 Alerts: {delta_counts['new']} new, {delta_counts['ongoing']} ongoing, {delta_counts['resolved']} resolved")
     return alerts_by_deal, metrics_by_owner
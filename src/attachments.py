@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+import os
+import zipfile
+
+from src.log import get_logger
+
+# "zip" or "gzip" compresses report attachments above REPORT_COMPRESS_ABOVE; "none" never compresses
+REPORT_COMPRESSION = os.getenv("REPORT_COMPRESSION", "zip").lower()
+# CSV size in bytes above which the attachment is compressed
+REPORT_COMPRESS_ABOVE = int(os.getenv("REPORT_COMPRESS_ABOVE", str(2 * 1024 * 1024)))
+
+log = get_logger("attachments")
+
+
+class Attachment:
+    def __init__(self, filename, data, maintype="application", subtype="octet-stream"):
+        self.filename = filename
+        self.data = data
+        self.maintype = maintype
+        self.subtype = subtype
+
+
+class CsvReport:
+    """A CSV attachment written straight into memory as UTF-8.
+
+    Rows are encoded as they are written, so there is no temp file and no
+    second copy of the report as one big string. attachment() finishes it
+    and compresses it when it is over the size threshold.
+    """
+
+    def __init__(self, filename, **fmtparams):
+        self.filename = filename
+        self.buffer = io.BytesIO()
+        self.stream = io.TextIOWrapper(self.buffer, encoding="utf-8", newline="")
+        self.writer = csv.writer(self.stream, **fmtparams)
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def writerows(self, rows):
+        self.writer.writerows(rows)
+
+    def attachment(self, compression=None, above=None):
+        self.stream.flush()
+        # Detached, so the wrapper being collected does not close the buffer
+        self.stream.detach()
+        return pack(self.filename, self.buffer.getvalue(), compression, above)
+
+
+def pack(filename, data, compression=None, above=None):
+    """data as an Attachment, gzipped or zipped if it is larger than `above` bytes"""
+    compression = REPORT_COMPRESSION if compression is None else compression
+    above = REPORT_COMPRESS_ABOVE if above is None else above
+    if compression not in ("zip", "gzip") or len(data) <= above:
+        return Attachment(filename, data)
+
+    if compression == "gzip":
+        packed = Attachment(f"{filename}.gz", gzip.compress(data, mtime=0), subtype="gzip")
+    else:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(filename, data)
+        packed = Attachment(f"{os.path.splitext(filename)[0]}.zip", buffer.getvalue(), subtype="zip")
+    log.debug(f"🗜️ {filename}: {len(data)} -> {len(packed.data)} bytes as {packed.filename}")
+    return packed
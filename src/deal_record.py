@@ -0,0 +1,151 @@
+from array import array
+from datetime import datetime, timezone
+from enum import Enum
+
+from src.log import get_logger
+
+log = get_logger("deal_record")
+
+
+class DealType(Enum):
+    HOT = "hot"
+    WARM = "warm"
+    COLD = "cold"
+    UNKNOWN = "unknown"
+
+    @classmethod
+    def from_raw(cls, value):
+        """HubSpot deal_type__hot__warm___cold_ value ("true"/"false"/"cold") -> DealType"""
+        if not isinstance(value, str):
+            return cls.UNKNOWN
+        return RAW_DEAL_TYPES.get(value.strip().lower(), cls.UNKNOWN)
+
+    @property
+    def label(self):
+        return self.value
+
+    @property
+    def display(self):
+        return DEAL_TYPE_MARKERS.get(self, "") + self.value
+
+
+RAW_DEAL_TYPES = {"true": DealType.HOT, "false": DealType.WARM, "cold": DealType.COLD}
+DEAL_TYPE_MARKERS = {DealType.HOT: "🔴 ", DealType.WARM: "🔵 ", DealType.COLD: "🟢 "}
+
+
+def parse_epoch_ms(value, length, fmt):
+    """Leading `length` chars of a date string, read as UTC -> epoch ms, or None"""
+    if not value or value == "N/A":
+        return None
+    dt = datetime.strptime(value[:length], fmt).replace(tzinfo=timezone.utc)
+    return int(dt.timestamp()) * 1000
+
+
+def parse_iso_ms(value):
+    """ISO timestamp (Z, offset or naive UTC) -> epoch ms"""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+class Deal:
+    """One fetched deal, parsed once.
+
+    Raw HubSpot strings stay available under their usual keys (deal["name"],
+    deal.get("last_activity")) for the CSV exports; the parsed values are
+    attributes: `type` (DealType), `modified_ms`, `assigned_ms`, `last_activity_ms` /
+    `last_activity_day_ms` (UTC epoch ms or None), `type_history` (sorted
+    (timestamp_ms, DealType) pairs) and `engagements`, a sorted array of
+    epoch ms.
+    """
+
+    FIELDS = (
+        "id", "name", "owner_id", "owner_email", "last_modified", "last_activity",
+        "deal_type", "owner_assignment_date", "deal_source", "deal_type_history", "deal_stage",
+        "amount", "num_associated_contacts", "associated_contacts",
+        # Filled in by later stages
+        "last_note", "engagement_dates", "days_since_last_activity", "last_activity_fr",
+        "stage_change", "alerts", "alert_delta",
+    )
+    __slots__ = FIELDS + (
+        "type", "modified_ms", "assigned_ms", "last_activity_ms", "last_activity_day_ms", "type_history", "_engagements",
+    )
+    KEYS = frozenset(FIELDS + ("engagements",))
+
+    def __init__(self, **fields):
+        self._engagements = array("q")
+        for key, value in fields.items():
+            self[key] = value
+        self.type = DealType.from_raw(self.get("deal_type"))
+        self.modified_ms = self._parse_iso("last_modified")
+        self.assigned_ms = self._parse_date("owner_assignment_date", 19, "%Y-%m-%dT%H:%M:%S")
+        self.last_activity_ms = self._parse_date("last_activity", 19, "%Y-%m-%dT%H:%M:%S")
+        self.last_activity_day_ms = self._parse_date("last_activity", 10, "%Y-%m-%d")
+        self.type_history = self._parse_history(self.get("deal_type_history"))
+
+    def _parse_date(self, key, length, fmt):
+        try:
+            return parse_epoch_ms(self.get(key), length, fmt)
+        except (TypeError, ValueError) as e:
+            log.warning(f"❌ Error parsing {key} for deal {self.get('id')}: {e}")
+            return None
+
+    def _parse_iso(self, key):
+        value = self.get(key)
+        if not value or value == "N/A":
+            return None
+        try:
+            return parse_iso_ms(value)
+        except (AttributeError, TypeError, ValueError) as e:
+            log.warning(f"❌ Error parsing {key} for deal {self.get('id')}: {e}")
+            return None
+
+    def _parse_history(self, history):
+        """Entries sorted by their raw timestamp, as HubSpot returns them; unparseable parts are None"""
+        if not isinstance(history, list):
+            return ()
+        entries = [e for e in history if isinstance(e, dict) and "timestamp" in e and "value" in e]
+        parsed = []
+        for entry in sorted(entries, key=lambda e: e["timestamp"]):
+            try:
+                ts = parse_iso_ms(entry["timestamp"])
+            except (AttributeError, TypeError, ValueError):
+                ts = None
+            value = DealType.from_raw(entry["value"]) if isinstance(entry["value"], str) else None
+            parsed.append((ts, value))
+        return tuple(parsed)
+
+    @property
+    def engagements(self):
+        return self._engagements
+
+    @engagements.setter
+    def engagements(self, timestamps):
+        self._engagements = array("q", sorted(int(ts) for ts in timestamps))
+
+    # Dict-style access so exports and prints keep working on the raw keys
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.KEYS and hasattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"Deal(id={self.get('id')!r}, name={self.get('name')!r}, type={self.type.label})"
@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.hubspot import parse_hubspot_ms
+from src.log import get_logger
+from src.storage import cache_path
+
+log = get_logger("store")
+
+DEAL_STORE_FILE = cache_path("deals.sqlite")
+# A full download runs at least this often so deleted/merged deals drop out
+RECONCILE_DAYS = float(os.getenv("DEAL_STORE_RECONCILE_DAYS", "7"))
+# Re-read a few minutes behind the watermark to cover search-index lag
+WATERMARK_OVERLAP_MS = 10 * 60 * 1000
+
+
+class DealStore:
+    """SQLite copy of HubSpot deals, kept current with delta syncs.
+
+    Records are stored per scope ("daily_marketing", "weekly_all", ...) so
+    each job keeps its own watermark and reconcile schedule.
+    """
+
+    def __init__(self, path=DEAL_STORE_FILE):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS deals (
+                    scope TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    modified_ms INTEGER,
+                    record TEXT NOT NULL,
+                    PRIMARY KEY (scope, id)
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    scope TEXT PRIMARY KEY,
+                    watermark_ms INTEGER,
+                    last_full_sync REAL
+                )""")
+
+    def delta_since(self, scope):
+        """Watermark to sync from, or None when a full reconcile is due"""
+        row = self.conn.execute(
+            "SELECT watermark_ms, last_full_sync FROM sync_state WHERE scope = ?", (scope,)
+        ).fetchone()
+        if not row or row[0] is None:
+            return None
+        if time.time() - (row[1] or 0) > RECONCILE_DAYS * 86400:
+            return None
+        return row[0]
+
+    def upsert(self, scope, records):
+        rows = [
+            (scope, str(r["id"]), parse_hubspot_ms(r.get("properties", {}).get("hs_lastmodifieddate")), json.dumps(r))
+            for r in records
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO deals (scope, id, modified_ms, record) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def delete(self, scope, ids):
+        """Drop deals a delta saw leave the scope"""
+        with self.lock, self.conn:
+            removed = self.conn.execute(
+                f"DELETE FROM deals WHERE scope = ? AND id IN ({','.join('?' * len(ids))})", (scope, *map(str, ids))
+            ).rowcount if ids else 0
+        if removed:
+            log.info(f"🧹 Removed {removed} deal(s) that left {scope}")
+
+    def finish_sync(self, scope, started_ms, full, seen_ids=None):
+        """Advance the watermark; a full sync also drops deals HubSpot no longer returns"""
+        with self.lock, self.conn:
+            if full:
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_ids (id TEXT PRIMARY KEY)")
+                self.conn.execute("DELETE FROM seen_ids")
+                self.conn.executemany("INSERT OR IGNORE INTO seen_ids VALUES (?)", ((str(i),) for i in seen_ids or ()))
+                removed = self.conn.execute(
+                    "DELETE FROM deals WHERE scope = ? AND id NOT IN (SELECT id FROM seen_ids)", (scope,)
+                ).rowcount
+                if removed:
+                    log.info(f"🧹 Reconcile removed {removed} deal(s) no longer in HubSpot ({scope})")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (scope, watermark_ms, last_full_sync) VALUES (?, ?, ?)",
+                    (scope, started_ms - WATERMARK_OVERLAP_MS, time.time())
+                )
+            else:
+                self.conn.execute(
+                    "UPDATE sync_state SET watermark_ms = ? WHERE scope = ?",
+                    (started_ms - WATERMARK_OVERLAP_MS, scope)
+                )
+
+    def ids(self, scope):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id FROM deals WHERE scope = ? ORDER BY CAST(id AS INTEGER)", (scope,)
+            ).fetchall()
+        return [deal_id for (deal_id,) in rows]
+
+    def records(self, scope, ids):
+        """Stored records for the given ids, in id order; the read is finished before it returns"""
+        placeholders = ",".join("?" * len(ids))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT record FROM deals WHERE scope = ? AND id IN ({placeholders}) ORDER BY CAST(id AS INTEGER)",
+                (scope, *map(str, ids))
+            ).fetchall()
+        return [json.loads(record) for (record,) in rows]
+
+    def iter_records(self, scope):
+        """Stored records one at a time, so callers never hold the whole portal as dicts"""
+        rows = self.conn.execute(
+            "SELECT record FROM deals WHERE scope = ? ORDER BY CAST(id AS INTEGER)", (scope,)
+        )
+        for (record,) in rows:
+            yield json.loads(record)
+
+    def load(self, scope):
+        return list(self.iter_records(scope))
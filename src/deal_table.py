@@ -0,0 +1,273 @@
+from array import array
+from datetime import datetime, timezone
+
+from src.deal_record import DealType
+
+MISSING = -2 ** 63
+DEAL_TYPES = list(DealType)
+TYPE_CODES = {deal_type: code for code, deal_type in enumerate(DEAL_TYPES)}
+CONTACT_KEYS = ("firstname", "lastname", "email", "jobtitle")
+
+
+class StringPool:
+    """Each distinct string stored once; columns hold its int code"""
+
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def copy(self):
+        pool = StringPool()
+        pool.codes, pool.strings = dict(self.codes), list(self.strings)
+        return pool
+
+
+def ms_or_missing(value):
+    return MISSING if value is None else value
+
+
+def ms_or_none(value):
+    return None if value == MISSING else value
+
+
+def iso_from_ms(ms, default="N/A"):
+    if ms == MISSING:
+        return default
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class DealTable:
+    """Column store for a run's deals.
+
+    Ids, dates, counts and type codes live in array buffers; repeated strings
+    (owner emails, owner ids, stages, sources, raw deal types, amounts) are
+    interned through one StringPool. Ragged data (type history, contacts,
+    engagements) is one flat array per table plus per-deal offsets. Stages
+    address deals through DealRow views, which read like the Deal records
+    they were built from.
+    """
+
+    POOLED = ("owner_id", "owner_email", "deal_type", "deal_source", "deal_stage", "amount")
+    ROW_COLUMNS = ("type_codes", "num_contacts", "modified_ms", "assigned_ms", "last_activity_ms", "last_activity_day_ms")
+
+    def __init__(self):
+        self.strings = StringPool()
+        self.ids = array("q")
+        self.names = []
+        self.pooled = {key: array("i") for key in self.POOLED}
+        self.type_codes = array("b")
+        self.num_contacts = array("i")
+        self.modified_ms = array("q")
+        self.assigned_ms = array("q")
+        self.last_activity_ms = array("q")
+        self.last_activity_day_ms = array("q")
+        self.history_ms = array("q")
+        self.history_types = array("b")
+        self.history_offsets = array("q", [0])
+        self.contacts = []
+        self.contact_codes = {}
+        self.contact_refs = array("i")
+        self.contact_offsets = array("q", [0])
+        self.engagement_ms = array("q")
+        self.engagement_offsets = None
+        # Per-deal results of later stages (notes, alerts, CSV fields), filled on demand
+        self.results = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, deal, contacts=()):
+        """Copy a parsed Deal into the columns and return its row view"""
+        index = len(self.ids)
+        self.ids.append(int(deal["id"]))
+        self.names.append(deal.get("name"))
+        for key in self.POOLED:
+            value = deal.get(key)
+            self.pooled[key].append(-1 if value is None else self.strings.code(str(value)))
+        self.type_codes.append(TYPE_CODES[deal.type])
+        self.num_contacts.append(int(deal.get("num_associated_contacts") or 0))
+        self.modified_ms.append(ms_or_missing(deal.modified_ms))
+        self.assigned_ms.append(ms_or_missing(deal.assigned_ms))
+        self.last_activity_ms.append(ms_or_missing(deal.last_activity_ms))
+        self.last_activity_day_ms.append(ms_or_missing(deal.last_activity_day_ms))
+        for ts, deal_type in deal.type_history:
+            self.history_ms.append(ms_or_missing(ts))
+            self.history_types.append(-1 if deal_type is None else TYPE_CODES[deal_type])
+        self.history_offsets.append(len(self.history_ms))
+        for contact in contacts:
+            self.contact_refs.append(self._contact_code(tuple(contact.get(k) for k in CONTACT_KEYS)))
+        self.contact_offsets.append(len(self.contact_refs))
+        return DealRow(self, index)
+
+    def _contact_code(self, contact):
+        code = self.contact_codes.get(contact)
+        if code is None:
+            code = self.contact_codes[contact] = len(self.contacts)
+            self.contacts.append(contact)
+        return code
+
+    def take(self, indices):
+        """New table holding only the given rows (stored columns only, not results)"""
+        part = DealTable()
+        part.strings = self.strings
+        part.ids = array("q", (self.ids[i] for i in indices))
+        part.names = [self.names[i] for i in indices]
+        for key, column in self.pooled.items():
+            part.pooled[key] = array("i", (column[i] for i in indices))
+        for name in self.ROW_COLUMNS:
+            column = getattr(self, name)
+            setattr(part, name, array(column.typecode, (column[i] for i in indices)))
+        if self.engagement_offsets is not None:
+            part.engagement_offsets = array("q", [0])
+        for i in indices:
+            start, end = self.history_offsets[i], self.history_offsets[i + 1]
+            part.history_ms.extend(self.history_ms[start:end])
+            part.history_types.extend(self.history_types[start:end])
+            part.history_offsets.append(len(part.history_ms))
+            start, end = self.contact_offsets[i], self.contact_offsets[i + 1]
+            for code in self.contact_refs[start:end]:
+                part.contact_refs.append(part._contact_code(self.contacts[code]))
+            part.contact_offsets.append(len(part.contact_refs))
+            if self.engagement_offsets is not None:
+                part.engagement_ms.extend(self.engagement_ms[self.engagement_offsets[i]:self.engagement_offsets[i + 1]])
+                part.engagement_offsets.append(len(part.engagement_ms))
+        return part
+
+    def rows(self):
+        return [DealRow(self, i) for i in range(len(self.ids))]
+
+    def attach_engagements(self, results):
+        """Pack {deal_id: (timestamps, last_note)} into the flat engagement column"""
+        self.engagement_ms, self.engagement_offsets = array("q"), array("q", [0])
+        self.add_engagements(self.rows(), results)
+
+    def add_engagements(self, rows, results):
+        """Append engagements for the next rows in table order, as a streaming run fetches them"""
+        if self.engagement_offsets is None:
+            self.engagement_ms, self.engagement_offsets = array("q"), array("q", [0])
+        notes = self.result_column("last_note")
+        for row in rows:
+            if row.index != len(self.engagement_offsets) - 1:
+                raise ValueError(f"engagements for row {row.index} arrived out of table order")
+            timestamps, note = results.get(row["id"], ((), "N/A"))
+            self.engagement_ms.extend(sorted(timestamps))
+            self.engagement_offsets.append(len(self.engagement_ms))
+            notes[row.index] = note
+
+    def result_column(self, key):
+        """Sparse {row index: value} column for a later stage's per-deal results"""
+        return self.results.setdefault(key, {})
+
+    def nbytes(self):
+        """Approximate size of the array buffers (strings and results excluded)"""
+        buffers = [self.ids, self.type_codes, self.num_contacts, self.modified_ms, self.assigned_ms,
+                   self.last_activity_ms, self.last_activity_day_ms, self.history_ms, self.history_types,
+                   self.history_offsets, self.contact_refs, self.contact_offsets, self.engagement_ms,
+                   *self.pooled.values()]
+        return sum(b.itemsize * len(b) for b in buffers if b is not None)
+
+
+def attach_engagements(deals, results):
+    """Attach fetched engagements to every table the given rows belong to"""
+    for table in {id(deal.table): deal.table for deal in deals}.values():
+        table.attach_engagements(results)
+
+
+class DealRow:
+    """View of one DealTable row with the Deal record interface"""
+
+    __slots__ = ("table", "index")
+
+    COLUMNS = {
+        "id": lambda t, i: str(t.ids[i]),
+        "name": lambda t, i: t.names[i],
+        "num_associated_contacts": lambda t, i: t.num_contacts[i],
+        "last_modified": lambda t, i: iso_from_ms(t.modified_ms[i]),
+        "last_activity": lambda t, i: iso_from_ms(t.last_activity_ms[i]),
+        "owner_assignment_date": lambda t, i: iso_from_ms(t.assigned_ms[i]),
+        "associated_contacts": lambda t, i: [
+            dict(zip(CONTACT_KEYS, t.contacts[code]))
+            for code in t.contact_refs[t.contact_offsets[i]:t.contact_offsets[i + 1]]
+        ],
+    }
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def type(self):
+        return DEAL_TYPES[self.table.type_codes[self.index]]
+
+    @property
+    def assigned_ms(self):
+        return ms_or_none(self.table.assigned_ms[self.index])
+
+    @property
+    def last_activity_ms(self):
+        return ms_or_none(self.table.last_activity_ms[self.index])
+
+    @property
+    def last_activity_day_ms(self):
+        return ms_or_none(self.table.last_activity_day_ms[self.index])
+
+    @property
+    def type_history(self):
+        t, i = self.table, self.index
+        start, end = t.history_offsets[i], t.history_offsets[i + 1]
+        return tuple(
+            (ms_or_none(t.history_ms[j]), None if t.history_types[j] < 0 else DEAL_TYPES[t.history_types[j]])
+            for j in range(start, end)
+        )
+
+    @property
+    def engagements(self):
+        t = self.table
+        if t.engagement_offsets is None or self.index >= len(t.engagement_offsets) - 1:
+            return array("q")
+        return t.engagement_ms[t.engagement_offsets[self.index]:t.engagement_offsets[self.index + 1]]
+
+    def __getitem__(self, key):
+        t, i = self.table, self.index
+        if key in t.pooled:
+            code = t.pooled[key][i]
+            return None if code < 0 else t.strings[code]
+        if key in self.COLUMNS:
+            return self.COLUMNS[key](t, i)
+        if key == "engagements":
+            return self.engagements
+        value = t.results.get(key, {}).get(i)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.table.pooled or key in self.COLUMNS or key == "engagements":
+            raise KeyError(f"{key} is a stored column; rebuild the row to change it")
+        self.table.result_column(key)[self.index] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"DealRow(id={self['id']!r}, name={self['name']!r}, type={self.type.label})"
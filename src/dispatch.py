@@ -0,0 +1,161 @@
+import collections
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from src.log import get_logger
+
+# Sends in flight at once (messages are built by the caller before they are queued)
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "4"))
+# Sends started in any 60s window (Gmail throttles bursts from one account)
+EMAIL_PER_MINUTE = int(os.getenv("EMAIL_PER_MINUTE", "30"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "3"))
+# First retry waits about this long, doubling after each failure, with +/-50% jitter
+EMAIL_RETRY_BASE = float(os.getenv("EMAIL_RETRY_BASE", "5"))
+
+log = get_logger("dispatch")
+
+
+class SlidingWindowLimiter:
+    """At most `limit` acquisitions in any `window` seconds."""
+
+    def __init__(self, limit, window=60.0):
+        self.limit = max(limit, 1)
+        self.window = window
+        self.starts = collections.deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.starts and now - self.starts[0] >= self.window:
+                    self.starts.popleft()
+                if len(self.starts) < self.limit:
+                    self.starts.append(now)
+                    return
+                wait = self.window - (now - self.starts[0])
+            time.sleep(wait)
+
+
+class EmailJob:
+    def __init__(self, recipient, role, send, args, kwargs):
+        self.recipient = recipient
+        self.role = role
+        self.send = send
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.error = None
+        self.submitted = time.monotonic()
+        self.finished = None
+
+
+class DispatchQueue:
+    """Bounded worker pool that sends queued emails under a per-minute cap.
+
+    A failed send is rescheduled with jittered exponential backoff instead
+    of sleeping in its worker, so the other recipients keep going out while
+    it waits. Leaving the `with` block waits for every job and logs the
+    delivery report (also available as .report).
+    """
+
+    def __init__(self, workers=EMAIL_WORKERS, per_minute=EMAIL_PER_MINUTE,
+                 max_attempts=EMAIL_MAX_ATTEMPTS, retry_base=EMAIL_RETRY_BASE):
+        self.limiter = SlidingWindowLimiter(per_minute)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_base = retry_base
+        self.scheduled = []
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.outstanding = 0
+        self.closing = False
+        self.jobs = []
+        self.report = None
+        self.started = time.monotonic()
+        self.threads = [
+            threading.Thread(target=self._work, name=f"email-{i}", daemon=True) for i in range(max(workers, 1))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, recipient, role, send, /, *args, **kwargs):
+        """Queue send(*args, **kwargs) for one recipient; it should raise on failure"""
+        job = EmailJob(recipient, role, send, args, kwargs)
+        with self.cond:
+            self.jobs.append(job)
+            self.outstanding += 1
+            heapq.heappush(self.scheduled, (time.monotonic(), next(self.order), job))
+            self.cond.notify()
+        return job
+
+    def _next_job(self):
+        with self.cond:
+            while True:
+                if self.closing and not self.outstanding:
+                    return None
+                now = time.monotonic()
+                if self.scheduled and self.scheduled[0][0] <= now:
+                    return heapq.heappop(self.scheduled)[2]
+                self.cond.wait(self.scheduled[0][0] - now if self.scheduled else None)
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self.limiter.acquire()
+            job.attempts += 1
+            try:
+                job.send(*job.args, **job.kwargs)
+                job.error = None
+            except Exception as e:
+                job.error = e
+            with self.cond:
+                if job.error is not None and job.attempts < self.max_attempts:
+                    delay = self.retry_base * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5)
+                    log.warning(f"❌ Attempt {job.attempts} to {job.recipient} failed: {job.error}; retrying in {delay:.1f}s")
+                    heapq.heappush(self.scheduled, (time.monotonic() + delay, next(self.order), job))
+                else:
+                    job.finished = time.monotonic()
+                    self.outstanding -= 1
+                    if job.error is None:
+                        log.info(f"✅ Email sent to {job.recipient}", extra={"fields": {"role": job.role, "attempts": job.attempts}})
+                    else:
+                        log.error(f"❌ Giving up on {job.recipient} after {job.attempts} attempt(s): {job.error}")
+                self.cond.notify_all()
+
+    def join(self):
+        """Wait for every queued email, then build and log the delivery report"""
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.report = self.delivery_report()
+        return self.report
+
+    def delivery_report(self):
+        sent = [job for job in self.jobs if job.error is None]
+        failed = [job for job in self.jobs if job.error is not None]
+        report = {
+            "sent": [(job.recipient, job.role, job.attempts) for job in sent],
+            "failed": [(job.recipient, job.role, job.attempts, str(job.error)) for job in failed],
+            "retried": sum(1 for job in self.jobs if job.attempts > 1),
+            "seconds": round(time.monotonic() - self.started, 2),
+        }
+        log.info("📬 Delivery report", extra={"fields": {
+            "sent": len(sent), "failed": len(failed), "retried": report["retried"], "seconds": report["seconds"],
+        }})
+        for recipient, role, attempts, error in report["failed"]:
+            log.error(f"   - not delivered: {recipient} ({role}) after {attempts} attempt(s): {error}")
+        return report
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.join()
@@ -1,7 +1,5 @@
 ﻿import os
-import smtplib
 import csv
-import time
 from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -9,6 +7,14 @@ from email.mime.base import MIMEBase
 from email import encoders
 from email.utils import formataddr
 
+from src.analyze_deals import METRIC_LABELS
+from src.log import get_logger
+from src.reports import CsvLayout, HtmlTemplate, RenderedRows
+from src.rollup import Rollup
+from src.smtp_pool import smtp_pool
+
+log = get_logger("emailer")
+
 # Load env
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
@@ -16,33 +22,34 @@ exclude_emails = {
    "kuldeep.thakran@prozo.com",
    "ankit.rakhecha@prozo.com"
  }
+# Comma-separated; everyone gets the same summary message
+SUMMARY_RECIPIENTS = [
+    email.strip() for email in os.getenv(
+        "SUMMARY_RECIPIENTS",
+        "kuldeep.thakran@prozo.com,ashvini.jakhar@prozo.com,rishi.singh@prozo.com,gourav.rathi@prozo.com"
+    ).split(",") if email.strip()
+]
 
 if not EMAIL_USERNAME or not EMAIL_PASSWORD:
     raise ValueError("EMAIL_USERNAME or EMAIL_PASSWORD not set in environment variables")
 
-TMP_DIR = "/tmp" if os.name != "nt" else os.path.join(os.getcwd(), "tmp")
-os.makedirs(TMP_DIR, exist_ok=True)
-
 def sanitize(value):
     """Remove newlines and extra spaces to make CSV cleaner"""
     if value is None:
         return ""
     return str(value).replace("\n", " ").replace("\r", " ").strip()
 
-def send_email_with_csv(to_email, deals, role="OWNER", metrics=None):
+def summary_rollup(metrics_by_owner):
+    """Owner/manager/org totals for the summary and manager emails, built once per run"""
+    return Rollup(metrics_by_owner, exclude=exclude_emails)
+
+def send_email_with_csv(to_email, deals, role="OWNER", metrics=None, rollup=None):
     if not deals:
-        print(f"⚠️ No deals to send to {to_email}")
+        log.warning(f"⚠️ No deals to send to {to_email}")
         return
-
-    csv_file = generate_csv(deals, to_email, role)
-    body = build_email_body(role=role, recipient=to_email, metrics=metrics)
-    send_email_with_attachment(to_email, body, csv_file, role=role)
-
-    # Clean up the file
-    try:
-        os.remove(csv_file)
-    except Exception as e:
-        print(f"⚠️ Could not delete file {csv_file}: {e}")
+    attachment = DEAL_SHEET.sheet(report_filename(role, to_email), map(deal_row, deals))
+    body = build_email_body(role=role, recipient=to_email, metrics=metrics, rollup=rollup)
+    send_message(build_message(to_email, body, attachment, role=role))
 
 def extract_name_from_email(email):
     """Extracts and formats a first name from an email like kuldeep.thakran@prozo.com -> Kuldeep"""
@@ -52,13 +59,21 @@ def extract_name_from_email(email):
     first_name = name_part.split(".")[0].capitalize()
     return first_name
 
-def build_email_body(role="OWNER", recipient=None, metrics=None):
-    name = extract_name_from_email(recipient)
-    today_str = datetime.today().strftime("%d %b %Y")
-    metrics = metrics or {}
-
-    if role == "SUMMARY":
-        return f"""
+# Status cell per metric, shared by the owner and summary tables
+METRIC_STATUS = {
+    "first_engagement_pending": "<td style='color: red;'>⚠️ Follow-up Needed</td>",
+    "engagement_gap_1_2": "<td style='color: orange;'>⚠️ Delay</td>",
+    "engagement_gap_2_3": "<td style='color: orange;'>⚠️ Delay</td>",
+    "no_activity_3_days": "<td style='color: red;'>🔴 Inactive</td>",
+    "revived_cold_warm": "<td style='color: green;'>🟢 Active Again</td>",
+    "hot_to_warm": "<td>OK</td>",
+    "warm_to_cold": "<td>OK</td>",
+    "hot_to_cold": "<td>OK</td>",
+}
+
+SUMMARY_ROW = HtmlTemplate("<tr><td>{label}</td><td>{count}</td>{status}</tr>\n")
+
+SUMMARY_BODY = HtmlTemplate("""
 <p>Hi {name} 👋,</p>
 
 <p>Please find attached the consolidated MQL performance summary for all deal owners.</p>
@@ -67,47 +82,32 @@ def build_email_body(role="OWNER", recipient=None, metrics=None):
 
 <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; font-family: Arial, sans-serif; font-size: 14px;">
 <tr><th>Metric</th><th>Count</th><th>Status</th></tr>
-<tr><td>🕒 First Engagement Pending (1+ Days)</td><td>{sum(stats.get("first_engagement_pending", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td style='color: red;'>⚠️ Follow-up Needed</td></tr>
-<tr><td>⏱️ 1st → 2nd Engagement Delay</td><td>{sum(stats.get("engagement_gap_1_2", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td style='color: orange;'>⚠️ Delay</td></tr>
-<tr><td>⏱️ 2nd → 3rd Engagement Delay</td><td>{sum(stats.get("engagement_gap_2_3", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td style='color: orange;'>⚠️ Delay</td></tr>
-<tr><td>🚫 No Activity in Last 3 Days</td><td>{sum(stats.get("no_activity_3_days", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td style='color: red;'>🔴 Inactive</td></tr>
-<tr><td>💡 Revived Cold/Warm Deals</td><td>{sum(stats.get("revived_cold_warm", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td style='color: green;'>🟢 Active Again</td></tr>
-<tr><td>♻️ Stage Reversal: Hot → Warm</td><td>{sum(stats.get("hot_to_warm", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td>OK</td></tr>
-<tr><td>♻️ Stage Reversal: Warm → Cold</td><td>{sum(stats.get("warm_to_cold", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td>OK</td></tr>
-<tr><td>♻️ Stage Reversal: Hot → Cold</td><td>{sum(stats.get("hot_to_cold", [0, []])[0]
-    for owner_email, stats in metrics.items()
-    if owner_email not in exclude_emails)}</td><td>OK</td></tr>
-</table>
+{rows}</table>
 
 <p>This summary will help in identifying patterns across the pipeline
 and ensure timely interventions by team leaders.</p>
 
 <p>Warm regards,<br>
 Prozo Performance Manager</p>
-"""
+""")
+
+OWNER_ROW = HtmlTemplate("""<tr>
+    <td>{label}</td>
+    <td>{count}</td>
+    <td>{names}</td>
+    {status}
+</tr>
 
-    return f"""
+""")
+
+OWNER_BODY = HtmlTemplate("""
 <p>Hi {name} 👋,</p>
 
-<p>Here’s your daily performance snapshot on Hot Deals from HubSpot as of {today_str}.</p>
+<p>Here’s your daily performance snapshot on Hot Deals from HubSpot as of {today}.</p>
 
 <p>🚨 Action Summary:</p>
 
-<table border="1" cellpadding="5" cellspacing="0" 
+<table border="1" cellpadding="5" cellspacing="0"
        style="border-collapse: collapse; font-family: Arial, sans-serif; font-size: 14px; width: 100%;">
 <tr>
     <th>Metric</th>
@@ -116,152 +116,178 @@ Prozo Performance Manager</p>
     <th>Status</th>
 </tr>
 
-<tr>
-    <td>🕒 First Engagement Pending (1+ Days)</td>
-    <td>{metrics.get('first_engagement_pending', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('first_engagement_pending', [0, []])[1])}</td>
-    <td style='color: red;'>⚠️ Follow-up Needed</td>
-</tr>
+{rows}</table>
 
-<tr>
-    <td>⏱️ 1st → 2nd Engagement Delay</td>
-    <td>{metrics.get('engagement_gap_1_2', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('engagement_gap_1_2', [0, []])[1])}</td>
-    <td style='color: orange;'>⚠️ Delay</td>
-</tr>
-
-<tr>
-    <td>⏱️ 2nd → 3rd Engagement Delay</td>
-    <td>{metrics.get('engagement_gap_2_3', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('engagement_gap_2_3', [0, []])[1])}</td>
-    <td style='color: orange;'>⚠️ Delay</td>
-</tr>
+<p>📎 Please refer to the attached file for detailed deal-level insights.<br>
+🔖<strong>Reminder:</strong> Any stage reversal must be accompanied by a task. Otherwise, please move such deals to <strong>LOST</strong>.</p>
 
-<tr>
-    <td>🚫 No Activity in Last 3 Days</td>
-    <td>{metrics.get('no_activity_3_days', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('no_activity_3_days', [0, []])[1])}</td>
-    <td style='color: red;'>🔴 Inactive</td>
-</tr>
+<p>Warm regards,<br>
+Prozo Performance Manager</p>
+""")
 
-<tr>
-    <td>💡 Revived Cold/Warm Deals</td>
-    <td>{metrics.get('revived_cold_warm', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('revived_cold_warm', [0, []])[1])}</td>
-    <td style='color: green;'>🟢 Active Again</td>
-</tr>
+def build_email_body(role="OWNER", recipient=None, metrics=None, rollup=None):
+    name = extract_name_from_email(recipient)
+    today_str = datetime.today().strftime("%d %b %Y")
+    metrics = metrics or {}
 
-<tr>
-    <td>♻️ Stage Reversal: Hot → Warm</td>
-    <td>{metrics.get('hot_to_warm', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('hot_to_warm', [0, []])[1])}</td>
-    <td>OK</td>
-</tr>
+    if role == "MANAGER":
+        return build_manager_body(name, recipient, rollup or summary_rollup(metrics))
 
-<tr>
-    <td>♻️ Stage Reversal: Warm → Cold</td>
-    <td>{metrics.get('warm_to_cold', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('warm_to_cold', [0, []])[1])}</td>
-    <td>OK</td>
-</tr>
+    if role == "SUMMARY":
+        totals = (rollup or summary_rollup(metrics)).org
+        return SUMMARY_BODY.render(name=name, rows=SUMMARY_ROW.render_rows(
+            {"label": label, "count": totals.get(key, 0), "status": METRIC_STATUS[key]}
+            for key, label in METRIC_LABELS.items()
+        ))
+
+    return OWNER_BODY.render(name=name, today=today_str, rows=OWNER_ROW.render_rows(
+        {"label": label, "count": count, "names": ", ".join(names), "status": METRIC_STATUS[key]}
+        for key, label in METRIC_LABELS.items()
+        for count, names in [metrics.get(key, [0, []])]
+    ))
+
+MANAGER_COLUMNS = [
+    ("first_engagement_pending", "🕒 1st Engagement Pending"),
+    ("engagement_gap_1_2", "⏱️ 1st → 2nd Delay"),
+    ("engagement_gap_2_3", "⏱️ 2nd → 3rd Delay"),
+    ("no_activity_3_days", "🚫 No Activity 3 Days"),
+    ("revived_cold_warm", "💡 Revived"),
+    ("hot_to_warm", "♻️ Hot → Warm"),
+    ("warm_to_cold", "♻️ Warm → Cold"),
+    ("hot_to_cold", "♻️ Hot → Cold"),
+]
+
+MANAGER_HEADER = "".join(f"<th>{label}</th>" for _, label in MANAGER_COLUMNS)
+
+MANAGER_BODY = HtmlTemplate("""
+<p>Hi {name} 👋,</p>
 
-<tr>
-    <td>♻️ Stage Reversal: Hot → Cold</td>
-    <td>{metrics.get('hot_to_cold', [0, []])[0]}</td>
-    <td>{", ".join(metrics.get('hot_to_cold', [0, []])[1])}</td>
-    <td>OK</td>
-</tr>
+<p>Here’s the daily Hot Deals snapshot for your team as of {today}.
+Each report's row includes everyone reporting to them.</p>
 
+<table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; font-family: Arial, sans-serif; font-size: 14px;">
+<tr><th>Owner</th>{header}</tr>
+{rows}
+{total_row}
 </table>
 
-<p>📎 Please refer to the attached file for detailed deal-level insights.<br>
-🔖<strong>Reminder:</strong> Any stage reversal must be accompanied by a task. Otherwise, please move such deals to <strong>LOST</strong>.</p>
+<p>📎 Please refer to the attached file for your team's deal-level details.</p>
 
 <p>Warm regards,<br>
 Prozo Performance Manager</p>
-"""
+""")
+
+def build_manager_body(name, manager, rollup):
+    rows = "".join(
+        f"<tr><td>{owner}</td>" + "".join(f"<td>{totals.get(key, 0)}</td>" for key, _ in MANAGER_COLUMNS) + "</tr>"
+        for owner, totals in rollup.digest(manager)
+    )
+    team = rollup.team(manager)
+    total_row = "<tr><td><b>Team total</b></td>" + "".join(f"<td><b>{team.get(key, 0)}</b></td>" for key, _ in MANAGER_COLUMNS) + "</tr>"
+    return MANAGER_BODY.render(name=name, today=datetime.today().strftime("%d %b %Y"),
+                               header=MANAGER_HEADER, rows=rows, total_row=total_row)
+
+def deal_row(deal):
+    deal_type_display = deal.type.display
+    # Alerts raised since the previous run are flagged
+    new_alerts = (deal.get("alert_delta") or {}).get("new", [])
+    alerts = [f"🆕 {alert}" if alert in new_alerts else alert for alert in deal.get("alerts", [])]
+
+    first_eng = sanitize(deal.get("engagement_dates", {}).get("first"))
+    second_eng = sanitize(deal.get("engagement_dates", {}).get("second"))
+    third_eng = sanitize(deal.get("engagement_dates", {}).get("third"))
+
+    return [
+        sanitize(deal.get("name")),
+        sanitize(deal.get("owner_email")),
+        sanitize(deal_type_display),
+        sanitize(deal.get("last_activity_fr")),
+        sanitize(deal.get("days_since_last_activity")),
+        first_eng,
+        second_eng,
+        third_eng,
+        sanitize(deal.get("stage_change", "N/A")),
+        sanitize(", ".join(alerts)),
+        "","","",
+        sanitize(deal.get("last_note")),
+        "","",""
+    ]
+
+DEAL_SHEET = CsvLayout([
+    "Deal Name", "Deal Owner Email", "Deal Type", "Last Activity Date",
+    "Days Since Last Activity", "First Engagement Date", "Second Engagement Date",
+    "Third Engagement Date", "Stage Change", "Alerts", "","","", "Latest Note", "","",""
+], deal_row, quoting=csv.QUOTE_ALL)
+
+def report_filename(role, recipient):
+    return f"alerts_{role.lower()}_{recipient.replace('@', '_at_').replace('.', '_').strip()}.csv"
 
 def generate_csv(deals, recipient, role):
-    filename = f"alerts_{role.lower()}_{recipient.replace('@', '_at_').replace('.', '_').strip()}.csv"
-    filepath = os.path.join(TMP_DIR, filename)
-
-    with open(filepath, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-        writer.writerow([
-            "Deal Name", "Deal Owner Email", "Deal Type", "Last Activity Date",
-            "Days Since Last Activity", "First Engagement Date", "Second Engagement Date",
-            "Third Engagement Date", "Stage Change", "Alerts", "","","", "Latest Note", "","",""
-        ])
-
-        for deal in deals:
-            raw_type = deal.get("deal_type", "").lower()
-            if raw_type == "true":
-                deal_type_display = "🔴 hot"
-            elif raw_type == "false":
-                deal_type_display = "🔵 warm"
-            elif raw_type == "cold":
-                deal_type_display = "🟢 cold"
-            else:
-                deal_type_display = "unknown"
-
-            first_eng = sanitize(deal.get("engagement_dates", {}).get("first"))
-            second_eng = sanitize(deal.get("engagement_dates", {}).get("second"))
-            third_eng = sanitize(deal.get("engagement_dates", {}).get("third"))
-
-            writer.writerow([
-                sanitize(deal.get("name")),
-                sanitize(deal.get("owner_email")),
-                sanitize(deal_type_display),
-                sanitize(deal.get("last_activity_fr")),
-                sanitize(deal.get("days_since_last_activity")),
-                first_eng,
-                second_eng,
-                third_eng,
-                sanitize(deal.get("stage_change", "N/A")),
-                sanitize(", ".join(deal.get("alerts", []))),
-                "","","",
-                sanitize(deal.get("last_note")),
-                "","",""
-            ])
-
-    return filepath
-
-def send_email_with_attachment(to_email, body, file_path, role="OWNER"):
+    """The report CSV as an in-memory attachment, compressed if it is large"""
+    return DEAL_SHEET.sheet(report_filename(role, recipient), map(deal_row, deals))
+
+class DailyReports:
+    """Every daily email, rendered from one pass over the alerted deals.
+
+    Each deal's CSV row is built once and reused by its owner's report,
+    its managers' team reports and the summary.
+    """
+
+    def __init__(self, deals, metrics_by_owner, rollup):
+        self.metrics_by_owner = metrics_by_owner
+        self.rollup = rollup
+        self.rows = RenderedRows(DEAL_SHEET, deals, lambda deal: deal.get("owner_email", "").lower())
+
+    def owners(self):
+        """Owners with alerted deals, in deal order"""
+        return [owner for owner in self.rows.owners() if owner]
+
+    def owner_message(self, email):
+        body = build_email_body("OWNER", email, self.metrics_by_owner.get(email, {}))
+        return build_message(email, body, self.rows.owner_sheet(email, report_filename("OWNER", email)), role="OWNER")
+
+    def summary_message(self, recipients=None):
+        """The summary rendered once, addressed to every summary recipient"""
+        body = build_email_body("SUMMARY", None, self.metrics_by_owner, self.rollup)
+        return build_message(recipients or SUMMARY_RECIPIENTS, body, self.rows.sheet(report_filename("SUMMARY", "summary")),
+                             role="SUMMARY")
+
+    def manager_message(self, manager):
+        """None when no one in the manager's tree has an alerted deal"""
+        members = self.rollup.team_members(manager)
+        if not any(owner in members for owner in self.rows.by_owner):
+            return None
+        body = build_email_body("MANAGER", manager, self.metrics_by_owner, self.rollup)
+        return build_message(manager, body, self.rows.sheet(report_filename("MANAGER", manager), members), role="MANAGER")
+
+def send_email_with_attachment(to_email, body, attachment, role="OWNER"):
+    send_message(build_message(to_email, body, attachment, role=role))
+
+def build_message(to_email, body, attachment, role="OWNER"):
     today_str = datetime.now().strftime("%d %b %Y")
     subject = {
         "SUMMARY": f"🚨 MQL Performance Summary Report || {today_str}",
-        "OWNER": f"⚠️ Your HubSpot To-Do || Hot Deals Performance Summary || {today_str} "
+        "OWNER": f"⚠️ Your HubSpot To-Do || Hot Deals Performance Summary || {today_str} ",
+        "MANAGER": f"👥 Team Hot Deals Digest || {today_str}"
     }.get(role, f"📢 Deal Alert Summary – {today_str}")
 
     msg = MIMEMultipart()
     msg["Subject"] = subject.strip()
     msg["From"] = formataddr(("Prozo Performance Manager", EMAIL_USERNAME.strip()))
-    msg["To"] = to_email.strip()
+    msg["To"] = ", ".join(email.strip() for email in ([to_email] if isinstance(to_email, str) else to_email))
     msg.attach(MIMEText(body, "html"))
 
-    try:
-        with open(file_path, "rb") as file:
-            part = MIMEBase("application", "octet-stream")
-            part.set_payload(file.read())
-            encoders.encode_base64(part)
-            part.add_header("Content-Disposition", f"attachment; filename={os.path.basename(file_path)}")
-            msg.attach(part)
-    except Exception as e:
-        print(f"❌ Failed to attach file: {e}")
-        raise
-
-    for attempt in range(2):  # Try once, retry once if it fails
-        try:
-            with smtplib.SMTP("smtp.gmail.com", 587, timeout=30) as server:
-                server.starttls()
-                server.login(EMAIL_USERNAME, EMAIL_PASSWORD)
-                server.send_message(msg)
-            print(f"✅ Email sent to {to_email}")
-            return  # Exit after success
-        except Exception as e:
-            print(f"❌ Attempt {attempt + 1}: Failed to send email to {to_email}: {e}")
-            if attempt == 0:
-                print("⏳ Retrying in 5 seconds...")
-                time.sleep(5)
-            else:
-                raise  # Final failure, let the main retry logic handle it
+    part = MIMEBase(attachment.maintype, attachment.subtype)
+    part.set_payload(attachment.data)
+    encoders.encode_base64(part)
+    part.add_header("Content-Disposition", f"attachment; filename={attachment.filename}")
+    msg.attach(part)
+    return msg
+
+def send_message(msg):
+    """Send a built message; a retry from the dispatch queue resends the same message"""
+    # Shared logged-in connections; failures go back to the dispatch queue, which retries
+    refused = smtp_pool(EMAIL_USERNAME, EMAIL_PASSWORD).send(msg)
+    # Some recipients refused is not a failure: retrying would resend to the rest
+    for email, (code, reason) in (refused or {}).items():
+        log.warning(f"⚠️ {email} refused by the server ({code}): {reason!r}")
@@ -1,56 +1,32 @@
-﻿import os
-import requests
-from bs4 import BeautifulSoup
+﻿from src.hubspot import BASE_URL, HEADERS
+from src.log import trace
+from src.note_text import LazyNoteText
 
-HUBSPOT_TOKEN = os.getenv("HUBSPOT_TOKEN")
-HEADERS = {
-    "Authorization": f"Bearer {HUBSPOT_TOKEN}"
-}
+# v3 activity objects that count as an engagement on a deal
+ENGAGEMENT_TYPES = ["notes", "calls", "emails", "meetings", "tasks"]
+ASSOCIATIONS_BATCH_URL = BASE_URL + "/crm/v4/associations/deals/{object_type}/batch/read"
+ASSOCIATIONS_PAGE_URL = BASE_URL + "/crm/v4/objects/deals/{deal_id}/associations/{object_type}?limit=500&after={after}"
+BATCH_READ_URL = BASE_URL + "/crm/v3/objects/{object_type}/batch/read"
+BATCH_LIMIT = 100  # HubSpot caps batch inputs at 100 ids
+NOTE_PROPERTIES = ["hs_note_body", "hs_timestamp", "hs_lastmodifieddate"]
 
-def fetch_engagements_for_deal(deal_id, deal_name=None):
-    url = f"https://api.hubapi.com/engagements/v1/engagements/associated/deal/{deal_id}/paged?limit=100"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            print(f"❌ Failed to fetch engagements for deal {deal_name or deal_id}: {response.status_code}")
-            return [], "N/A"
-
-        data = response.json()
-        results = data.get("results", [])
-
-        timestamps = []
-        notes = []
-
-        for item in results:
-            eng = item.get("engagement", {})
-            meta = item.get("metadata", {})
+def summarize_engagements(timestamps, note, deal_id, deal_name=None):
+    """Turn raw engagement data into (sorted timestamps, latest note text).
 
-            ts = eng.get("timestamp")
-            if ts:
-                timestamps.append(ts)
+    note is the newest note's {"id", "hs_note_body", "hs_lastmodifieddate"};
+    its text is only extracted when the note is actually read.
+    """
+    timestamps = sorted(timestamps)
 
-                if eng.get("type") == "NOTE" and meta.get("body"):
-                    # Extract readable text from HTML using BeautifulSoup
-                    soup = BeautifulSoup(meta["body"], "html.parser")
-                    note_text = soup.get_text().strip()
-                    notes.append({
-                        "timestamp": ts,
-                        "body": note_text
-                    })
+    last_note = "N/A"
+    if note and note.get("hs_note_body"):
+        last_note = LazyNoteText(note["id"], note.get("hs_lastmodifieddate"), note["hs_note_body"])
 
-        timestamps = sorted(timestamps)
-        notes = sorted(notes, key=lambda x: x["timestamp"])
+    trace(deal_id, "📌 Deal %s has %d engagement(s)%s", deal_name or deal_id, len(timestamps), " and a latest note" if note else "")
 
-        # Return the latest note if available
-        last_note = notes[-1]["body"] if notes else "N/A"
+    return timestamps, last_note
 
-        if deal_name:
-            print(f"📌 Deal {deal_name} has {len(timestamps)} engagement(s) and latest note: {last_note[:80]}...")
-        else:
-            print(f"📌 Deal {deal_id} has {len(timestamps)} engagement(s)")
-
-        return timestamps, last_note
-
-    except Exception as e:
-        print(f"❌ Exception while fetching engagements for deal {deal_name or deal_id}: {e}")
-        return [], "N/A"
+def fetch_engagements_for_deal(deal_id, deal_name=None):
+    # The v3 fetch is batch-oriented; a single deal is just a batch of one
+    from src.engagements_async import fetch_engagements_for_deals
+    return fetch_engagements_for_deals([{"id": deal_id, "name": deal_name}])[deal_id]
@@ -0,0 +1,180 @@
+import asyncio
+import os
+
+import aiohttp
+import requests
+
+from src.engagements import (
+    ASSOCIATIONS_BATCH_URL, ASSOCIATIONS_PAGE_URL, BATCH_LIMIT, BATCH_READ_URL,
+    ENGAGEMENT_TYPES, HEADERS, NOTE_PROPERTIES, summarize_engagements
+)
+from src.hubspot import http, parse_hubspot_ms
+from src.log import get_logger
+from src.throttle import hubspot_limiter
+from src.transport import HUBSPOT_TRANSPORT
+
+# Requests allowed in flight at once; HUBSPOT_RPS still caps how fast they start
+ENGAGEMENT_CONCURRENCY = int(os.getenv("ENGAGEMENT_CONCURRENCY", "100"))
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60)
+RETRY_WAITS = [5, 10, 20]
+
+log = get_logger("engagements")
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class AsyncHubSpotClient:
+    """Pooled aiohttp session with a concurrency cap and a shared rate budget."""
+
+    def __init__(self, session, concurrency):
+        self.session = session
+        # The process-wide budget, so overlapping sync calls (search, enrichment) count against it too
+        self.limiter = hubspot_limiter
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(self, method, url, payload):
+        """(status, json body) for one attempt"""
+        if HUBSPOT_TRANSPORT != "live":
+            # Record/replay lives on the requests adapter, so borrow the sync session
+            response = await asyncio.to_thread(http.request, method, url, headers=HEADERS, json=payload, timeout=60)
+            return response.status_code, response.json() if response.status_code in (200, 207) else None
+        async with self.session.request(method, url, headers=HEADERS, json=payload) as response:
+            return response.status, await response.json() if response.status in (200, 207) else None
+
+    async def request(self, method, url, payload=None):
+        """JSON body of a 200/207 response, or None once retries are used up"""
+        async with self.semaphore:
+            for attempt, wait in enumerate(RETRY_WAITS, 1):
+                await self.limiter.acquire_async()
+                try:
+                    status, data = await self.send(method, url, payload)
+                    if status == 429:
+                        log.warning(f"⏳ Rate limit hit (attempt {attempt}), retrying in {wait}s...")
+                        await asyncio.sleep(wait)
+                        continue
+                    if status not in (200, 207):
+                        log.warning(f"⚠️ Error {status} for {url}")
+                        return None
+                    return data
+                except requests.exceptions.RequestException as e:
+                    log.error(f"❌ Request failed (attempt {attempt}): {e}")
+                    await asyncio.sleep(wait)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    log.error(f"❌ Request failed (attempt {attempt}): {e}")
+                    await asyncio.sleep(wait)
+        return None
+
+
+async def fetch_associated_ids(client, object_type, deal_ids):
+    """{deal_id: [engagement ids]} for one activity type, following per-deal paging"""
+    data = await client.request("POST", ASSOCIATIONS_BATCH_URL.format(object_type=object_type), {
+        "inputs": [{"id": deal_id} for deal_id in deal_ids]
+    })
+    associated = {}
+    for result in (data or {}).get("results", []):
+        deal_id = str(result.get("from", {}).get("id"))
+        ids = [str(to["toObjectId"]) for to in result.get("to", [])]
+        after = result.get("paging", {}).get("next", {}).get("after")
+        while after:
+            page = await client.request("GET", ASSOCIATIONS_PAGE_URL.format(
+                deal_id=deal_id, object_type=object_type, after=after
+            ))
+            if not page:
+                break
+            ids.extend(str(to["toObjectId"]) for to in page.get("results", []))
+            after = page.get("paging", {}).get("next", {}).get("after")
+        associated[deal_id] = ids
+    return associated
+
+
+async def read_properties(client, object_type, ids, properties):
+    """{id: properties} for up to BATCH_LIMIT objects"""
+    data = await client.request("POST", BATCH_READ_URL.format(object_type=object_type), {
+        "properties": properties,
+        "inputs": [{"id": object_id} for object_id in ids]
+    })
+    return {str(r.get("id")): r.get("properties", {}) for r in (data or {}).get("results", [])}
+
+
+async def gather_batches(coroutines):
+    merged = {}
+    for result in await asyncio.gather(*coroutines):
+        merged.update(result)
+    return merged
+
+
+async def fetch_type_associations(client, object_type, deal_ids):
+    return await gather_batches(
+        fetch_associated_ids(client, object_type, chunk) for chunk in chunked(deal_ids, BATCH_LIMIT)
+    )
+
+
+async def read_type_properties(client, object_type, ids, properties):
+    return await gather_batches(
+        read_properties(client, object_type, chunk, properties) for chunk in chunked(ids, BATCH_LIMIT)
+    )
+
+
+async def fetch_all_engagements(deals, concurrency=ENGAGEMENT_CONCURRENCY):
+    """Engagement timestamps and latest note for every deal.
+
+    Associations are resolved 100 deals per call for each activity type
+    (with paging for busy deals), only hs_timestamp is read for the
+    activities, and only the newest note of each deal has its body read.
+    """
+    deal_ids = [str(deal["id"]) for deal in deals]
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=REQUEST_TIMEOUT) as session:
+        client = AsyncHubSpotClient(session, concurrency)
+
+        associations = dict(zip(ENGAGEMENT_TYPES, await asyncio.gather(*(
+            fetch_type_associations(client, object_type, deal_ids)
+            for object_type in ENGAGEMENT_TYPES
+        ))))
+
+        timestamps = dict(zip(ENGAGEMENT_TYPES, await asyncio.gather(*(
+            read_type_properties(
+                client, object_type,
+                sorted({i for ids in associations[object_type].values() for i in ids}),
+                ["hs_timestamp"]
+            )
+            for object_type in ENGAGEMENT_TYPES
+        ))))
+
+        deal_timestamps = {}
+        latest_note = {}
+        for deal_id in deal_ids:
+            deal_ts = []
+            for object_type in ENGAGEMENT_TYPES:
+                for object_id in associations[object_type].get(deal_id, []):
+                    ts = parse_hubspot_ms(timestamps[object_type].get(object_id, {}).get("hs_timestamp"))
+                    if ts is None:
+                        continue
+                    deal_ts.append(ts)
+                    if object_type == "notes" and ts >= latest_note.get(deal_id, (0, None))[0]:
+                        latest_note[deal_id] = (ts, object_id)
+            deal_timestamps[deal_id] = deal_ts
+
+        notes = await read_type_properties(
+            client, "notes", [note_id for _, note_id in latest_note.values()], NOTE_PROPERTIES
+        )
+
+    results = {}
+    for deal in deals:
+        deal_id = str(deal["id"])
+        note_id = latest_note.get(deal_id, (0, None))[1]
+        note = dict(notes[note_id], id=note_id) if note_id in notes else None
+        results[deal["id"]] = summarize_engagements(deal_timestamps[deal_id], note, deal["id"], deal.get("name"))
+    return results
+
+
+def fetch_engagements_for_deals(deals):
+    """Fetch engagements for every deal over one pooled connection set.
+
+    Returns {deal_id: (timestamps, last_note)}, the same per-deal result
+    as fetch_engagements_for_deal.
+    """
+    return asyncio.run(fetch_all_engagements(deals))
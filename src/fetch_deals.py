@@ -1,14 +1,17 @@
-﻿import os
-import requests
-import time
-
-HUBSPOT_TOKEN = os.getenv("HUBSPOT_TOKEN")
-HEADERS = {
-    "Authorization": f"Bearer {HUBSPOT_TOKEN}",
-    "Content-Type": "application/json"
-}
+﻿import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from src.deal_record import Deal
+from src.deal_store import DealStore
+from src.deal_table import DealTable
+from src.hubspot import BASE_URL, HEADERS, safe_post
+from src.log import get_logger, trace
+from src.owners import owner_directory
+from src.search_plan import SearchPlan, DAY_MS
+from src.throttle import HUBSPOT_MAX_WORKERS
 
-OWNER_EMAIL_CACHE = {}
+log = get_logger("fetch")
 
 # Dealstage values to skip
 IGNORED_DEALSTAGES = {
@@ -25,171 +28,183 @@ IGNORED_DEALSTAGES = {
     "998316459", "998316458", "998351476"
 }
 
-def safe_get(url, headers, max_retries=3):
-    wait_times = [5, 10, 20]  # exponential backoff
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                return response
-            elif response.status_code == 429:
-                print(f"⏳ Rate limit hit (attempt {attempt+1}), retrying in {wait_times[attempt]}s...")
-                time.sleep(wait_times[attempt])
-            else:
-                print(f"⚠️ Error {response.status_code} for {url}")
-                return response
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Request failed (attempt {attempt+1}): {e}")
-            time.sleep(wait_times[attempt])
-    return None
+HISTORY_PROPERTY = "deal_type__hot__warm___cold_"
+BATCH_READ_LIMIT = 100  # HubSpot caps batch/read inputs at 100 ids
+DAILY_SCOPE = "daily_marketing"
+DAILY_SOURCE = "Marketing"
+
+DEAL_PROPERTIES = [
+    "dealname",
+    "hubspot_owner_id",
+    "hs_lastmodifieddate",
+    "notes_last_updated",
+    "deal_type__hot__warm___cold_",
+    "hubspot_owner_assigneddate",
+    "source_of_the_deal",
+    "dealstage"
+]
 
 def get_owner_email(owner_id):
-    if not owner_id:
-        return None
-    if owner_id in OWNER_EMAIL_CACHE:
-        return OWNER_EMAIL_CACHE[owner_id]
-
-    url = f"https://api.hubapi.com/crm/v3/owners/{owner_id}"
-    response = safe_get(url, HEADERS)
-    if response and response.status_code == 200:
-        email = response.json().get("email")
-        OWNER_EMAIL_CACHE[owner_id] = email
-        return email
+    email = owner_directory.email_for(owner_id)
+    if not email and owner_id:
+        log.warning(f"❌ Failed to get email for owner {owner_id}")
+    return email
+
+def fetch_deal_type_history_batch(deal_ids):
+    """Load deal type history for up to BATCH_READ_LIMIT deals in one call.
+
+    Returns {deal_id: [{"value", "timestamp"}, ...]} with the entries in the
+    order HubSpot returns them; deals missing from the response map to [].
+    """
+    histories = {deal_id: [] for deal_id in deal_ids}
+    if not deal_ids:
+        return histories
+
+    url = f"{BASE_URL}/crm/v3/objects/deals/batch/read"
+    payload = {
+        "propertiesWithHistory": [HISTORY_PROPERTY],
+        "inputs": [{"id": deal_id} for deal_id in deal_ids]
+    }
+    response = safe_post(url, HEADERS, payload)
+    log.debug(f"🔍 History batch of {len(deal_ids)} deal(s) | Status: {response.status_code if response else 'None'}")
+    if not response or response.status_code not in (200, 207):
+        return histories
+
+    for result in response.json().get("results", []):
+        histories[result.get("id")] = [
+            {"value": item.get("value"), "timestamp": item.get("timestamp")}
+            for item in result.get("propertiesWithHistory", {}).get(HISTORY_PROPERTY, [])
+        ]
+    return histories
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def plan_marketing_search(exclude_owner_emails=()):
+    excluded = {email.lower() for email in exclude_owner_emails}
+    # No ids to check for misses here; a stale map only excludes less, and
+    # excluded owners' deals are still dropped by email after the search
+    exclude_owner_ids = [
+        owner_id for owner_id, email in owner_directory.email_map().items()
+        if email and email.lower() in excluded
+    ]
+    return SearchPlan(
+        DEAL_PROPERTIES,
+        source=DAILY_SOURCE,
+        exclude_stages=IGNORED_DEALSTAGES,
+        exclude_owner_ids=exclude_owner_ids
+    )
+
+def is_reportable(props):
+    return bool(props.get("hubspot_owner_id")) and str(props.get("dealstage", "")) not in IGNORED_DEALSTAGES
+
+def enrich_with_history(deals):
+    """Attach deal type history to every reportable deal, 100 deals per call"""
+    # Every request goes through hubspot_limiter, so the pool size only bounds
+    # how many calls are in flight while the limiter caps the request rate.
+    deal_ids = [d["id"] for d in deals if is_reportable(d.get("properties", {}))]
+    histories = {}
+    with ThreadPoolExecutor(max_workers=HUBSPOT_MAX_WORKERS) as pool:
+        for batch in pool.map(fetch_deal_type_history_batch, chunked(deal_ids, BATCH_READ_LIMIT)):
+            histories.update(batch)
+    for deal in deals:
+        deal["deal_type_history"] = histories.get(deal["id"], [])
+
+def split_by_source(deals):
+    """(deals still in the daily scope, ids of deals whose source moved away from it)"""
+    kept, left = [], []
+    for deal in deals:
+        if deal.get("properties", {}).get("source_of_the_deal") == DAILY_SOURCE:
+            kept.append(deal)
+        else:
+            left.append(deal["id"])
+    return kept, left
+
+def store_record(deal):
+    return {"id": deal["id"], "properties": deal.get("properties", {}), "deal_type_history": deal["deal_type_history"]}
+
+def plan_marketing_sync(store, exclude_owner_emails=()):
+    """(scope, search plan, watermark) for this run; the watermark is None on a full reconcile"""
+    plan = plan_marketing_search(exclude_owner_emails)
+    # Deals are stored per filter set so changing the exclusions starts a fresh scope
+    scope = f"{DAILY_SCOPE}_{plan.signature()}"
+    since_ms = store.delta_since(scope)
+    if since_ms is None:
+        log.info("🔄 Full reconcile of marketing deals...")
     else:
-        print(f"❌ Failed to get email for owner {owner_id}")
+        log.info(f"🔄 Delta sync of deals modified since {datetime.utcfromtimestamp(since_ms / 1000):%Y-%m-%d %H:%M} UTC...")
+        # Deltas skip every scope filter: a deal that just moved into an ignored stage
+        # or to an excluded owner must still overwrite its stored copy, and one whose
+        # source changed away from Marketing must be dropped (see split_by_source).
+        plan = SearchPlan(DEAL_PROPERTIES, modified_since_ms=since_ms)
+    return scope, plan, since_ms
+
+def sync_marketing_deals(store, exclude_owner_emails=()):
+    """Bring the local store up to date and return every stored marketing deal"""
+    started_ms = int(time.time() * 1000)
+    scope, plan, since_ms = plan_marketing_sync(store, exclude_owner_emails)
+
+    # createdate shards run up to a day ahead so deals created mid-run are not cut off
+    changed = plan.fetch(until_ms=started_ms + DAY_MS)
+    if changed is None:
         return None
 
-def fetch_deal_type_history(deal_id):
-    url = f"https://api.hubapi.com/crm/v3/objects/deals/{deal_id}?propertiesWithHistory=deal_type__hot__warm___cold_"
-    response = safe_get(url, HEADERS)
-    print(f"🔍 Debug for Deal ID {deal_id} | Status: {response.status_code if response else 'None'}")
-    if not response or response.status_code != 200:
-        return []
-
-    return [
-        {"value": item.get("value"), "timestamp": item.get("timestamp")}
-        for item in response.json()
-        .get("propertiesWithHistory", {})
-        .get("deal_type__hot__warm___cold_", [])
-    ]
+    changed, left = split_by_source(changed)
+    enrich_with_history(changed)
+    store.upsert(scope, [store_record(d) for d in changed])
+    store.delete(scope, left)
+    store.finish_sync(scope, started_ms, full=since_ms is None, seen_ids=[d["id"] for d in changed])
+    log.info(f"💾 Synced {len(changed)} changed deal(s) into the local store")
+    return store.load(scope)
+
+def build_deal_row(table, deal):
+    """Parse a stored marketing deal into the table; None if it is not reported on"""
+    props = deal.get("properties", {})
+    owner_id = props.get("hubspot_owner_id")
+    if not owner_id:
+        return None
+
+    owner_email = get_owner_email(owner_id)
+    if not owner_email:
+        return None
 
-def get_recent_deals_grouped_by_owner():
-    print("📡 Fetching *all* marketing deals...")
-
-    url = "https://api.hubapi.com/crm/v3/objects/deals/search"
-    all_deals = []
-    after = None
-
-    while True:
-        payload = {
-            "filterGroups": [{
-                "filters": [{
-                    "propertyName": "source_of_the_deal",
-                    "operator": "EQ",
-                    "value": "Marketing"
-                }]
-            }],
-            "properties": [
-                "dealname",
-                "hubspot_owner_id",
-                "hs_lastmodifieddate",
-                "notes_last_updated",
-                "deal_type__hot__warm___cold_",
-                "hubspot_owner_assigneddate",
-                "source_of_the_deal",
-                "dealstage"
-            ],
-            "limit": 100
-        }
-        if after:
-            payload["after"] = after
-
-        response = None
-        for attempt in range(3):
-            try:
-                response = requests.post(url, headers=HEADERS, json=payload, timeout=30)
-                print(f"🔁 Status: {response.status_code}")
-                if response.status_code == 200:
-                    break
-                elif response.status_code == 429:
-                    print(f"⏳ Rate limit hit while fetching deals. Retrying in 5s...")
-                    time.sleep(5)
-                else:
-                    print("❌ Error fetching deals:", response.text)
-                    return {}
-            except requests.exceptions.RequestException as e:
-                print(f"❌ Request error: {e}")
-                time.sleep(5)
-
-        if not response or response.status_code != 200:
-            break
-
-        data = response.json()
-        all_deals.extend(data.get("results", []))
-        after = data.get("paging", {}).get("next", {}).get("after")
-        if not after:
-            break
-        time.sleep(1)  # Delay between pages
+    dealstage = str(props.get("dealstage", ""))
+    if dealstage in IGNORED_DEALSTAGES:
+        trace(deal.get("id"), "⏭️ Ignored deal %r for owner %s due to dealstage %s", props.get("dealname"), owner_email, dealstage)
+        return None
 
+    deal_data = table.append(Deal(
+        id=deal.get("id"),
+        name=props.get("dealname", "No Name"),
+        owner_id=owner_id,
+        owner_email=owner_email,
+        last_modified=props.get("hs_lastmodifieddate") or "N/A",
+        last_activity=props.get("notes_last_updated") or "N/A",
+        deal_type=props.get("deal_type__hot__warm___cold_") or "N/A",
+        owner_assignment_date=props.get("hubspot_owner_assigneddate") or "N/A",
+        deal_source=props.get("source_of_the_deal"),
+        deal_type_history=deal.get("deal_type_history", []),
+        deal_stage=dealstage
+    ))
+
+    trace(deal_data["id"], "📦 Deal details", owner=owner_email, type=deal_data.type.label)
+    return deal_data
+
+def get_recent_deals_grouped_by_owner(exclude_owner_emails=()):
+    log.info("📡 Fetching *all* marketing deals...")
+
+    all_deals = sync_marketing_deals(DealStore(), exclude_owner_emails)
+    if all_deals is None:
+        return {}
+
+    table = DealTable()
     grouped = {}
 
-    for index, deal in enumerate(all_deals):
-        props = deal.get("properties", {})
-        owner_id = props.get("hubspot_owner_id")
-        if not owner_id:
-            continue
-
-        owner_email = get_owner_email(owner_id)
-        if not owner_email:
-            continue
-
-        dealstage = str(props.get("dealstage", ""))
-        if dealstage in IGNORED_DEALSTAGES:
-            print(f"⏭️ Ignored deal '{props.get('dealname')}' (ID: {deal.get('id')}) for owner '{owner_email}' due to dealstage {dealstage}")
-            continue
-
-        time.sleep(0.8)  # Delay between each deal fetch
-
-        if index > 0 and index % 10 == 0:
-            print("⏳ Pausing for 2s every 10 deals...")
-            time.sleep(2)
-
-        deal_type_history = fetch_deal_type_history(deal["id"])
-
-        deal_data = {
-            "id": deal.get("id"),
-            "name": props.get("dealname", "No Name"),
-            "owner_id": owner_id,
-            "owner_email": owner_email,
-            "last_modified": props.get("hs_lastmodifieddate") or "N/A",
-            "last_activity": props.get("notes_last_updated") or "N/A",
-            "deal_type": props.get("deal_type__hot__warm___cold_") or "N/A",
-            "owner_assignment_date": props.get("hubspot_owner_assigneddate") or "N/A",
-            "deal_source": props.get("source_of_the_deal"),
-            "deal_type_history": deal_type_history,
-            "deal_stage": dealstage
-        }
-
-        print("\n📦 Deal Details")
-        print(f"🆔 ID: {deal_data['id']}")
-        
-        #print(f"📛 Name: {deal_data['name']}")
-        #print(f"👤 Owner Email: {deal_data['owner_email']}")
-        #print(f"👤 Owner ID: {deal_data['owner_id']}")
-        #print(f"🕑 Last Modified: {deal_data['last_modified']}")
-        #print(f"📅 Last Activity: {deal_data['last_activity']}")
-        #print(f"🔖 Deal Type: {deal_data['deal_type']}")
-        #print(f"📥 Owner Assigned Date: {deal_data['owner_assignment_date']}")
-        #print(f"👌 Deal Source: {deal_data['deal_source']}")
-        #print(f"📶 Deal Stage: {deal_data['deal_stage']}")
-        #print("🕓 Deal Type History:")
-        #if deal_data["deal_type_history"]:
-         #   for entry in deal_data["deal_type_history"]:
-          #      print(f"   - {entry['timestamp']}: {entry['value']}")     
-        #else:
-         #   print("   - No history found")
-
-        grouped.setdefault(owner_email, []).append(deal_data)
-
-    print(f"\n✅ Found {len(all_deals)} marketing deals grouped by {len(grouped)} owners")
+    for deal in all_deals:
+        deal_data = build_deal_row(table, deal)
+        if deal_data is not None:
+            grouped.setdefault(deal_data["owner_email"], []).append(deal_data)
+
+    log.info(f"✅ Found {len(all_deals)} marketing deals grouped by {len(grouped)} owners")
     return grouped
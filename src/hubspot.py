@@ -0,0 +1,54 @@
+import os
+import requests
+import time
+from datetime import datetime
+
+from src.throttle import hubspot_limiter
+from src.log import get_logger
+from src.transport import HUBSPOT_BASE_URL, new_session
+
+BASE_URL = HUBSPOT_BASE_URL
+HUBSPOT_TOKEN = os.getenv("HUBSPOT_TOKEN")
+HEADERS = {
+    "Authorization": f"Bearer {HUBSPOT_TOKEN}",
+    "Content-Type": "application/json"
+}
+
+# One pooled session for every sync call; it also carries the record/replay adapter
+http = new_session()
+
+log = get_logger("hubspot")
+
+def safe_request(method, url, headers, json=None, max_retries=3):
+    wait_times = [5, 10, 20]  # exponential backoff
+    for attempt in range(max_retries):
+        try:
+            hubspot_limiter.acquire()
+            response = http.request(method, url, headers=headers, json=json, timeout=30)
+            if 200 <= response.status_code < 300:
+                return response
+            elif response.status_code == 429:
+                log.warning(f"⏳ Rate limit hit (attempt {attempt+1}), retrying in {wait_times[attempt]}s...")
+                time.sleep(wait_times[attempt])
+            else:
+                log.warning(f"⚠️ Error {response.status_code} for {url}")
+                return response
+        except requests.exceptions.RequestException as e:
+            log.error(f"❌ Request failed (attempt {attempt+1}): {e}")
+            time.sleep(wait_times[attempt])
+    return None
+
+def safe_get(url, headers, max_retries=3):
+    return safe_request("GET", url, headers, max_retries=max_retries)
+
+def safe_post(url, headers, payload, max_retries=3):
+    return safe_request("POST", url, headers, json=payload, max_retries=max_retries)
+
+def parse_hubspot_ms(value):
+    """HubSpot datetime string (2024-05-01T10:00:00.123Z) -> epoch ms, or None"""
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
@@ -0,0 +1,283 @@
+"""Local stand-in for the slice of the HubSpot API this project uses.
+
+Serves a deterministic synthetic portal so the fetch stages can be run and
+timed without network access:
+
+    python -m src.hubspot_standin --deals 5000 --port 8900 --rps 10
+    HUBSPOT_BASE_URL=http://127.0.0.1:8900 python daily_main.py
+
+Covers owners, deal list/search (filters, paging, the 10k search ceiling),
+deal/contact/activity batch reads, v4 associations and secondly rate
+limiting (429 once --rps requests arrive within one second).
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, jsonify, request
+
+SEARCH_RESULT_CEILING = 10000
+ASSOCIATION_PAGE_SIZE = 500
+ENGAGEMENT_TYPES = ["notes", "calls", "emails", "meetings", "tasks"]
+IGNORED_STAGE_SAMPLE = ["996085343", "995921567", "995964762", "998316459"]
+OPEN_STAGES = ["appointmentscheduled", "qualifiedtobuy", "presentationscheduled", "decisionmakerboughtin"]
+DATETIME_PROPERTIES = {"createdate", "hs_lastmodifieddate", "notes_last_updated", "hubspot_owner_assigneddate", "hs_timestamp"}
+
+
+def iso(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def to_ms(value):
+    if value is None:
+        return None
+    if str(value).isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+class Portal:
+    """Synthetic CRM data, generated once from a seed"""
+
+    def __init__(self, deals=2000, seed=7, owner_file="owner_manager.json"):
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+
+        emails = []
+        if os.path.exists(owner_file):
+            with open(owner_file, encoding="utf-8") as file:
+                emails = list(json.load(file))
+        emails = emails or [f"owner{i}@example.com" for i in range(20)]
+        self.owners = [
+            {"id": str(1000 + i), "email": email, "firstName": email.split("@")[0].split(".")[0].capitalize()}
+            for i, email in enumerate(emails)
+        ]
+
+        self.deals = {}
+        self.history = {}
+        self.contacts = {}
+        self.associations = {object_type: {} for object_type in ["contacts"] + ENGAGEMENT_TYPES}
+        self.activities = {object_type: {} for object_type in ENGAGEMENT_TYPES}
+        next_id = 1
+
+        for i in range(deals):
+            deal_id = str(5_000_000 + i)
+            created = now - timedelta(days=rng.uniform(0, 3 * 365))
+            assigned = created + timedelta(hours=rng.uniform(0, 48))
+            modified = min(now, assigned + timedelta(days=rng.expovariate(1 / 30)))
+            deal_type = rng.choice(["true", "true", "false", "cold", None])
+            self.deals[deal_id] = {
+                "dealname": f"Deal {i}",
+                "hubspot_owner_id": rng.choice(self.owners)["id"] if rng.random() > 0.02 else None,
+                "createdate": iso(created),
+                "hs_lastmodifieddate": iso(modified),
+                "notes_last_updated": iso(modified - timedelta(hours=rng.uniform(0, 96))),
+                "deal_type__hot__warm___cold_": deal_type,
+                "hubspot_owner_assigneddate": iso(assigned),
+                "source_of_the_deal": "Marketing" if rng.random() < 0.7 else "Sales",
+                "dealstage": rng.choice(IGNORED_STAGE_SAMPLE) if rng.random() < 0.1 else rng.choice(OPEN_STAGES),
+                "amount": str(rng.choice([0, 500, 2500, 10000, 50000])),
+            }
+            self.history[deal_id] = [
+                {"value": rng.choice(["true", "false", "cold"]), "timestamp": iso(modified - timedelta(hours=h)), "sourceType": "CRM_UI"}
+                for h in sorted(rng.sample(range(1, 200), rng.randint(1, 3)))
+            ]
+
+            contact_ids = []
+            for _ in range(rng.choice([0, 1, 1, 2, 3])):
+                contact_id = str(next_id)
+                next_id += 1
+                self.contacts[contact_id] = {
+                    "firstname": rng.choice(["Asha", "Ravi", "Meera", "Arjun", "Kiran"]),
+                    "lastname": rng.choice(["Sharma", "Iyer", "Khan", "Das", "Rao"]),
+                    "email": f"contact{contact_id}@example.com",
+                    "jobtitle": rng.choice(["", "Head of Supply Chain", "CFO", "Founder", None]),
+                }
+                contact_ids.append(contact_id)
+            self.associations["contacts"][deal_id] = contact_ids
+            self.deals[deal_id]["num_associated_contacts"] = str(len(contact_ids))
+
+            for object_type in ENGAGEMENT_TYPES:
+                ids = []
+                # A few very busy deals exercise association paging
+                count = rng.choice([0, 0, 1, 2, 4]) if rng.random() > 0.002 else 700
+                for _ in range(count):
+                    activity_id = str(next_id)
+                    next_id += 1
+                    ts = assigned + timedelta(hours=rng.uniform(0, 24 * 20))
+                    props = {"hs_timestamp": iso(ts), "hs_lastmodifieddate": iso(ts)}
+                    if object_type == "notes":
+                        props["hs_note_body"] = f"<div><p>Spoke to the client about <b>{deal_id}</b> &amp; next steps.</p></div>"
+                    self.activities[object_type][activity_id] = props
+                    ids.append(activity_id)
+                if ids:
+                    self.associations[object_type][deal_id] = ids
+
+
+class SecondlyLimit:
+    def __init__(self, rps):
+        self.rps = rps
+        self.window = int(time.time())
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        if not self.rps:
+            return True
+        with self.lock:
+            now = int(time.time())
+            if now != self.window:
+                self.window, self.count = now, 0
+            self.count += 1
+            return self.count <= self.rps
+
+
+def matches(props, flt):
+    name, operator = flt["propertyName"], flt["operator"]
+    actual = props.get(name)
+    if operator == "HAS_PROPERTY":
+        return actual not in (None, "")
+    if operator == "NOT_HAS_PROPERTY":
+        return actual in (None, "")
+    if operator in ("IN", "NOT_IN"):
+        found = actual in flt.get("values", [])
+        return found if operator == "IN" else not found
+    expected = flt.get("value")
+    if name in DATETIME_PROPERTIES:
+        actual, expected = to_ms(actual), to_ms(expected)
+        if actual is None:
+            return operator == "NEQ"
+    return {
+        "EQ": lambda: actual == expected,
+        "NEQ": lambda: actual != expected,
+        "GT": lambda: actual > expected,
+        "GTE": lambda: actual >= expected,
+        "LT": lambda: actual < expected,
+        "LTE": lambda: actual <= expected,
+    }[operator]()
+
+
+def create_app(portal, rps=10):
+    app = Flask(__name__)
+    limit = SecondlyLimit(rps)
+
+    @app.before_request
+    def rate_limit():
+        if not limit.allow():
+            return jsonify({"status": "error", "message": "You have reached your secondly limit.", "errorType": "RATE_LIMIT"}), 429
+
+    def page(items, default_limit=100, max_limit=100):
+        size = min(int(request.args.get("limit", default_limit)), max_limit)
+        start = int(request.args.get("after", 0) or 0)
+        body = {"results": items[start:start + size]}
+        if start + size < len(items):
+            body["paging"] = {"next": {"after": str(start + size)}}
+        return body
+
+    def deal_object(deal_id, properties):
+        props = portal.deals[deal_id]
+        return {"id": deal_id, "properties": {p: props.get(p) for p in properties}, "archived": False}
+
+    @app.get("/crm/v3/owners")
+    def owners():
+        return jsonify(page(portal.owners))
+
+    @app.get("/crm/v3/owners/<owner_id>")
+    def owner(owner_id):
+        found = next((o for o in portal.owners if o["id"] == owner_id), None)
+        return (jsonify(found), 200) if found else (jsonify({"message": "Not found"}), 404)
+
+    @app.get("/crm/v3/objects/deals")
+    def list_deals():
+        properties = request.args.get("properties", "dealname").split(",")
+        return jsonify(page([deal_object(d, properties) for d in portal.deals]))
+
+    @app.get("/crm/v3/objects/deals/<deal_id>")
+    def get_deal(deal_id):
+        if deal_id not in portal.deals:
+            return jsonify({"message": "Not found"}), 404
+        body = deal_object(deal_id, request.args.get("properties", "dealname").split(","))
+        if request.args.get("propertiesWithHistory"):
+            body["propertiesWithHistory"] = {"deal_type__hot__warm___cold_": portal.history[deal_id]}
+        return jsonify(body)
+
+    @app.post("/crm/v3/objects/deals/search")
+    def search_deals():
+        payload = request.get_json()
+        groups = payload.get("filterGroups") or [{"filters": []}]
+        hits = [
+            deal_id for deal_id, props in portal.deals.items()
+            if any(all(matches(props, f) for f in group["filters"]) for group in groups)
+        ]
+        for sort in reversed(payload.get("sorts", [])):
+            key = sort["propertyName"]
+            hits.sort(key=lambda d: (to_ms(portal.deals[d].get(key)) or 0) if key in DATETIME_PROPERTIES else (portal.deals[d].get(key) or ""),
+                      reverse=sort.get("direction") == "DESCENDING")
+        size = min(int(payload.get("limit", 10)), 200)
+        start = int(payload.get("after", 0) or 0)
+        if start + size > SEARCH_RESULT_CEILING:
+            return jsonify({"status": "error", "message": "Search results are limited to 10000"}), 400
+        body = {"total": len(hits), "results": [deal_object(d, payload.get("properties", [])) for d in hits[start:start + size]]}
+        if start + size < min(len(hits), SEARCH_RESULT_CEILING):
+            body["paging"] = {"next": {"after": str(start + size)}}
+        return jsonify(body)
+
+    @app.post("/crm/v3/objects/<object_type>/batch/read")
+    def batch_read(object_type):
+        payload = request.get_json()
+        ids = [i["id"] for i in payload.get("inputs", [])][:100]
+        properties = payload.get("properties", [])
+        results = []
+        for object_id in ids:
+            if object_type == "deals" and object_id in portal.deals:
+                result = deal_object(object_id, properties)
+                if payload.get("propertiesWithHistory"):
+                    result["propertiesWithHistory"] = {"deal_type__hot__warm___cold_": portal.history[object_id]}
+            elif object_type == "contacts" and object_id in portal.contacts:
+                result = {"id": object_id, "properties": {p: portal.contacts[object_id].get(p) for p in properties}}
+            elif object_type in portal.activities and object_id in portal.activities[object_type]:
+                result = {"id": object_id, "properties": {p: portal.activities[object_type][object_id].get(p) for p in properties}}
+            else:
+                continue
+            results.append(result)
+        return jsonify({"status": "COMPLETE", "results": results}), 200 if len(results) == len(ids) else 207
+
+    @app.post("/crm/v4/associations/deals/<object_type>/batch/read")
+    def batch_associations(object_type):
+        linked = portal.associations.get(object_type, {})
+        results = []
+        for item in request.get_json().get("inputs", [])[:100]:
+            ids = linked.get(item["id"], [])
+            if not ids:
+                continue
+            result = {
+                "from": {"id": item["id"]},
+                "to": [{"toObjectId": int(i), "associationTypes": [{"category": "HUBSPOT_DEFINED"}]} for i in ids[:ASSOCIATION_PAGE_SIZE]]
+            }
+            if len(ids) > ASSOCIATION_PAGE_SIZE:
+                result["paging"] = {"next": {"after": str(ASSOCIATION_PAGE_SIZE)}}
+            results.append(result)
+        return jsonify({"status": "COMPLETE", "results": results}), 207
+
+    @app.get("/crm/v4/objects/deals/<deal_id>/associations/<object_type>")
+    def deal_associations(deal_id, object_type):
+        ids = portal.associations.get(object_type, {}).get(deal_id, [])
+        return jsonify(page([{"toObjectId": int(i)} for i in ids], ASSOCIATION_PAGE_SIZE, ASSOCIATION_PAGE_SIZE))
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic HubSpot portal locally")
+    parser.add_argument("--deals", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--rps", type=int, default=10, help="requests per second before 429s (0 = unlimited)")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+
+    print(f"🧪 Generating stand-in portal with {args.deals} deals...")
+    create_app(Portal(args.deals, args.seed), args.rps).run(host="127.0.0.1", port=args.port, threaded=True)
@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+
+# DEBUG, INFO, WARNING, ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for people, "json" for log collectors
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Per-deal trace lines are off unless LOG_DEALS=1; then LOG_DEAL_SAMPLE of deals (0-1) are traced
+LOG_DEALS = os.getenv("LOG_DEALS", "0") == "1"
+LOG_DEAL_SAMPLE = float(os.getenv("LOG_DEAL_SAMPLE", "1"))
+
+ROOT = "pm"
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.name[len(ROOT) + 1:] or ROOT}: {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BufferedHandler(logging.handlers.QueueHandler):
+    """Hands records to a background writer thread so stages never block on stdout.
+
+    Analysis worker processes inherit this handler without the writer thread,
+    so records from another process are written directly instead.
+    """
+
+    def __init__(self, records, direct):
+        super().__init__(records)
+        self.pid = os.getpid()
+        self.direct = direct
+
+    def emit(self, record):
+        if os.getpid() != self.pid:
+            self.direct.handle(record)
+        else:
+            super().emit(record)
+
+
+def _setup():
+    logger = logging.getLogger(ROOT)
+    if logger.handlers:
+        return logger
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, stream)
+    listener.start()
+    # Flush whatever is still buffered when the run exits
+    atexit.register(listener.stop)
+    logger.addHandler(BufferedHandler(records, stream))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    logging.getLogger(f"{ROOT}.deal").setLevel(logging.DEBUG if LOG_DEALS else logging.CRITICAL + 1)
+    return logger
+
+
+def get_logger(name):
+    _setup()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+deal_log = get_logger("deal")
+
+
+def sampled(deal_id):
+    """Whether a deal is in the traced sample; by id, so all of a deal's lines are kept together"""
+    if LOG_DEAL_SAMPLE >= 1:
+        return True
+    return zlib.crc32(str(deal_id).encode()) % 10000 < LOG_DEAL_SAMPLE * 10000
+
+
+def trace(deal_id, message, *args, **fields):
+    """Per-deal debug line; free when tracing is off, since nothing is formatted"""
+    if LOG_DEALS and sampled(deal_id):
+        fields["deal_id"] = deal_id
+        deal_log.debug(message, *args, extra={"fields": fields})
+
+
+@contextmanager
+def stage(logger, name, **fields):
+    """Time a stage and log one summary line for it.
+
+    The yielded dict collects counts while the stage runs; they are logged
+    with its duration when it ends (or fails).
+    """
+    counts = dict(fields)
+    started = time.perf_counter()
+    try:
+        yield counts
+    except Exception:
+        counts["seconds"] = round(time.perf_counter() - started, 2)
+        logger.exception(f"❌ {name} failed", extra={"fields": counts})
+        raise
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"⏱️ {name} done", extra={"fields": counts})
@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from src.storage import cache_path
+
+METRIC_HISTORY_FILE = cache_path("metric_history.sqlite")
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(day):
+    return (day - EPOCH).days
+
+
+def day_from_number(number):
+    return EPOCH + timedelta(days=number)
+
+
+def today_utc():
+    return datetime.now(timezone.utc).date()
+
+
+class MetricHistory:
+    """Per-day, per-owner metric counts of the daily runs, kept in SQLite.
+
+    Each (owner, metric) pair is a series with a small integer id, and each
+    day's count is one (day, series, count) row with days stored as integers
+    since 1970-01-01, so a year of history stays small. The primary key
+    clusters rows by day for range rollups and a second index serves
+    per-owner trends, so weekly reporting reads history locally instead of
+    refetching deals from HubSpot. Re-running a day replaces its counts.
+    """
+
+    def __init__(self, path=METRIC_HISTORY_FILE):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS metric_series (
+                    id INTEGER PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    UNIQUE (owner, metric)
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS metric_counts (
+                    day INTEGER NOT NULL,
+                    series INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, series)
+                ) WITHOUT ROWID""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS metric_counts_series ON metric_counts (series, day)")
+        self.series = {(owner, metric): series for series, owner, metric in self.conn.execute(
+            "SELECT id, owner, metric FROM metric_series"
+        )}
+
+    def _series_id(self, owner, metric):
+        series = self.series.get((owner, metric))
+        if series is None:
+            series = self.conn.execute(
+                "INSERT INTO metric_series (owner, metric) VALUES (?, ?)", (owner, metric)
+            ).lastrowid
+            self.series[(owner, metric)] = series
+        return series
+
+    def record(self, metrics_by_owner, day=None):
+        """Store one run's {owner: {metric: [count, names]}} (or plain counts) for a day"""
+        number = day_number(day or today_utc())
+        with self.lock, self.conn:
+            rows = [
+                (number, self._series_id(owner, metric), value[0] if isinstance(value, (list, tuple)) else int(value))
+                for owner, metrics in metrics_by_owner.items()
+                for metric, value in metrics.items()
+            ]
+            self.conn.execute("DELETE FROM metric_counts WHERE day = ?", (number,))
+            self.conn.executemany("INSERT INTO metric_counts (day, series, count) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def days(self, start, end):
+        """Days in [start, end] that have a recorded run"""
+        rows = self.conn.execute(
+            "SELECT DISTINCT day FROM metric_counts WHERE day BETWEEN ? AND ? ORDER BY day",
+            (day_number(start), day_number(end))
+        )
+        return [day_from_number(number) for (number,) in rows]
+
+    def range(self, start, end, owner=None):
+        """[(day, owner, metric, count)] for start..end inclusive, optionally for one owner"""
+        query = (
+            "SELECT c.day, s.owner, s.metric, c.count FROM metric_counts c JOIN metric_series s ON s.id = c.series "
+            "WHERE c.day BETWEEN ? AND ?"
+        )
+        params = [day_number(start), day_number(end)]
+        if owner is not None:
+            query += " AND s.owner = ?"
+            params.append(owner)
+        rows = self.conn.execute(query + " ORDER BY c.day, s.owner, s.metric", params)
+        return [(day_from_number(number), o, metric, count) for number, o, metric, count in rows]
+
+    def rollup(self, start, end):
+        """{owner: {metric: summed count}} over start..end inclusive"""
+        rows = self.conn.execute(
+            "SELECT s.owner, s.metric, t.total FROM ("
+            "SELECT series, SUM(count) AS total FROM metric_counts WHERE day BETWEEN ? AND ? GROUP BY series"
+            ") t JOIN metric_series s ON s.id = t.series",
+            (day_number(start), day_number(end))
+        )
+        totals = {}
+        for owner, metric, total in rows:
+            totals.setdefault(owner, {})[metric] = total
+        return totals
+
+    def week_over_week(self, end=None):
+        """{owner: {metric: (last 7 days, the 7 days before)}} ending on `end` (today)"""
+        end = end or today_utc()
+        current = self.rollup(end - timedelta(days=6), end)
+        previous = self.rollup(end - timedelta(days=13), end - timedelta(days=7))
+        return {
+            owner: {
+                metric: (current.get(owner, {}).get(metric, 0), previous.get(owner, {}).get(metric, 0))
+                for metric in set(current.get(owner, {})) | set(previous.get(owner, {}))
+            }
+            for owner in set(current) | set(previous)
+        }
+
+    def trend(self, owner, days=30, end=None):
+        """{metric: [count per day]} for one owner's last `days` days; None where no run was recorded"""
+        end = end or today_utc()
+        start = end - timedelta(days=days - 1)
+        series = {}
+        for day, _, metric, count in self.range(start, end, owner=owner):
+            series.setdefault(metric, [None] * days)[(day - start).days] = count
+        # A run without a row for this owner flagged nothing for them
+        for day in self.days(start, end):
+            for values in series.values():
+                if values[(day - start).days] is None:
+                    values[(day - start).days] = 0
+        return series
+
+    def summary(self, end=None, days=30):
+        """{owner: {metric: (last 7 days, previous 7 days, daily average over `days`)}} for reports"""
+        end = end or today_utc()
+        start = end - timedelta(days=days - 1)
+        run_days = len(self.days(start, end)) or 1
+        month = self.rollup(start, end)
+        return {
+            owner: {
+                metric: (week, previous, month.get(owner, {}).get(metric, 0) / run_days)
+                for metric, (week, previous) in metrics.items()
+            }
+            for owner, metrics in self.week_over_week(end).items()
+        }
@@ -0,0 +1,106 @@
+import html
+import os
+import re
+import sqlite3
+import threading
+
+from bs4 import BeautifulSoup
+
+from src.storage import cache_path
+
+NOTE_CACHE_FILE = cache_path("note_text.sqlite")
+# auto: regex extractor for simple markup, BeautifulSoup otherwise; "bs4" forces the full parser
+NOTE_PARSER = os.getenv("NOTE_PARSER", "auto")
+
+TAG_RE = re.compile(r"<[^>]*>")
+# Markup whose text BeautifulSoup treats specially, so a regex strip would differ
+COMPLEX_MARKUP_RE = re.compile(r"<(?:script|style|textarea|!--|!\[CDATA\[|\?)", re.IGNORECASE)
+
+
+def light_extract(body):
+    return html.unescape(TAG_RE.sub("", body)).strip()
+
+
+def soup_extract(body):
+    return BeautifulSoup(body, "html.parser").get_text().strip()
+
+
+def extract_text(body):
+    if NOTE_PARSER != "bs4" and not COMPLEX_MARKUP_RE.search(body):
+        return light_extract(body)
+    return soup_extract(body)
+
+
+class NoteTextCache:
+    """Extracted note text keyed by engagement id and last-modified time."""
+
+    def __init__(self, path=NOTE_CACHE_FILE):
+        self.path = path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            with self.conn:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS notes (id TEXT PRIMARY KEY, modified TEXT, text TEXT NOT NULL)"
+                )
+        return self.conn
+
+    def text_for(self, note_id, modified, body):
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute("SELECT modified, text FROM notes WHERE id = ?", (note_id,)).fetchone()
+            if row and row[0] == modified:
+                return row[1]
+            text = extract_text(body)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO notes VALUES (?, ?, ?)", (note_id, modified, text))
+            return text
+
+    # sqlite connections can't cross process boundaries; reconnect lazily instead
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+
+note_cache = NoteTextCache()
+
+
+class LazyNoteText:
+    """Latest note of a deal, turned into text only when something reads it.
+
+    Only alerted deals end up in a report, so most notes are never parsed;
+    the ones that are get memoized in note_cache across runs.
+    """
+
+    __slots__ = ("note_id", "modified", "body", "text")
+
+    def __init__(self, note_id, modified, body):
+        self.note_id = note_id
+        self.modified = modified
+        self.body = body
+        self.text = None
+
+    def __str__(self):
+        if self.text is None:
+            self.text = note_cache.text_for(self.note_id, self.modified, self.body) or "N/A"
+        return self.text
+
+    def __getitem__(self, key):
+        return str(self)[key]
+
+    def __len__(self):
+        return len(str(self))
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return f"LazyNoteText({self.note_id!r})"
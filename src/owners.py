@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+from src.hubspot import BASE_URL, HEADERS, safe_get
+from src.log import get_logger
+from src.storage import cache_path, load_json, save_json
+
+OWNER_CACHE_FILE = cache_path("owners.json")
+OWNER_CACHE_TTL = int(os.getenv("OWNER_CACHE_TTL", str(24 * 3600)))
+
+log = get_logger("owners")
+
+def fetch_all_owners():
+    """Page through /crm/v3/owners and return {owner_id: email}, or None on failure"""
+    owners = {}
+    after = None
+    while True:
+        url = f"{BASE_URL}/crm/v3/owners?limit=100"
+        if after:
+            url += f"&after={after}"
+        response = safe_get(url, HEADERS)
+        if not response or response.status_code != 200:
+            log.error("❌ Failed to load owner directory page")
+            return None
+
+        data = response.json()
+        for owner in data.get("results", []):
+            owners[str(owner["id"])] = owner.get("email")
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            return owners
+
+
+class OwnerDirectory:
+    """Owner id -> email map shared by the daily and weekly jobs.
+
+    The full directory is persisted to disk; a fresh copy is served without
+    any API call, a stale copy is served immediately while a background
+    thread reloads it, and only a cold start blocks on HubSpot.
+    """
+
+    def __init__(self, path=OWNER_CACHE_FILE, ttl=OWNER_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.owners = None
+        self.fetched_at = 0
+        self.lock = threading.RLock()
+        self.refresh_thread = None
+        self.refreshed_this_run = False
+
+    def _load(self):
+        if self.owners is not None:
+            return
+        cached = load_json(self.path) or {}
+        self.owners = cached.get("owners")
+        self.fetched_at = cached.get("fetched_at", 0)
+
+        if self.owners is None:
+            log.info("📇 No owner directory cached, loading from HubSpot...")
+            self.refresh()
+        elif time.time() - self.fetched_at > self.ttl:
+            log.info("📇 Owner directory is stale, refreshing in background...")
+            self.refresh_thread = threading.Thread(target=self.refresh, daemon=True)
+            self.refresh_thread.start()
+
+    def refresh(self):
+        owners = fetch_all_owners()
+        with self.lock:
+            self.refreshed_this_run = True
+            if owners is None:
+                self.owners = self.owners or {}
+                return
+            self.owners = owners
+            self.fetched_at = time.time()
+            save_json(self.path, {"fetched_at": self.fetched_at, "owners": owners})
+        log.info(f"📇 Owner directory loaded ({len(owners)} owners)")
+
+    def _refresh_on_miss(self, owner_ids):
+        """Reload once per run if a cached directory lacks any of owner_ids"""
+        with self.lock:
+            self._load()
+            if self.refreshed_this_run or all(str(owner_id) in self.owners for owner_id in owner_ids):
+                return
+        # Unknown id on a cached directory: an owner was probably added since
+        # the last refresh, so reload once for this run.
+        self.wait()
+        if not self.refreshed_this_run:
+            self.refresh()
+
+    def email_for(self, owner_id):
+        if not owner_id:
+            return None
+        self._refresh_on_miss([owner_id])
+        with self.lock:
+            return self.owners.get(str(owner_id))
+
+    def email_map(self, owner_ids=()):
+        """{owner_id: email}; pass the ids about to be looked up to get the
+        same reload-on-miss as email_for"""
+        self._refresh_on_miss([owner_id for owner_id in owner_ids if owner_id])
+        with self.lock:
+            return dict(self.owners)
+
+    def wait(self):
+        if self.refresh_thread is not None:
+            self.refresh_thread.join()
+
+
+owner_directory = OwnerDirectory()
@@ -0,0 +1,261 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from src.analyze_deals import analyze_shard, load_previous, merge_shard_results
+from src.deal_store import DealStore
+from src.deal_table import DealTable
+from src.engagements_async import fetch_engagements_for_deals
+from src.fetch_deals import build_deal_row, enrich_with_history, plan_marketing_sync, split_by_source, store_record
+from src.log import get_logger
+from src.search_plan import DAY_MS
+from src.sharding import ANALYSIS_WORKERS, MIN_DEALS_PER_WORKER
+
+# Batches waiting between two stages; a full queue pauses the stage feeding it
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+# Stored (unchanged) deals are replayed in batches of this size
+PIPELINE_BATCH = int(os.getenv("PIPELINE_BATCH", "200"))
+
+DONE = object()
+
+log = get_logger("pipeline")
+
+
+class DailyPipeline:
+    """Fetch -> enrich -> engagements -> analyze, overlapped.
+
+    Each stage is a thread joined to the next by a bounded queue, so search
+    pages are enriched and their engagements fetched while later pages are
+    still downloading, and the caller's thread analyzes batches as soon as
+    they are complete. With ANALYSIS_WORKERS > 1, every
+    MIN_DEALS_PER_WORKER ready deals go to a worker process instead.
+    Deals come back grouped by owner in the stage-by-stage run's order,
+    with the same results.
+    """
+
+    def __init__(self, exclude_owner_emails=(), state=None, now=None):
+        self.excluded = {email.lower() for email in exclude_owner_emails}
+        self.exclude_owner_emails = exclude_owner_emails
+        self.state = state
+        self.now = now
+        self.store = DealStore()
+        self.table = DealTable()
+        self.pages = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.rows = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.ready = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.failures = []
+        self.changed_ids = []
+        self.stage_seconds = {}
+        self.stage_counts = {}
+        # The enrich and engagement stages write the table while analysis copies rows out of it
+        self.table_lock = threading.Lock()
+        self.first_alert = None
+        self.run_started = None
+
+    def _stage(self, name, inbox, outbox, work):
+        """Thread feeding inbox batches to work() and its result to outbox.
+
+        Whatever has queued up while the previous call ran is handed over in
+        one call, so a stage that falls behind catches up with fewer, larger
+        API batches. After any stage fails it only drains its inbox.
+        """
+        def loop():
+            busy, done = 0.0, False
+            try:
+                while not done:
+                    items = [inbox.get()]
+                    while items[-1] is not DONE:
+                        try:
+                            items.append(inbox.get_nowait())
+                        except queue.Empty:
+                            break
+                    if items[-1] is DONE:
+                        items.pop()
+                        done = True
+                    if self.failures or not items:
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        result = work(items)
+                    except Exception as e:
+                        self.failures.append((name, e))
+                        continue
+                    finally:
+                        busy += time.perf_counter() - started
+                    outbox.put(result)
+            finally:
+                self.stage_seconds[name] = busy
+                outbox.put(DONE)
+        thread = threading.Thread(target=loop, name=f"pipeline-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _count(self, name, n):
+        self.stage_counts[name] = self.stage_counts.get(name, 0) + n
+
+    def _fetch(self, scope, plan, since_ms, started_ms):
+        seen, left, lock = set(), [], threading.Lock()
+
+        def on_page(records):
+            with lock:
+                fresh = [r for r in records if r["id"] not in seen]
+                seen.update(r["id"] for r in fresh)
+                fresh, gone = split_by_source(fresh)
+                left.extend(gone)
+            if fresh:
+                self.pages.put(("changed", fresh))
+
+        started = time.perf_counter()
+        try:
+            # createdate shards run up to a day ahead so deals created mid-run are not cut off
+            changed = plan.fetch(until_ms=started_ms + DAY_MS, on_page=on_page)
+            if changed is None:
+                self.failures.append(("fetch", RuntimeError("deal search failed")))
+                return
+            changed, _ = split_by_source(changed)
+            self.changed_ids = [d["id"] for d in changed]
+            self._count("fetch", len(changed))
+            # Deals whose source changed stay in seen, so the replay below skips them too
+            self.store.delete(scope, left)
+            if since_ms is not None:
+                # Unchanged deals come from the store, one finished read per batch: a cursor left
+                # open while put() waits on a full queue would lock out enrich's upserts
+                stored = [deal_id for deal_id in self.store.ids(scope) if deal_id not in seen]
+                for start in range(0, len(stored), PIPELINE_BATCH):
+                    self.pages.put(("stored", self.store.records(scope, stored[start:start + PIPELINE_BATCH])))
+        except Exception as e:
+            self.failures.append(("fetch", e))
+        finally:
+            self.stage_seconds["fetch"] = time.perf_counter() - started
+            self.pages.put(DONE)
+
+    def _enrich(self, scope, items):
+        changed = [record for kind, records in items if kind == "changed" for record in records]
+        if changed:
+            enrich_with_history(changed)
+            self.store.upsert(scope, [store_record(d) for d in changed])
+        # Rows enter the table in arrival order, which the engagement column relies on
+        records = [store_record(d) if kind == "changed" else d for kind, batch in items for d in batch]
+        with self.table_lock:
+            rows = [row for row in (build_deal_row(self.table, record) for record in records) if row is not None]
+        included = [row for row in rows if row["owner_email"].lower() not in self.excluded]
+        self._count("enrich", len(included))
+        return rows, included
+
+    def _engage(self, items):
+        rows = [row for batch, _ in items for row in batch]
+        included = [row for _, batch in items for row in batch]
+        results = fetch_engagements_for_deals(included) if included else {}
+        # Every appended row needs its (possibly empty) slot to keep the column in table order
+        with self.table_lock:
+            self.table.add_engagements(rows, results)
+        self._count("engagements", len(included))
+        return included
+
+    def _detached(self, rows):
+        """Copies of rows in a table of their own, safe to pickle while the stages keep appending"""
+        with self.table_lock:
+            part = self.table.take([row.index for row in rows])
+            part.strings = self.table.strings.copy()
+        return part.rows()
+
+    def _analyzed(self, result):
+        if self.first_alert is None and any(alerts for alerts, _, _ in result[0].values()):
+            self.first_alert = time.perf_counter() - self.run_started
+            log.info(f"🚨 First alert after {self.first_alert:.1f}s")
+        return result
+
+    def run(self):
+        """(deals, alerts_by_deal, metrics_by_owner), or None if the deal search failed"""
+        self.run_started = run_started = time.perf_counter()
+        started_ms = int(time.time() * 1000)
+        now = self.now or datetime.now(timezone.utc)
+        scope, plan, since_ms = plan_marketing_sync(self.store, self.exclude_owner_emails)
+        previous = load_previous(self.state)
+        has_history = bool(previous)
+
+        # Workers are spawned, not forked: the stage threads are already running when they start
+        pool = None
+        if ANALYSIS_WORKERS > 1:
+            pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+        threading.Thread(target=self._fetch, args=(scope, plan, since_ms, started_ms), daemon=True).start()
+        self._stage("enrich", self.pages, self.rows, lambda items: self._enrich(scope, items))
+        self._stage("engagements", self.rows, self.ready, self._engage)
+
+        def analyze_here(batch):
+            return self._analyzed(analyze_shard(batch, now, None, previous, has_history))
+
+        def analyze_in_pool(batch):
+            prior = {str(d["id"]): previous[str(d["id"])] for d in batch
+                     if str(d["id"]) in previous} if previous is not None else None
+            future = pool.submit(analyze_shard, self._detached(batch), now, None, prior, has_history)
+            future.add_done_callback(lambda done: done.exception() or self._analyzed(done.result()))
+            return future
+
+        shard_results, futures, pending, deals = [], [], [], []
+        analyze_seconds = 0.0
+        try:
+            while True:
+                batch = self.ready.get()
+                if batch is DONE:
+                    break
+                if self.failures or not batch:
+                    continue
+                deals.extend(batch)
+                started = time.perf_counter()
+                if pool is None:
+                    shard_results.append(analyze_here(batch))
+                else:
+                    pending.extend(batch)
+                    if len(pending) >= MIN_DEALS_PER_WORKER:
+                        futures.append(analyze_in_pool(pending))
+                        pending = []
+                analyze_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            if pending and not self.failures:
+                # The tail is too small to be worth a process
+                shard_results.append(analyze_here(pending))
+            for future in futures:
+                shard_results.append(future.result())
+            analyze_seconds += time.perf_counter() - started
+            if futures:
+                log.info(f"🧵 Analyzed {len(deals)} deals in {len(futures)} batch(es) over {ANALYSIS_WORKERS} processes")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        if self.failures:
+            for name, error in self.failures:
+                log.error(f"❌ Pipeline stage {name} failed: {error}")
+            return None
+
+        self.store.finish_sync(scope, started_ms, full=since_ms is None, seen_ids=self.changed_ids)
+        log.info(f"💾 Synced {len(self.changed_ids)} changed deal(s) into the local store")
+
+        # Stored (id) order grouped by owner, as the stage-by-stage run lists them in every report
+        deals.sort(key=lambda deal: int(deal["id"]))
+        by_owner = {}
+        for deal in deals:
+            by_owner.setdefault(deal["owner_email"], []).append(deal)
+        deals = [deal for owner_deals in by_owner.values() for deal in owner_deals]
+        alert_map, metrics_by_owner = merge_shard_results(deals, shard_results, state=self.state, previous=previous)
+        self.stage_seconds["analyze"] = analyze_seconds
+        self._count("analyze", len(deals))
+        for name in ("fetch", "enrich", "engagements", "analyze"):
+            log.info(f"⏱️ {name} done", extra={"fields": {
+                "deals": self.stage_counts.get(name, 0), "busy_seconds": round(self.stage_seconds.get(name, 0.0), 2),
+            }})
+        log.info("⏱️ Pipeline done", extra={"fields": {
+            "deals": len(deals), "alerts": len(alert_map), "seconds": round(time.perf_counter() - run_started, 2),
+        }})
+        return deals, alert_map, metrics_by_owner
+
+
+def run_daily_pipeline(exclude_owner_emails=(), state=None, now=None):
+    return DailyPipeline(exclude_owner_emails, state, now).run()
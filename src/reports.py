@@ -0,0 +1,68 @@
+import string
+
+from src.attachments import CsvReport
+
+
+class HtmlTemplate:
+    """Markup with {name} slots, parsed once when the module loads.
+
+    render() only joins the static pieces with the values, so a body
+    shared by every recipient is not re-parsed or rebuilt per email.
+    """
+
+    def __init__(self, text):
+        self.parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+
+    def render(self, **values):
+        return "".join(literal + (str(values[field]) if field is not None else "") for literal, field in self.parts)
+
+    def render_rows(self, rows):
+        """The template rendered once per dict in rows, concatenated"""
+        return "".join(self.render(**row) for row in rows)
+
+
+class CsvLayout:
+    """A report sheet's header and row builder, shared by every recipient"""
+
+    def __init__(self, header, row, **fmtparams):
+        self.header = header
+        self.row = row
+        self.fmtparams = fmtparams
+
+    def sheet(self, filename, rows):
+        report = CsvReport(filename, **self.fmtparams)
+        report.writerow(self.header)
+        report.writerows(rows)
+        return report.attachment()
+
+
+class RenderedRows:
+    """Every item's sheet row, built in one pass and grouped by owner.
+
+    Owner, team and summary attachments are all cut from these rows, so
+    each deal is formatted once however many reports it appears in.
+    """
+
+    def __init__(self, layout, items, owner_of):
+        self.layout = layout
+        self.rows = []
+        self.by_owner = {}
+        for item in items:
+            owner, row = owner_of(item), layout.row(item)
+            self.rows.append((owner, row))
+            self.by_owner.setdefault(owner, []).append(row)
+
+    def owners(self):
+        return list(self.by_owner)
+
+    def owner_sheet(self, owner, filename):
+        return self.layout.sheet(filename, self.by_owner.get(owner, []))
+
+    def sheet(self, filename, owners=None):
+        """All rows in their original order, or only those of the given owners"""
+        return self.layout.sheet(filename, (row for owner, row in self.rows if owners is None or owner in owners))
+
+
+def index_deals(grouped_deals):
+    """{deal id: deal} over {owner: [deals]}, built once per run"""
+    return {deal["id"]: deal for deals in grouped_deals.values() for deal in deals}
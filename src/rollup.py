@@ -0,0 +1,90 @@
+import os
+
+from src.storage import load_json
+
+# owner email -> manager email ("" for no manager)
+OWNER_MANAGER_FILE = os.getenv(
+    "OWNER_MANAGER_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "owner_manager.json")
+)
+
+
+def load_reporting_tree(path=OWNER_MANAGER_FILE):
+    """{owner: manager or None} with lowercased emails; {} if the file is missing"""
+    tree = load_json(path, {}) or {}
+    return {owner.strip().lower(): (manager or "").strip().lower() or None for owner, manager in tree.items()}
+
+
+def metric_count(value):
+    """Daily metrics are [count, deal names]; weekly counters are plain counts"""
+    return value[0] if isinstance(value, (list, tuple)) else value
+
+
+def add_counts(totals, counts):
+    for metric, count in counts.items():
+        totals[metric] = totals.get(metric, 0) + count
+
+
+class Rollup:
+    """Metric totals per owner, per manager's reporting tree and for the org.
+
+    Built in one pass over per-owner results: each owner's counts are added
+    to the owner, to the team of the owner and of every manager above them in
+    owner_manager.json, and to the org. A team covers its manager's own deals
+    and everyone below them. Excluded owners keep their own totals but count
+    towards no team and not the org, as the summaries have always left them out.
+    """
+
+    def __init__(self, counts_by_owner, managers=None, exclude=()):
+        self.managers = load_reporting_tree() if managers is None else managers
+        self.excluded = {email.lower() for email in exclude}
+        self.owners = {}
+        self.teams = {}
+        self.members = {}
+        self.org = {}
+        for owner, counts in counts_by_owner.items():
+            owner = owner.lower()
+            totals = {metric: metric_count(value) for metric, value in counts.items()}
+            self.owners[owner] = totals
+            if owner in self.excluded:
+                continue
+            add_counts(self.org, totals)
+            for lead in (owner, *self.chain(owner)):
+                add_counts(self.teams.setdefault(lead, {}), totals)
+                self.members.setdefault(lead, set()).add(owner)
+        self.direct_reports = {}
+        for owner, manager in self.managers.items():
+            if manager:
+                self.direct_reports.setdefault(manager, []).append(owner)
+
+    def chain(self, owner):
+        """Managers above an owner, nearest first; a loop in the file ends the chain"""
+        seen = {owner}
+        manager = self.managers.get(owner)
+        while manager and manager not in seen:
+            yield manager
+            seen.add(manager)
+            manager = self.managers.get(manager)
+
+    def owner(self, email):
+        return self.owners.get(email.lower(), {})
+
+    def team(self, manager):
+        return self.teams.get(manager.lower(), {})
+
+    def team_members(self, manager):
+        """Owners with results anywhere in a manager's tree, the manager included"""
+        return self.members.get(manager.lower(), set())
+
+    def leads(self):
+        """Managers whose tree has results from someone other than themselves"""
+        return sorted(m for m, members in self.members.items() if members - {m})
+
+    def digest(self, manager):
+        """[(name, totals)] for a manager's own deals, then each direct report's team"""
+        manager = manager.lower()
+        rows = [(manager, self.owner(manager))] if manager in self.owners else []
+        for report in sorted(self.direct_reports.get(manager, [])):
+            if report in self.teams:
+                rows.append((report, self.teams[report]))
+        return rows
@@ -0,0 +1,196 @@
+import hashlib
+import time
+
+from src.log import get_logger
+
+log = get_logger("rules")
+
+
+class Inputs(dict):
+    """Per-deal values; each input is computed on first use and then shared by every rule"""
+
+    def __init__(self, plan, deal, context):
+        super().__init__(context)
+        self.plan = plan
+        self.deal = deal
+
+    def __missing__(self, name):
+        provider = self.plan.providers[name]
+        nested_before = self.plan.input_total
+        started = time.perf_counter()
+        value = provider(self.deal, self)
+        # Inputs this one reads are timed on their own entries
+        elapsed = time.perf_counter() - started - (self.plan.input_total - nested_before)
+        self.plan.input_seconds[name] = self.plan.input_seconds.get(name, 0.0) + elapsed
+        self.plan.input_total += elapsed
+        self[name] = value
+        return value
+
+
+class Rule:
+    """One alert rule: the inputs it reads and a check returning its hit.
+
+    check(inputs) returns a falsy value for no hit, True for a hit without
+    an alert line, or one alert string / a list of them.
+    """
+
+    def __init__(self, name, needs, check, metric=None):
+        self.name = name
+        self.needs = tuple(needs)
+        self.check = check
+        self.metric = metric
+        self.trigger = None
+
+
+class RuleSet:
+    """Registry of input providers and rules for one analyzer"""
+
+    def __init__(self, name):
+        self.name = name
+        self.providers = {}
+        self.provider_needs = {}
+        self.rules = []
+
+    def input(self, name, needs=()):
+        def register(func):
+            self.providers[name] = func
+            self.provider_needs[name] = tuple(needs)
+            return func
+        return register
+
+    def rule(self, name, needs=(), metric=None):
+        def register(func):
+            self.rules.append(Rule(name, needs, func, metric))
+            return func
+        return register
+
+    def trigger(self, rule_name):
+        """Register when a rule's answer can next flip for a deal on the clock alone.
+
+        The function gets the deal's inputs and returns an epoch ms (or None)
+        from which the rule may answer differently with unchanged data.
+        """
+        def register(func):
+            rule = next(r for r in self.rules if r.name == rule_name)
+            rule.trigger = func
+            return func
+        return register
+
+    def compile(self, active=None, outputs=(), context=()):
+        """Plan one pass per deal over the active rules (all, by default).
+
+        Every input the rules and extra outputs need must have a provider or
+        come from the run context; that is checked here rather than mid-run.
+        """
+        rules = [r for r in self.rules if active is None or r.name in active]
+        resolved, order = set(context), []
+
+        def resolve(name, path):
+            if name in resolved:
+                return
+            if name not in self.providers:
+                raise KeyError(f"{self.name}: no provider for input '{name}' ({' -> '.join(path)})")
+            for need in self.provider_needs[name]:
+                resolve(need, path + (need,))
+            resolved.add(name)
+            order.append(name)
+
+        for rule in rules:
+            for need in rule.needs:
+                resolve(need, (rule.name, need))
+        for name in outputs:
+            resolve(name, (name,))
+        return RulePlan(self, rules, order, outputs)
+
+
+class RulePlan:
+    """Compiled rules for one run, with per-rule hit counts and timings"""
+
+    def __init__(self, ruleset, rules, inputs, outputs):
+        self.name = ruleset.name
+        self.providers = ruleset.providers
+        self.rules = rules
+        self.inputs = inputs
+        self.outputs = tuple(outputs)
+        self.hits = {rule.name: 0 for rule in rules}
+        self.rule_seconds = {rule.name: 0.0 for rule in rules}
+        self.input_seconds = {}
+        self.input_total = 0.0
+        self.deals = 0
+
+    def evaluate(self, deal, context):
+        """Run every rule on one deal -> (alert lines, metric keys hit, inputs)"""
+        values = Inputs(self, deal, context)
+        alerts, metrics = [], []
+        self.deals += 1
+        for rule in self.rules:
+            input_before = self.input_total
+            started = time.perf_counter()
+            try:
+                hit = rule.check(values)
+            except Exception as e:
+                log.error(f"❌ Rule {rule.name} failed for deal {deal.get('id', 'unknown')}: {e}")
+                hit = None
+            # Inputs first read by this rule are shared, so they are reported separately
+            elapsed = time.perf_counter() - started - (self.input_total - input_before)
+            self.rule_seconds[rule.name] += elapsed
+            if not hit:
+                continue
+            self.hits[rule.name] += 1
+            if rule.metric:
+                metrics.append(rule.metric)
+            if isinstance(hit, str):
+                alerts.append(hit)
+            elif isinstance(hit, list):
+                alerts.extend(hit)
+        for name in self.outputs:
+            values[name]
+        return alerts, metrics, values
+
+    def next_trigger(self, values, now_ms):
+        """Earliest registered clock threshold after now_ms for one evaluated deal, or None"""
+        upcoming = []
+        for rule in self.rules:
+            if rule.trigger:
+                at = rule.trigger(values)
+                if at is not None and at > now_ms:
+                    upcoming.append(at)
+        return min(upcoming, default=None)
+
+    def signature(self):
+        """Changes whenever the active rules, or the code they and their inputs run, change"""
+        digest = hashlib.sha1()
+        functions = [(name, self.providers[name]) for name in self.inputs]
+        for rule in self.rules:
+            functions.append((rule.name, rule.check))
+            if rule.trigger:
+                functions.append((rule.name, rule.trigger))
+        for name, func in functions:
+            digest.update(name.encode())
+            digest.update(func.__code__.co_code)
+            # Nested code objects repr with their address, so only plain constants are hashed
+            digest.update(repr([c for c in func.__code__.co_consts if not hasattr(c, "co_code")]).encode())
+        return digest.hexdigest()[:12]
+
+    def stats(self):
+        return self.deals, self.hits, self.rule_seconds, self.input_seconds
+
+    def add_stats(self, stats):
+        """Fold in the counters of the same plan run elsewhere (another process)"""
+        deals, hits, rule_seconds, input_seconds = stats
+        self.deals += deals
+        for name in self.hits:
+            self.hits[name] += hits.get(name, 0)
+            self.rule_seconds[name] += rule_seconds.get(name, 0.0)
+        for name, seconds in input_seconds.items():
+            self.input_seconds[name] = self.input_seconds.get(name, 0.0) + seconds
+            self.input_total += seconds
+
+    def report(self):
+        log.info(f"📐 {self.name} rules over {self.deals} deal(s)", extra={"fields": {
+            "shared_inputs_ms": round(self.input_total * 1000, 1),
+        }})
+        for rule in self.rules:
+            log.info(f"   - {rule.name}", extra={"fields": {
+                "hits": self.hits[rule.name], "ms": round(self.rule_seconds[rule.name] * 1000, 1),
+            }})
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from src.hubspot import BASE_URL, HEADERS, safe_post
+from src.log import get_logger
+from src.throttle import HUBSPOT_MAX_WORKERS
+
+log = get_logger("search")
+
+SEARCH_URL = f"{BASE_URL}/crm/v3/objects/deals/search"
+SEARCH_RESULT_CEILING = 10000  # search refuses to page past this many results
+SEARCH_PAGE_SIZE = 200
+SHARD_DAYS = int(os.getenv("DEAL_SEARCH_SHARD_DAYS", "90"))
+# Deals created before this date share one shard (split further if it overflows)
+SHARD_EPOCH = os.getenv("DEAL_SEARCH_EPOCH", "2020-01-01")
+MIN_SHARD_MS = 60 * 1000
+DAY_MS = 86400 * 1000
+
+
+class SearchPlan:
+    """Deal search compiled into server-side filters plus createdate shards.
+
+    Every exclusion becomes a NOT_IN filter so HubSpot never sends rows we
+    would drop, and the createdate range is cut into windows that are
+    fetched independently; a window that would hit the search result
+    ceiling is halved until it fits.
+    """
+
+    def __init__(self, properties, source=None, exclude_stages=(), exclude_owner_ids=(), modified_since_ms=None):
+        self.properties = list(properties)
+        self.scope_filters = []
+        if source:
+            self.scope_filters.append({"propertyName": "source_of_the_deal", "operator": "EQ", "value": source})
+        if exclude_stages:
+            self.scope_filters.append({"propertyName": "dealstage", "operator": "NOT_IN", "values": sorted(exclude_stages)})
+        if exclude_owner_ids:
+            self.scope_filters.append({"propertyName": "hubspot_owner_id", "operator": "NOT_IN", "values": sorted(exclude_owner_ids)})
+        self.filters = list(self.scope_filters)
+        if modified_since_ms is not None:
+            self.filters.append({"propertyName": "hs_lastmodifieddate", "operator": "GTE", "value": str(modified_since_ms)})
+
+    def signature(self):
+        """Stable id for the filters that decide which deals are in scope (ignores the watermark)"""
+        return hashlib.sha1(json.dumps(self.scope_filters, sort_keys=True).encode()).hexdigest()[:10]
+
+    def shards(self, until_ms, days=SHARD_DAYS):
+        epoch_ms = int(datetime.strptime(SHARD_EPOCH, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+        bounds = [0]
+        edge = epoch_ms
+        while edge < until_ms:
+            bounds.append(edge)
+            edge += days * DAY_MS
+        bounds.append(until_ms)
+        return list(zip(bounds, bounds[1:]))
+
+    def payload(self, start_ms, end_ms, after=None):
+        payload = {
+            "filterGroups": [{"filters": self.filters + [
+                {"propertyName": "createdate", "operator": "GTE", "value": str(start_ms)},
+                {"propertyName": "createdate", "operator": "LT", "value": str(end_ms)}
+            ]}],
+            "properties": self.properties,
+            "sorts": [{"propertyName": "createdate", "direction": "ASCENDING"}],
+            "limit": SEARCH_PAGE_SIZE
+        }
+        if after:
+            payload["after"] = after
+        return payload
+
+    def fetch_shard(self, start_ms, end_ms, on_page=None):
+        """All deals created in [start_ms, end_ms), or None if a page failed"""
+        deals = []
+        after = None
+        while True:
+            response = safe_post(SEARCH_URL, HEADERS, self.payload(start_ms, end_ms, after))
+            if not response or response.status_code != 200:
+                log.error(f"❌ Error fetching deals: {response.text if response is not None else 'no response'}")
+                return None
+
+            data = response.json()
+            if after is None and data.get("total", 0) > SEARCH_RESULT_CEILING:
+                if end_ms - start_ms > MIN_SHARD_MS:
+                    mid_ms = start_ms + (end_ms - start_ms) // 2
+                    log.info(f"✂️ Shard of {data['total']} deals is over the search ceiling, splitting it")
+                    left = self.fetch_shard(start_ms, mid_ms, on_page)
+                    right = self.fetch_shard(mid_ms, end_ms, on_page) if left is not None else None
+                    return None if right is None else left + right
+                log.error(
+                    f"❌ {data['total']} deals were created within {MIN_SHARD_MS // 1000}s of {start_ms}; "
+                    f"only the first {SEARCH_RESULT_CEILING} can be fetched, "
+                    f"{data['total'] - SEARCH_RESULT_CEILING} will be missing"
+                )
+
+            deals.extend(data.get("results", []))
+            if on_page:
+                on_page(data.get("results", []))
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                return deals
+
+    def fetch(self, until_ms, workers=HUBSPOT_MAX_WORKERS, on_page=None):
+        """Run every shard in parallel; None if any shard failed.
+
+        on_page(results) is called from the worker threads with each page as
+        it arrives, for callers that stream deals onwards.
+        """
+        shards = self.shards(until_ms)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda shard: self.fetch_shard(*shard, on_page), shards))
+        if any(result is None for result in results):
+            return None
+
+        deals = {}
+        for result in results:
+            for deal in result:
+                deals[deal["id"]] = deal
+        log.info(f"🔁 Search returned {len(deals)} deal(s) across {len(shards)} shard(s)")
+        return list(deals.values())
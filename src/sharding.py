@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from src.deal_table import DealRow
+
+# Analysis processes; 1 keeps everything in this process
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(os.cpu_count() or 1)))
+# Below this many deals per process, pickling costs more than the extra cores save
+MIN_DEALS_PER_WORKER = int(os.getenv("ANALYSIS_MIN_DEALS_PER_WORKER", "500"))
+
+
+def owner_shards(owner_sizes, workers=None):
+    """Split owners into balanced shards -> list of owner lists.
+
+    owner_sizes is [(owner, deal_count), ...]. Owners are never split, so
+    per-owner results need no cross-shard merging. The split only depends
+    on the sizes, which keeps runs reproducible.
+    """
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    total = sum(size for _, size in owner_sizes)
+    count = max(1, min(workers, len(owner_sizes), total // max(MIN_DEALS_PER_WORKER, 1)))
+    shards = [[] for _ in range(count)]
+    loads = [0] * count
+    for owner, size in sorted(owner_sizes, key=lambda item: (-item[1], str(item[0]))):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(owner)
+        loads[lightest] += size
+    return [shard for shard in shards if shard]
+
+
+def compact_rows(deals):
+    """Deals ready to pickle: rows of one DealTable become rows of a table holding only them"""
+    deals = list(deals)
+    if deals and all(isinstance(d, DealRow) for d in deals):
+        tables = {id(d.table) for d in deals}
+        if len(tables) == 1:
+            return deals[0].table.take([d.index for d in deals]).rows()
+    return deals
+
+
+def run_shards(func, payloads):
+    """func(*payload) for every payload, one process each; results come back in payload order"""
+    if len(payloads) == 1:
+        return [func(*payloads[0])]
+    with ProcessPoolExecutor(max_workers=len(payloads)) as pool:
+        futures = [pool.submit(func, *payload) for payload in payloads]
+        return [future.result() for future in futures]
@@ -0,0 +1,190 @@
+import atexit
+import os
+import smtplib
+import threading
+import time
+
+from src.log import get_logger
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+# Logged-in connections kept open at once
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+# A connection is closed and replaced after this many messages
+SMTP_MAX_MESSAGES = int(os.getenv("SMTP_MAX_MESSAGES", "50"))
+# A connection idle for longer than this gets a NOOP before it is reused
+SMTP_NOOP_AFTER = float(os.getenv("SMTP_NOOP_AFTER", "5"))
+
+log = get_logger("smtp")
+
+# Errors after which the connection itself is suspect; anything else is about the message
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError, OSError)
+
+
+def connection_failed(error):
+    """True if the connection is suspect; SMTPException subclasses OSError but
+    refused recipients or a rejected message leave the session usable"""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, CONNECTION_ERRORS) and not isinstance(error, smtplib.SMTPException)
+
+
+class PooledConnection:
+    def __init__(self, server):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SMTPPool:
+    """A few logged-in SMTP connections shared by every message of a run.
+
+    Connections are opened on demand up to `size`, checked with NOOP when
+    they have sat idle, replaced after `max_messages`, and reconnected once
+    when the server has dropped them mid-send, so the STARTTLS + LOGIN
+    handshake runs per connection instead of per message.
+    """
+
+    def __init__(self, username, password, host=SMTP_HOST, port=SMTP_PORT,
+                 size=SMTP_POOL_SIZE, max_messages=SMTP_MAX_MESSAGES, timeout=30):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.size = max(size, 1)
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.idle = []
+        # Guards idle/open; notified whenever a connection or a slot frees up
+        self.cond = threading.Condition()
+        self.open = 0
+        self.connects = 0
+        self.messages = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.starttls()
+            server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.connects += 1
+        log.debug(f"🔌 SMTP connection {self.connects} opened to {self.host}:{self.port}")
+        return PooledConnection(server)
+
+    def _acquire(self):
+        """An idle connection, or a new one if a slot is free; waits otherwise"""
+        with self.cond:
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.open < self.size:
+                    self.open += 1
+                    break
+                self.cond.wait()
+        try:
+            return self._connect()
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _free_slot(self):
+        with self.cond:
+            self.open -= 1
+            self.cond.notify()
+
+    def _release(self, conn):
+        if conn.sent >= self.max_messages:
+            log.debug(f"♻️ Recycling SMTP connection after {conn.sent} message(s)")
+            self._discard(conn)
+        else:
+            conn.last_used = time.monotonic()
+            with self.cond:
+                self.idle.append(conn)
+                self.cond.notify()
+
+    def _discard(self, conn):
+        conn.close()
+        self._free_slot()
+
+    def _healthy(self, conn):
+        if time.monotonic() - conn.last_used < SMTP_NOOP_AFTER:
+            return True
+        try:
+            return conn.server.noop()[0] == 250
+        except Exception as e:
+            if connection_failed(e):
+                return False
+            raise
+
+    def send(self, msg):
+        """Send one message over a pooled connection, reconnecting once if it was dropped.
+
+        Returns smtplib's {recipient: (code, reason)} for any recipients the server refused.
+        """
+        conn = self._acquire()
+        try:
+            if not self._healthy(conn):
+                log.info("🔌 SMTP connection went stale, reconnecting")
+                conn.close()
+                conn = self._connect()
+            try:
+                refused = conn.server.send_message(msg)
+            except Exception as e:
+                if not connection_failed(e):
+                    raise
+                log.warning(f"🔌 SMTP connection dropped ({e}), reconnecting")
+                conn.close()
+                conn = self._connect()
+                refused = conn.server.send_message(msg)
+        except Exception as e:
+            if connection_failed(e) or conn.server.sock is None:
+                # A failed connection is not reused; its slot goes to the next waiter
+                self._discard(conn)
+            else:
+                # The message was rejected, the session is still good
+                self._release(conn)
+            raise
+        conn.sent += 1
+        self.messages += 1
+        self._release(conn)
+        return refused
+
+    def close(self):
+        with self.cond:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            self._discard(conn)
+        if self.messages:
+            log.info(f"📮 SMTP pool sent {self.messages} message(s) over {self.connects} connection(s)")
+            self.messages = self.connects = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def smtp_pool(username, password):
+    """The run's shared pool for these credentials; it is closed when the process exits"""
+    with pools_lock:
+        pool = pools.get(username)
+        if pool is None:
+            pool = pools[username] = SMTPPool(username, password)
+            atexit.register(pool.close)
+        return pool
@@ -0,0 +1,23 @@
+import json
+import os
+
+# Local state that survives between runs (owner directory, deal store, ...)
+CACHE_DIR = os.getenv("PM_CACHE_DIR", os.path.join(os.getcwd(), ".cache"))
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+def cache_path(name):
+    return os.path.join(CACHE_DIR, name)
+
+def load_json(path, default=None):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+def save_json(path, data):
+    """Write through a temp file so a crashed run never leaves half a cache behind"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
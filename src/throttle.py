@@ -0,0 +1,46 @@
+import asyncio
+import os
+import threading
+import time
+
+# HubSpot private apps get ~100 requests / 10s; stay a little under by default
+HUBSPOT_RPS = float(os.getenv("HUBSPOT_RPS", "9"))
+HUBSPOT_MAX_WORKERS = int(os.getenv("HUBSPOT_MAX_WORKERS", "8"))
+
+
+class RateLimiter:
+    """Token bucket shared by every worker thread and coroutine that talks to HubSpot."""
+
+    def __init__(self, rate_per_sec, burst=None):
+        self.rate = max(float(rate_per_sec), 0.1)
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Claim the next token; seconds until it may be used.
+
+        Tokens claimed ahead of time leave the bucket negative, so callers
+        are served in order and threads and coroutines share one budget.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """acquire() for coroutines: waits without blocking the event loop"""
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+hubspot_limiter = RateLimiter(HUBSPOT_RPS)
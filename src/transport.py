@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from src.storage import cache_path
+
+# Point at a local stand-in (python -m src.hubspot_standin) to run without HubSpot
+HUBSPOT_BASE_URL = os.getenv("HUBSPOT_BASE_URL", "https://api.hubapi.com").rstrip("/")
+# live: plain HTTP, record: HTTP + save responses, replay: serve saved responses only
+HUBSPOT_TRANSPORT = os.getenv("HUBSPOT_TRANSPORT", "live").lower()
+HUBSPOT_FIXTURES = os.getenv("HUBSPOT_FIXTURES", cache_path("hubspot_fixtures"))
+
+# Search filters on these properties carry clock-derived values (watermarks, the open shard bound)
+VOLATILE_PROPERTIES = {"hs_lastmodifieddate", "createdate"}
+
+
+def request_key(method, url, body):
+    """Identity of a request, independent of which host served it"""
+    parts = urlsplit(url)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True)
+        except ValueError:
+            pass
+    return method.upper(), target, body or ""
+
+
+class FixtureArchive:
+    """Directory of recorded responses, one JSON file per distinct request.
+
+    Replay matches the exact request first. A search that only differs in
+    its clock-derived filter values (VOLATILE_PROPERTIES) falls back to the
+    recording with the closest values. Everything else, ids and paging
+    cursors included, must match exactly, so a miss fails instead of
+    replaying another request's data.
+    """
+
+    def __init__(self, path=HUBSPOT_FIXTURES):
+        self.path = path
+        self.lock = threading.Lock()
+        self.exact = None
+        self.by_shape = None
+
+    def _file_for(self, key):
+        return os.path.join(self.path, hashlib.sha1(json.dumps(key).encode()).hexdigest() + ".json")
+
+    def record(self, key, status, headers, content):
+        os.makedirs(self.path, exist_ok=True)
+        with self.lock:
+            file_path = self._file_for(key)
+            entries = []
+            if os.path.exists(file_path):
+                with open(file_path, encoding="utf-8") as file:
+                    entries = json.load(file)["responses"]
+            entries.append({"status": status, "headers": headers, "content": content})
+            with open(file_path, "w", encoding="utf-8") as file:
+                json.dump({"method": key[0], "target": key[1], "body": key[2], "responses": entries}, file)
+
+    @staticmethod
+    def _shape(key):
+        """(key with volatile filter values blanked, those values); no values if there are none"""
+        try:
+            body = json.loads(key[2]) if key[2] else None
+        except ValueError:
+            return key, []
+        if not isinstance(body, dict):
+            return key, []
+        numbers = []
+        for group in body.get("filterGroups", []):
+            for search_filter in group.get("filters", []):
+                if search_filter.get("propertyName") not in VOLATILE_PROPERTIES:
+                    continue
+                for field in ("value", "highValue"):
+                    value = str(search_filter.get(field, ""))
+                    if value.isdigit():
+                        numbers.append(int(value))
+                        search_filter[field] = "#"
+        return (key[0], key[1], json.dumps(body, sort_keys=True)), numbers
+
+    def _index(self):
+        self.exact, self.by_shape = {}, {}
+        if not os.path.isdir(self.path):
+            return
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.path, name), encoding="utf-8") as file:
+                fixture = json.load(file)
+            key = (fixture["method"], fixture["target"], fixture["body"])
+            self.exact[key] = list(fixture["responses"])
+            shape, numbers = self._shape(key)
+            if numbers:
+                self.by_shape.setdefault(shape, []).append((numbers, fixture["responses"][-1]))
+
+    def lookup(self, key):
+        with self.lock:
+            if self.exact is None:
+                self._index()
+            if key in self.exact:
+                responses = self.exact[key]
+                # A request recorded several times replays its answers in order, then repeats the last
+                return responses.pop(0) if len(responses) > 1 else responses[0]
+            shape, numbers = self._shape(key)
+            candidates = self.by_shape.get(shape) if numbers else None
+            if not candidates:
+                return None
+            return min(candidates, key=lambda c: sum(abs(a - b) for a, b in zip(c[0], numbers)))[1]
+
+
+class ArchiveAdapter(HTTPAdapter):
+    """requests adapter that records to, or replays from, a FixtureArchive"""
+
+    def __init__(self, mode=HUBSPOT_TRANSPORT, archive=None, **kwargs):
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.archive = archive or fixture_archive
+
+    def send(self, request, **kwargs):
+        key = request_key(request.method, request.url, request.body)
+        if self.mode == "replay":
+            fixture = self.archive.lookup(key)
+            if fixture is None:
+                raise requests.exceptions.ConnectionError(f"No recorded response for {key[0]} {key[1]}")
+            return self._build(request, fixture)
+
+        response = super().send(request, **kwargs)
+        # Throttled and failed answers are transient; replaying them would only add retries
+        if self.mode == "record" and response.status_code < 500 and response.status_code != 429:
+            self.archive.record(key, response.status_code, dict(response.headers), response.text)
+        return response
+
+    def _build(self, request, fixture):
+        response = requests.Response()
+        response.status_code = fixture["status"]
+        response.headers = CaseInsensitiveDict(fixture["headers"])
+        response.headers.pop("Content-Encoding", None)
+        response._content = fixture["content"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+
+fixture_archive = FixtureArchive()
+
+
+def new_session(max_retries=0):
+    session = requests.Session()
+    adapter = ArchiveAdapter(max_retries=max_retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,141 @@
+import copy
+import os
+import socket
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+# Before any src import: the HubSpot base URL and cache dir are read at import time
+with socket.socket() as probe:
+    probe.bind(("127.0.0.1", 0))
+    STANDIN_PORT = probe.getsockname()[1]
+os.environ["HUBSPOT_BASE_URL"] = f"http://127.0.0.1:{STANDIN_PORT}"
+os.environ["HUBSPOT_RPS"] = "1000"
+os.environ["PM_CACHE_DIR"] = tempfile.mkdtemp(prefix="pm-tests-")
+
+from werkzeug.serving import make_server
+
+from src.deal_record import Deal
+from src.deal_store import DealStore
+from src.deal_table import DealTable
+from src.hubspot_standin import ENGAGEMENT_TYPES, Portal, create_app, iso, to_ms
+
+PORTAL_DEALS = 600
+
+
+@pytest.fixture(scope="session")
+def portal():
+    """A generated stand-in portal, shared by every test"""
+    return Portal(PORTAL_DEALS, seed=11)
+
+
+@pytest.fixture
+def now():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def owner_emails(portal):
+    return {owner["id"]: owner["email"] for owner in portal.owners}
+
+
+def daily_table(portal):
+    """Portal deals parsed the way the daily fetch does, engagements attached"""
+    emails = owner_emails(portal)
+    table = DealTable()
+    for deal_id, props in portal.deals.items():
+        owner_id = props["hubspot_owner_id"]
+        if not owner_id:
+            continue
+        table.append(Deal(
+            id=deal_id,
+            name=props["dealname"],
+            owner_id=owner_id,
+            owner_email=emails[owner_id],
+            last_modified=props["hs_lastmodifieddate"],
+            last_activity=props["notes_last_updated"],
+            deal_type=props["deal_type__hot__warm___cold_"] or "N/A",
+            owner_assignment_date=props["hubspot_owner_assigneddate"],
+            deal_source=props["source_of_the_deal"],
+            deal_type_history=portal.history[deal_id],
+            deal_stage=props["dealstage"],
+        ))
+    table.attach_engagements({
+        str(table.ids[i]): (engagement_ms(portal, str(table.ids[i])), "N/A") for i in range(len(table))
+    })
+    return table
+
+
+def engagement_ms(portal, deal_id):
+    return [
+        to_ms(portal.activities[object_type][activity_id]["hs_timestamp"])
+        for object_type in ENGAGEMENT_TYPES
+        for activity_id in portal.associations[object_type].get(deal_id, [])
+    ]
+
+
+def touch(portal, deal_ids, **props):
+    """Change deals in the portal the way an edit in HubSpot would"""
+    modified = iso(datetime.now(timezone.utc))
+    for deal_id in deal_ids:
+        portal.deals[deal_id].update(props, hs_lastmodifieddate=modified)
+
+
+def weekly_groups(portal):
+    """Portal deals grouped by owner the way the weekly fetch does"""
+    emails = owner_emails(portal)
+    table = DealTable()
+    grouped = {}
+    for deal_id, props in portal.deals.items():
+        owner_email = emails.get(props["hubspot_owner_id"], "unknown@prozo.com")
+        contacts = [portal.contacts[c] for c in portal.associations["contacts"].get(deal_id, [])]
+        grouped.setdefault(owner_email, []).append(table.append(Deal(
+            id=deal_id,
+            name=props["dealname"],
+            owner_email=owner_email,
+            deal_type=props["deal_type__hot__warm___cold_"] or "N/A",
+            amount=props["amount"] or "N/A",
+            num_associated_contacts=props["num_associated_contacts"] or 0,
+        ), contacts=contacts))
+    return grouped
+
+
+@pytest.fixture
+def daily_deals(portal):
+    return daily_table(portal).rows()
+
+
+@pytest.fixture
+def shard_small(monkeypatch):
+    """Let a test-sized portal split across several processes"""
+    monkeypatch.setattr("src.sharding.MIN_DEALS_PER_WORKER", 50)
+
+
+@pytest.fixture(scope="session")
+def standin_server():
+    """The stand-in HubSpot API on STANDIN_PORT, serving its own portal"""
+    served = Portal(PORTAL_DEALS, seed=13)
+    server = make_server("127.0.0.1", STANDIN_PORT, create_app(served, rps=0), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield served
+    server.shutdown()
+    thread.join()
+
+
+@pytest.fixture
+def standin(standin_server):
+    """The served portal; whatever a test changes in it is put back afterwards"""
+    saved = copy.deepcopy((standin_server.deals, standin_server.history))
+    yield standin_server
+    standin_server.deals, standin_server.history = saved
+
+
+@pytest.fixture
+def deal_store(tmp_path, monkeypatch):
+    """A fresh deal store for every DealStore() the code under test opens"""
+    path = str(tmp_path / "deals.sqlite")
+    monkeypatch.setattr("src.fetch_deals.DealStore", lambda: DealStore(path))
+    monkeypatch.setattr("src.pipeline.DealStore", lambda: DealStore(path))
+    return lambda: DealStore(path)
@@ -0,0 +1,58 @@
+import re
+from datetime import timedelta
+
+import pytest
+
+from src.alert_state import AlertState
+from src.analyze_deals import DEAL_FIELDS, analyze_deals
+
+from conftest import daily_table, engagement_ms
+
+
+def analyzed(table, now, state=None):
+    deals = table.rows()
+    alerts, metrics = analyze_deals(deals, now=now, state=state, workers=1)
+    fields = {deal["id"]: {field: deal.get(field) for field in DEAL_FIELDS} for deal in deals}
+    return alerts, metrics, fields
+
+
+def touched_table(portal, now, every=7):
+    """The portal's deals with a fresh engagement on every n-th deal"""
+    table = daily_table(portal)
+    now_ms = int(now.timestamp() * 1000)
+    table.attach_engagements({
+        str(deal_id): (engagement_ms(portal, str(deal_id)) + ([now_ms] if i % every == 0 else []), "N/A")
+        for i, deal_id in enumerate(table.ids)
+    })
+    return table
+
+
+def reused(caplog):
+    counts = [int(n) for n in re.findall(r"reused (\d+) unchanged", caplog.text)]
+    caplog.clear()
+    return counts[-1]
+
+
+@pytest.mark.parametrize("later", [timedelta(hours=2), timedelta(days=2), timedelta(days=9)])
+def test_incremental_run_matches_full_analysis(portal, now, tmp_path, caplog, later):
+    caplog.set_level("INFO", logger="pm.daily")
+    state = AlertState(str(tmp_path / "alert_state.sqlite"))
+    analyzed(daily_table(portal), now, state)
+    assert reused(caplog) == 0
+
+    table = touched_table(portal, now + later)
+    full = analyzed(touched_table(portal, now + later), now + later)
+    incremental = analyzed(table, now + later, state)
+    assert reused(caplog) > 0
+    assert incremental == full
+    assert all("alert_delta" in deal for deal in table.rows())
+
+
+def test_unchanged_deals_are_all_reused(portal, now, tmp_path, caplog):
+    caplog.set_level("INFO", logger="pm.daily")
+    state = AlertState(str(tmp_path / "alert_state.sqlite"))
+    first = analyzed(daily_table(portal), now, state)
+    caplog.clear()
+    second = analyzed(daily_table(portal), now, state)
+    assert reused(caplog) == len(portal.deals) - sum(1 for p in portal.deals.values() if not p["hubspot_owner_id"])
+    assert second == first
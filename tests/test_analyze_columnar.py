@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+import pytest
+
+from src.analyze_columnar import analyze_deals_columnar
+from src.analyze_deals import DEAL_FIELDS, analyze_deals
+
+from conftest import daily_table
+
+
+def one_table(portal):
+    return daily_table(portal).rows()
+
+
+def every_other_row(portal):
+    return daily_table(portal).rows()[::2]
+
+
+def two_tables(portal):
+    """Rows of two tables: the columnar engine reads these deal by deal"""
+    rows = daily_table(portal).rows()
+    half = len(rows) // 2
+    return rows[:half] + daily_table(portal).rows()[half:]
+
+
+def analyzed(analyze, deals, now):
+    alerts, metrics = analyze(deals, now=now)
+    fields = {deal["id"]: {field: deal.get(field) for field in DEAL_FIELDS} for deal in deals}
+    return alerts, metrics, fields
+
+
+@pytest.mark.parametrize("deals", [one_table, every_other_row, two_tables])
+@pytest.mark.parametrize("later", [timedelta(0), timedelta(days=3)])
+def test_columnar_matches_serial_rules(portal, now, deals, later):
+    now = now + later
+    serial = analyzed(lambda d, now: analyze_deals(d, now=now, workers=1), deals(portal), now)
+    columnar = analyzed(analyze_deals_columnar, deals(portal), now)
+    assert columnar == serial
+    assert list(columnar[1]) == list(serial[1])
+    assert serial[0]
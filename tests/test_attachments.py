@@ -0,0 +1,71 @@
+import csv
+import gzip
+import io
+import zipfile
+
+import pytest
+
+from src.attachments import CsvReport
+
+ROWS = [["Deal Name", "Owner", "Alerts"]] + [
+    [f"Déal {i}, \"quoted\"", f"owner{i % 7}@example.com", "🚫 No Activity\n♻️ Stage Reversal: Hot → Warm"]
+    for i in range(300)
+]
+
+
+def report(rows=ROWS, **fmtparams):
+    sheet = CsvReport("alerts_report.csv", **fmtparams)
+    sheet.writerow(rows[0])
+    sheet.writerows(rows[1:])
+    return sheet
+
+
+def unpacked(attachment):
+    """The CSV text inside an attachment, whichever way it was packed"""
+    if attachment.subtype == "zip":
+        with zipfile.ZipFile(io.BytesIO(attachment.data)) as archive:
+            assert archive.namelist() == ["alerts_report.csv"]
+            data = archive.read("alerts_report.csv")
+    elif attachment.subtype == "gzip":
+        data = gzip.decompress(attachment.data)
+    else:
+        data = attachment.data
+    return data.decode("utf-8")
+
+
+def read_rows(text):
+    return list(csv.reader(io.StringIO(text, newline="")))
+
+
+@pytest.mark.parametrize("compression, above, filename, subtype", [
+    ("none", 0, "alerts_report.csv", "octet-stream"),
+    ("zip", 10 ** 9, "alerts_report.csv", "octet-stream"),
+    ("zip", 0, "alerts_report.zip", "zip"),
+    ("gzip", 0, "alerts_report.csv.gz", "gzip"),
+])
+def test_round_trip(compression, above, filename, subtype):
+    attachment = report().attachment(compression, above)
+    assert (attachment.filename, attachment.subtype) == (filename, subtype)
+    assert read_rows(unpacked(attachment)) == ROWS
+
+
+def test_threshold_is_the_csv_size():
+    size = len(report().attachment("none", 0).data)
+    assert report().attachment("gzip", size).subtype == "octet-stream"
+    compressed = report().attachment("gzip", size - 1)
+    assert compressed.subtype == "gzip"
+    assert len(compressed.data) < size
+
+
+def test_defaults_come_from_the_environment_settings(monkeypatch):
+    monkeypatch.setattr("src.attachments.REPORT_COMPRESSION", "gzip")
+    monkeypatch.setattr("src.attachments.REPORT_COMPRESS_ABOVE", 100)
+    assert report().attachment().filename == "alerts_report.csv.gz"
+    monkeypatch.setattr("src.attachments.REPORT_COMPRESS_ABOVE", 10 ** 9)
+    assert report().attachment().filename == "alerts_report.csv"
+
+
+def test_writer_options_are_kept():
+    attachment = report(quoting=csv.QUOTE_ALL).attachment("none", 0)
+    assert unpacked(attachment).startswith('"Deal Name","Owner","Alerts"\r\n')
+    assert read_rows(unpacked(attachment)) == ROWS
@@ -0,0 +1,66 @@
+import time
+
+from src.deal_store import WATERMARK_OVERLAP_MS, DealStore
+from src.fetch_deals import IGNORED_DEALSTAGES, sync_marketing_deals
+
+from conftest import touch
+
+
+def record(deal_id, name="Deal"):
+    return {"id": deal_id, "properties": {"dealname": name, "hs_lastmodifieddate": "2026-01-01T00:00:00.000Z"}}
+
+
+def stored_marketing(portal):
+    return [deal_id for deal_id, props in portal.deals.items()
+            if props["source_of_the_deal"] == "Marketing" and props["dealstage"] not in IGNORED_DEALSTAGES]
+
+
+def test_watermark_follows_each_sync(tmp_path, monkeypatch):
+    store = DealStore(str(tmp_path / "deals.sqlite"))
+    assert store.delta_since("daily") is None
+
+    store.finish_sync("daily", 1_000_000_000, full=True, seen_ids=[])
+    assert store.delta_since("daily") == 1_000_000_000 - WATERMARK_OVERLAP_MS
+    store.finish_sync("daily", 2_000_000_000, full=False)
+    assert store.delta_since("daily") == 2_000_000_000 - WATERMARK_OVERLAP_MS
+    assert store.delta_since("weekly") is None
+
+    monkeypatch.setattr("src.deal_store.RECONCILE_DAYS", -1)
+    assert store.delta_since("daily") is None
+
+
+def test_delta_merges_and_reconcile_drops(tmp_path):
+    store = DealStore(str(tmp_path / "deals.sqlite"))
+    store.upsert("daily", [record("3"), record("1"), record("2")])
+    store.finish_sync("daily", int(time.time() * 1000), full=True, seen_ids=["1", "2", "3"])
+
+    store.upsert("daily", [record("2", "Renamed"), record("4")])
+    store.finish_sync("daily", int(time.time() * 1000), full=False, seen_ids=["2", "4"])
+    assert store.ids("daily") == ["1", "2", "3", "4"]
+    assert [r["properties"]["dealname"] for r in store.records("daily", ["2", "4"])] == ["Renamed", "Deal"]
+
+    store.finish_sync("daily", int(time.time() * 1000), full=True, seen_ids=["2", "4"])
+    assert store.ids("daily") == ["2", "4"]
+    assert store.load("daily") == [record("2", "Renamed"), record("4")]
+
+
+def test_delta_sync_against_the_standin(standin, deal_store, monkeypatch):
+    store = deal_store()
+    first = {deal["id"] for deal in sync_marketing_deals(store)}
+    assert first == set(stored_marketing(standin))
+
+    renamed, moved, deleted = stored_marketing(standin)[:3]
+    touch(standin, [renamed], dealname="Renamed deal")
+    touch(standin, [moved], source_of_the_deal="Sales")
+    del standin.deals[deleted]
+
+    delta = {deal["id"]: deal for deal in sync_marketing_deals(store)}
+    assert delta[renamed]["properties"]["dealname"] == "Renamed deal"
+    # A deal whose source left Marketing is dropped at once, a deleted one at the next reconcile
+    assert moved not in delta
+    assert deleted in delta
+
+    monkeypatch.setattr("src.deal_store.RECONCILE_DAYS", -1)
+    reconciled = {deal["id"] for deal in sync_marketing_deals(store)}
+    assert reconciled == set(stored_marketing(standin))
+    assert deleted not in reconciled
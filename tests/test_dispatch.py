@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from src.dispatch import DispatchQueue, SlidingWindowLimiter
+
+
+class FakeClock:
+    """time.monotonic / time.sleep where sleeping only moves the clock forward.
+
+    It starts from the real monotonic clock and runs alongside it, so the
+    queue's condition waits (real timeouts) still line up with it.
+    """
+
+    def __init__(self):
+        self.offset = 0.0
+        self.lock = threading.Lock()
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.offset += seconds
+
+
+class FixedJitter:
+    @staticmethod
+    def uniform(low, high):
+        return 1.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("src.dispatch.time", clock)
+    monkeypatch.setattr("src.dispatch.random", FixedJitter)
+    return clock
+
+
+class FakeSender:
+    """Records when each recipient was sent to; fails the first `failures[recipient]` attempts"""
+
+    def __init__(self, clock, failures=None):
+        self.clock = clock
+        self.failures = dict(failures or {})
+        self.sends = []
+        self.lock = threading.Lock()
+
+    def __call__(self, recipient):
+        with self.lock:
+            self.sends.append((recipient, self.clock.monotonic()))
+            if self.failures.get(recipient, 0):
+                self.failures[recipient] -= 1
+                raise OSError("boom")
+
+
+def test_sliding_window_spaces_acquisitions(clock):
+    limiter = SlidingWindowLimiter(3, window=60.0)
+    started = clock.monotonic()
+    times = []
+    for _ in range(7):
+        limiter.acquire()
+        times.append(round(clock.monotonic() - started))
+    assert times == [0, 0, 0, 60, 60, 60, 120]
+
+
+def test_queue_keeps_sends_under_the_per_minute_cap(clock):
+    send = FakeSender(clock)
+    with DispatchQueue(workers=4, per_minute=2, retry_base=0.01) as mail:
+        for i in range(5):
+            mail.submit(f"owner{i}@example.com", "OWNER", send, f"owner{i}@example.com")
+    starts = sorted(at for _, at in send.sends)
+    assert len(starts) == 5
+    assert all(later - earlier >= 60 for earlier, later in zip(starts, starts[2:]))
+    assert len(mail.report["sent"]) == 5
+
+
+def test_failed_sends_retry_with_backoff_then_give_up(clock):
+    send = FakeSender(clock, failures={"flaky@example.com": 2, "down@example.com": 10})
+    with DispatchQueue(workers=2, per_minute=100, max_attempts=3, retry_base=0.05) as mail:
+        mail.submit("ok@example.com", "OWNER", send, "ok@example.com")
+        mail.submit("flaky@example.com", "OWNER", send, "flaky@example.com")
+        mail.submit("down@example.com", "SUMMARY", send, "down@example.com")
+
+    report = mail.report
+    assert sorted(report["sent"]) == [("flaky@example.com", "OWNER", 3), ("ok@example.com", "OWNER", 1)]
+    assert report["failed"] == [("down@example.com", "SUMMARY", 3, "boom")]
+    assert report["retried"] == 2
+
+    flaky = [at for recipient, at in send.sends if recipient == "flaky@example.com"]
+    gaps = [later - earlier for earlier, later in zip(flaky, flaky[1:])]
+    # retry_base, then doubled (jitter pinned to 1.0)
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1
@@ -0,0 +1,54 @@
+import pytest
+
+from src.analyze_deals import DEAL_FIELDS
+from src.fetch_deals import get_recent_deals_grouped_by_owner
+from src.hubspot_standin import iso
+from src.pipeline import run_daily_pipeline
+
+from conftest import touch
+
+EXCLUDED = {"kuldeep.thakran@prozo.com"}
+
+
+def results(run):
+    deals, alerts, metrics = run
+    return [deal["id"] for deal in deals], alerts, metrics, {
+        deal["id"]: {field: deal.get(field) for field in DEAL_FIELDS} for deal in deals
+    }
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # Small batches and a one-slot queue keep the stored-deal replay waiting on enrich
+    monkeypatch.setattr("src.pipeline.PIPELINE_BATCH", 20)
+    monkeypatch.setattr("src.pipeline.PIPELINE_QUEUE_SIZE", 1)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_delta_run_matches_a_full_run(standin, deal_store, small_batches, monkeypatch, caplog, now, workers):
+    caplog.set_level("INFO", logger="pm.fetch")
+    monkeypatch.setattr("src.pipeline.ANALYSIS_WORKERS", workers)
+    monkeypatch.setattr("src.pipeline.MIN_DEALS_PER_WORKER", 100)
+    assert run_daily_pipeline(EXCLUDED, now=now) is not None
+
+    touch(standin, list(standin.deals)[::9], deal_type__hot__warm___cold_="true", notes_last_updated=iso(now))
+    touch(standin, list(standin.deals)[1::25], source_of_the_deal="Sales")
+    caplog.clear()
+    delta = run_daily_pipeline(EXCLUDED, now=now)
+    assert "Delta sync" in caplog.text
+    assert delta is not None
+
+    # A reconcile that is always due makes the next run a full download
+    monkeypatch.setattr("src.deal_store.RECONCILE_DAYS", -1)
+    caplog.clear()
+    full = run_daily_pipeline(EXCLUDED, now=now)
+    assert "Full reconcile" in caplog.text
+    assert results(delta) == results(full)
+
+
+def test_pipeline_lists_deals_like_the_staged_run(standin, deal_store, now):
+    deals, _, _ = run_daily_pipeline(EXCLUDED, now=now)
+    staged = get_recent_deals_grouped_by_owner(EXCLUDED)
+    assert [deal["id"] for deal in deals] == [
+        deal["id"] for owner, owner_deals in staged.items() if owner not in EXCLUDED for deal in owner_deals
+    ]
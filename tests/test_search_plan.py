@@ -0,0 +1,64 @@
+import pytest
+
+from src.search_plan import DAY_MS, SearchPlan
+
+JAN_2024_MS = 1_704_067_200_000
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class FakeSearch:
+    """Deal search over fixed createdates that, like HubSpot, stops paging at the ceiling"""
+
+    def __init__(self, created_ms, ceiling):
+        self.created_ms = created_ms
+        self.ceiling = ceiling
+        self.ranges = []
+
+    def __call__(self, url, headers, payload):
+        bounds = {f["operator"]: int(f["value"]) for f in payload["filterGroups"][0]["filters"]
+                  if f["propertyName"] == "createdate"}
+        hits = [i for i, ms in enumerate(self.created_ms) if bounds["GTE"] <= ms < bounds["LT"]]
+        start, size = int(payload.get("after") or 0), payload["limit"]
+        if start == 0:
+            self.ranges.append((bounds["GTE"], bounds["LT"]))
+        visible = hits[:self.ceiling]
+        body = {"total": len(hits), "results": [{"id": str(i)} for i in visible[start:start + size]]}
+        if start + size < len(visible):
+            body["paging"] = {"next": {"after": str(start + size)}}
+        return FakeResponse(body)
+
+
+@pytest.fixture
+def fake_search(monkeypatch):
+    monkeypatch.setattr("src.search_plan.SEARCH_RESULT_CEILING", 50)
+    monkeypatch.setattr("src.search_plan.SEARCH_PAGE_SIZE", 20)
+
+    def install(created_ms):
+        search = FakeSearch(created_ms, ceiling=50)
+        monkeypatch.setattr("src.search_plan.safe_post", search)
+        return search
+    return install
+
+
+def test_crowded_shards_are_split_until_they_fit(fake_search):
+    search = fake_search([JAN_2024_MS + i * 3_600_000 for i in range(180)])
+    deals = SearchPlan(["dealname"]).fetch(until_ms=JAN_2024_MS + 30 * DAY_MS, workers=2)
+    assert sorted(int(d["id"]) for d in deals) == list(range(180))
+    # The 90-day shard holding every deal was halved until each half had at most 50
+    assert len(search.ranges) > len(SearchPlan(["dealname"]).shards(JAN_2024_MS + 30 * DAY_MS))
+
+
+def test_unsplittable_shard_over_the_ceiling_is_reported(fake_search, caplog):
+    fake_search([JAN_2024_MS] * 80 + [JAN_2024_MS + DAY_MS])
+    deals = SearchPlan(["dealname"]).fetch(until_ms=JAN_2024_MS + 30 * DAY_MS, workers=2)
+    assert len(deals) == 51
+    assert "30 will be missing" in caplog.text
@@ -0,0 +1,32 @@
+from src.analyze_deals import DEAL_FIELDS, analyze_deals
+from src.sharding import owner_shards
+from utils.analyze import analyze_deals as analyze_weekly
+
+from conftest import daily_table, weekly_groups
+
+
+def deal_fields(deals):
+    return {deal["id"]: {field: deal.get(field) for field in DEAL_FIELDS} for deal in deals}
+
+
+def test_owner_shards_keep_owners_whole(shard_small):
+    sizes = [(f"owner{i}", 40 + i * 7) for i in range(12)]
+    shards = owner_shards(sizes, workers=4)
+    assert len(shards) == 4
+    assert sorted(owner for shard in shards for owner in shard) == sorted(owner for owner, _ in sizes)
+
+
+def test_sharded_daily_matches_serial(portal, now, shard_small):
+    serial_deals, sharded_deals = daily_table(portal).rows(), daily_table(portal).rows()
+    serial = analyze_deals(serial_deals, now=now, workers=1)
+    sharded = analyze_deals(sharded_deals, now=now, workers=3)
+    assert sharded == serial
+    assert list(sharded[1]) == list(serial[1])
+    assert deal_fields(sharded_deals) == deal_fields(serial_deals)
+
+
+def test_sharded_weekly_matches_serial(portal, shard_small):
+    serial = analyze_weekly(weekly_groups(portal), workers=1)
+    sharded = analyze_weekly(weekly_groups(portal), workers=3)
+    assert sharded == serial
+    assert list(sharded[0]) == list(serial[0])
@@ -0,0 +1,153 @@
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import pytest
+
+from src.smtp_pool import SMTPPool
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP; `script` maps a message subject to the error its send raises"""
+
+    password = "secret"
+    script = {}
+    delay = 0.0
+    opened = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sock = object()
+        self.sent = []
+        FakeSMTP.opened.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        if password != self.password:
+            raise smtplib.SMTPAuthenticationError(535, b"bad credentials")
+
+    def noop(self):
+        return (250, b"OK")
+
+    def send_message(self, msg):
+        time.sleep(self.delay)
+        error = self.script.get(msg["Subject"])
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            # Only the first connection is dropped; the reconnect succeeds
+            if self is FakeSMTP.opened[0]:
+                self.sock = None
+            else:
+                error = None
+        if error is not None:
+            raise error
+        self.sent.append(msg["Subject"])
+        return {}
+
+    def quit(self):
+        self.sock = None
+
+    def close(self):
+        self.sock = None
+
+
+@pytest.fixture
+def fake_smtp(monkeypatch):
+    FakeSMTP.opened = []
+    monkeypatch.setattr("src.smtp_pool.smtplib.SMTP", FakeSMTP)
+    return FakeSMTP
+
+
+def message(subject):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["To"] = "owner@example.com"
+    msg.set_content("report")
+    return msg
+
+
+def finished(target, seconds=5):
+    """Run target in a thread; False if it is still running (blocked) after `seconds`"""
+    errors = []
+
+    def run():
+        try:
+            target()
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    if errors:
+        raise errors[0]
+    return not thread.is_alive()
+
+
+def test_connections_are_checked_out_and_back_in(fake_smtp):
+    pool = SMTPPool("user", "secret", size=2, max_messages=50)
+    for i in range(5):
+        pool.send(message(f"m{i}"))
+    assert len(fake_smtp.opened) == 1
+    assert fake_smtp.opened[0].sent == [f"m{i}" for i in range(5)]
+    assert pool.open == 1 and len(pool.idle) == 1
+
+
+def test_concurrent_sends_never_open_more_than_size(fake_smtp, monkeypatch):
+    monkeypatch.setattr(FakeSMTP, "delay", 0.02)
+    pool = SMTPPool("user", "secret", size=2)
+    threads = [threading.Thread(target=pool.send, args=(message(f"m{i}"),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(fake_smtp.opened) == 2
+    assert sorted(s for server in fake_smtp.opened for s in server.sent) == sorted(f"m{i}" for i in range(8))
+
+
+def test_connections_are_recycled_after_max_messages(fake_smtp):
+    pool = SMTPPool("user", "secret", size=1, max_messages=2)
+    for i in range(5):
+        pool.send(message(f"m{i}"))
+    assert len(fake_smtp.opened) == 3
+    assert [server.sock is None for server in fake_smtp.opened] == [True, True, False]
+
+
+def test_failed_login_frees_the_slot(fake_smtp):
+    pool = SMTPPool("user", "wrong", size=1)
+
+    def send_twice():
+        for _ in range(2):
+            with pytest.raises(smtplib.SMTPAuthenticationError):
+                pool.send(message("m"))
+
+    # The second send would wait forever for the slot the first failed login held
+    assert finished(send_twice)
+    assert pool.open == 0 and not pool.idle
+    assert all(server.sock is None for server in fake_smtp.opened)
+
+
+def test_rejected_message_keeps_the_connection(fake_smtp, monkeypatch):
+    monkeypatch.setattr(FakeSMTP, "script", {
+        "refused": smtplib.SMTPRecipientsRefused({"owner@example.com": (550, b"no such user")}),
+        "too big": smtplib.SMTPDataError(552, b"message too large"),
+    })
+    pool = SMTPPool("user", "secret", size=1)
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send(message("refused"))
+    with pytest.raises(smtplib.SMTPDataError):
+        pool.send(message("too big"))
+    assert finished(lambda: pool.send(message("ok")))
+    assert len(fake_smtp.opened) == 1
+    assert fake_smtp.opened[0].sent == ["ok"]
+    assert pool.open == 1 and len(pool.idle) == 1
+
+
+def test_dropped_connection_reconnects_once(fake_smtp, monkeypatch):
+    monkeypatch.setattr(FakeSMTP, "script", {"m": smtplib.SMTPServerDisconnected("gone")})
+    pool = SMTPPool("user", "secret", size=1)
+    pool.send(message("m"))
+    assert len(fake_smtp.opened) == 2
+    assert fake_smtp.opened[1].sent == ["m"]
+    assert pool.open == 1 and len(pool.idle) == 1
@@ -1,64 +1,128 @@
-﻿def analyze_deals(grouped_deals):
+﻿from src.deal_record import DealType
+from src.log import get_logger, trace
+from src.rules import RuleSet
+from src.sharding import compact_rows, owner_shards, run_shards
+
+log = get_logger("weekly")
+
+COUNTER_KEYS = [
+    'X1_HotDealsMissingContacts',
+    'X2_HotDealsMissingDesignations',
+    'X3_HotDealsLowMBR',
+    'X4_DealsMissingType'
+]
+
+weekly_rules = RuleSet("Weekly")
+
+
+@weekly_rules.input('deal_type')
+def deal_type_input(deal, inputs):
+    return (deal.get('deal_type') or '').strip().lower()
+
+
+@weekly_rules.input('hot')
+def hot_input(deal, inputs):
+    return deal.type is DealType.HOT
+
+
+@weekly_rules.input('amount')
+def amount_input(deal, inputs):
+    return float(deal.get('amount', 0)) if deal.get('amount') not in [None, '', 'N/A'] else 0.0
+
+
+@weekly_rules.input('num_contacts')
+def num_contacts_input(deal, inputs):
+    return int(deal.get('num_associated_contacts', 0))
+
+
+@weekly_rules.input('missing_designations')
+def missing_designations_input(deal, inputs):
+    return [
+        f"{c['firstname']} {c['lastname']}" for c in deal.get('associated_contacts', [])
+        if not c.get('jobtitle') or str(c['jobtitle']).strip().lower() in ['none', '']
+    ]
+
+
+# Alert: Missing deal type
+@weekly_rules.rule('X4', needs=['deal_type'], metric='X4_DealsMissingType')
+def missing_deal_type(inputs):
+    if not inputs['deal_type'] or inputs['deal_type'] == 'n/a':
+        return "❗ Missing Deal Type"
+
+
+# Alert 1: Hot deal with fewer than 2 contacts
+@weekly_rules.rule('X1', needs=['hot', 'num_contacts'], metric='X1_HotDealsMissingContacts')
+def missing_contacts(inputs):
+    if inputs['hot'] and inputs['num_contacts'] < 2:
+        return "👤 Less than 2 associated contacts"
+
+
+# Alert 2: Hot deal contacts without a designation
+@weekly_rules.rule('X2', needs=['hot', 'missing_designations'], metric='X2_HotDealsMissingDesignations')
+def missing_designations(inputs):
+    if inputs['hot'] and inputs['missing_designations']:
+        return [f"🪪 Missing designation for {name.strip()}" for name in inputs['missing_designations']]
+
+
+# Alert 3: Low MBR
+@weekly_rules.rule('X3', needs=['hot', 'amount'], metric='X3_HotDealsLowMBR')
+def low_mbr(inputs):
+    if inputs['hot'] and inputs['amount'] < 1000:
+        return "💰 MBR less than ₹1,000"
+
+
+def analyze_owner_groups(grouped_deals, active=None):
+    """Weekly rules over {owner: deals} in this process -> (alerts, counters, plan counters)"""
+    plan = weekly_rules.compile(active=active)
     alerts = {}
     counters = {}
 
     for owner, deals in grouped_deals.items():
-        print(f"\n🔍 Analyzing deals for: {owner}")
+        log.debug(f"🔍 Analyzing deals for: {owner}")
         alerts[owner] = []
-        counters[owner] = {
-            'X1_HotDealsMissingContacts': 0,
-            'X2_HotDealsMissingDesignations': 0,
-            'X3_HotDealsLowMBR': 0,
-            'X4_DealsMissingType': 0
-        }
+        counters[owner] = {key: 0 for key in COUNTER_KEYS}
 
         for deal in deals:
-            deal_alerts = []
-
-            deal_type = (deal.get('deal_type') or '').strip().lower()
-            amount = float(deal.get('amount', 0)) if deal.get('amount') not in [None, '', 'N/A'] else 0.0
-            contacts = deal.get('associated_contacts', [])
-            num_contacts = int(deal.get('num_associated_contacts', 0))
-
-            print(f"\n➡️ Checking Deal: {deal['name']} (Type: {deal_type}, Amount: {amount}, Contacts: {num_contacts})")
-
-            # Alert: Missing deal type
-            if not deal_type or deal_type == 'n/a':
-                counters[owner]['X4_DealsMissingType'] += 1
-                deal_alerts.append("❗ Missing Deal Type")
-
-            # Analyze cold deals instead of hot
-            if deal_type == 'true':
-                # Alert 1: Missing 2+ contacts
-                if num_contacts < 2:
-                    counters[owner]['X1_HotDealsMissingContacts'] += 1
-                    deal_alerts.append("👤 Less than 2 associated contacts")
-
-                # Alert 2: Missing designations
-                missing_designations = [
-                    f"{c['firstname']} {c['lastname']}" for c in contacts
-                    if not c.get('jobtitle') or str(c['jobtitle']).strip().lower() in ['none', '']
-                ]
-                if missing_designations:
-                    counters[owner]['X2_HotDealsMissingDesignations'] += 1
-                    for name in missing_designations:
-                        deal_alerts.append(f"🪪 Missing designation for {name.strip()}")
-
-                # Alert 3: Low MBR
-                if amount < 1000:
-                    counters[owner]['X3_HotDealsLowMBR'] += 1
-                    deal_alerts.append("💰 MBR less than ₹1,000")
+            deal_alerts, hit_counters, _ = plan.evaluate(deal, {})
+            for key in hit_counters:
+                counters[owner][key] += 1
 
             if deal_alerts:
-                print(f"\n🚨 Alerts for Deal: {deal['name']} (ID: {deal['id']})")
-                for alert in deal_alerts:
-                    print(f"- {alert}")
+                trace(deal['id'], "🚨 Alerts for deal %r: %s", deal['name'], "; ".join(deal_alerts))
 
                 alerts[owner].append({
-                    "deal_name":deal['name'],
-                    "deal_id": deal['id'],
                     "deal_name": deal['name'],
+                    "deal_id": deal['id'],
                     "alerts": deal_alerts
                 })
 
+    return alerts, counters, plan.stats()
+
+
+def analyze_deals(grouped_deals, active=None, workers=None):
+    shards = owner_shards([(owner, len(deals)) for owner, deals in grouped_deals.items()], workers)
+    if len(shards) == 1:
+        payloads = [(grouped_deals, active)]
+    else:
+        payloads = []
+        for owners in shards:
+            rows = compact_rows(deal for owner in owners for deal in grouped_deals[owner])
+            shard_groups, start = {}, 0
+            for owner in owners:
+                shard_groups[owner] = rows[start:start + len(grouped_deals[owner])]
+                start += len(grouped_deals[owner])
+            payloads.append((shard_groups, active))
+        log.info(f"🧵 Analyzing {sum(map(len, grouped_deals.values()))} deals in {len(shards)} processes")
+
+    plan = weekly_rules.compile(active=active)
+    shard_alerts, shard_counters = {}, {}
+    for alerts, counters, stats in run_shards(analyze_owner_groups, payloads):
+        shard_alerts.update(alerts)
+        shard_counters.update(counters)
+        plan.add_stats(stats)
+
+    # Owners come back in the caller's order whatever shard they ran in
+    alerts = {owner: shard_alerts[owner] for owner in grouped_deals}
+    counters = {owner: shard_counters[owner] for owner in grouped_deals}
+    plan.report()
     return alerts, counters
@@ -1,113 +1,153 @@
-import smtplib
 import os
-import io
-import csv
-import time
-import traceback
 from datetime import datetime
 from email.message import EmailMessage
 from email.utils import formataddr
 from dotenv import load_dotenv
+from src.analyze_deals import METRIC_LABELS
+from src.log import get_logger
+from src.reports import CsvLayout, HtmlTemplate, RenderedRows, index_deals
+from src.rollup import Rollup
+from src.smtp_pool import smtp_pool
+from src.dispatch import DispatchQueue
 
 load_dotenv()
 
+log = get_logger("weekly.emailer")
+
 # 🔐 Load and sanitize secrets
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME", "").strip().replace("\n", "").replace("\r", "")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "").strip().replace("\n", "").replace("\r", "")
-SUMMARY_RECEIVER = ["kuldeep.thakran@prozo.com","ashvini.jakhar@prozo.com","rishi.singh@prozo.com","gourav.rathi@prozo.com"]
+# Comma-separated; everyone gets the same summary message
+SUMMARY_RECEIVER = [
+    email.strip() for email in os.getenv(
+        "SUMMARY_RECIPIENTS",
+        "kuldeep.thakran@prozo.com,ashvini.jakhar@prozo.com,rishi.singh@prozo.com,gourav.rathi@prozo.com"
+    ).split(",") if email.strip()
+]
 exclude_emails = {
     "kuldeep.thakran@prozo.com",
     "ankit.rakhecha@prozo.com",
     "unknown@prozo.com"
 }
 
-# 🐞 Debug: Print sanitized secrets info
-print(f"📨 EMAIL_USERNAME: {EMAIL_USERNAME}")
-print(f"🔒 EMAIL_PASSWORD Length: {len(EMAIL_PASSWORD)}")
-print(f"📬 SUMMARY_RECEIVER: {SUMMARY_RECEIVER}")
-
+# 🐞 Debug: sender and summary recipients (never the password)
+log.debug(f"📨 Sending as {EMAIL_USERNAME}, summary to {SUMMARY_RECEIVER}")
+
+
+def build_trend_html(trends, owners):
+    """Daily-run alert counts for the given owners: last 7 days vs the 7 before, plus the 30-day daily average"""
+    if not owners:
+        return ""
+    rows = []
+    for metric, label in METRIC_LABELS.items():
+        week = sum(trends.get(owner, {}).get(metric, (0, 0, 0))[0] for owner in owners)
+        previous = sum(trends.get(owner, {}).get(metric, (0, 0, 0))[1] for owner in owners)
+        average = sum(trends.get(owner, {}).get(metric, (0, 0, 0))[2] for owner in owners)
+        change = week - previous
+        arrow = "▲" if change > 0 else "▼" if change < 0 else "="
+        rows.append(f"<tr><td>{label}</td><td>{week}</td><td>{previous}</td><td>{arrow} {change:+d}</td><td>{average:.1f}</td></tr>")
+    return f"""
+        📈 <b>Daily Alert Trend</b><br><br>
+        <table border="1" cellpadding="5" cellspacing="0" style="border-collapse: collapse; font-family: Arial, sans-serif; font-size: 14px;">
+        <tr><th>Metric</th><th>Last 7 Days</th><th>Previous 7 Days</th><th>Change</th><th>30-Day Daily Avg</th></tr>
+        {"".join(rows)}
+        </table><br>
+        """
 
-def build_email_body(owner_email, counters, is_summary=False):
-    name = owner_email.split("@")[0].split(".")[0].capitalize()
-    stats = counters.get(owner_email, {})
+STAT_KEYS = ["X1_HotDealsMissingContacts", "X2_HotDealsMissingDesignations", "X3_HotDealsLowMBR", "X4_DealsMissingType"]
 
-    if is_summary:
-        intro = f"""Hi {name},<br><br>
-Here's the summary report for all Hot Deals flagged this week.<br><br>"""
-        stats_html = f"""
-        1. 🧍‍♂️ Hot Deals Missing 2+ Contacts: <b>{sum(
-            stats.get("X1_HotDealsMissingContacts", 0)
-            for owner_email, stats in counters.items()
-            if owner_email not in exclude_emails
-        )}</b><br>
-        2. 🪪 Hot Deals Missing Designations: <b>{sum(
-            stats.get("X2_HotDealsMissingDesignations", 0)
-            for owner_email, stats in counters.items()
-            if owner_email not in exclude_emails
-        )}</b><br>
-        3. 💰 Hot Deals with No Valid MBR (&lt; ₹1,000): <b>{sum(
-            stats.get("X3_HotDealsLowMBR", 0)
-            for owner_email, stats in counters.items()
-            if owner_email not in exclude_emails
-        )}</b><br>
-        4. ❓ Deals with No Deal Type: <b>{sum(
-            stats.get("X4_DealsMissingType", 0)
-            for owner_email, stats in counters.items()
-            if owner_email not in exclude_emails
-        )}</b><br><br>
+SUMMARY_BODY = HtmlTemplate("""Hi {name},<br><br>
+Here's the summary report for all Hot Deals flagged this week.<br><br>
+        1. 🧍‍♂️ Hot Deals Missing 2+ Contacts: <b>{X1_HotDealsMissingContacts}</b><br>
+        2. 🪪 Hot Deals Missing Designations: <b>{X2_HotDealsMissingDesignations}</b><br>
+        3. 💰 Hot Deals with No Valid MBR (&lt; ₹1,000): <b>{X3_HotDealsLowMBR}</b><br>
+        4. ❓ Deals with No Deal Type: <b>{X4_DealsMissingType}</b><br><br>
+        {trend_html}
         📎 The attached sheet lists each flagged deal, ownership, and exact missing details.<br>
         Please update them within the week to keep your pipeline clean and leadership-ready.<br><br>
         Thanks,<br>Prozo Performance Manager
-        """
-    else:
-        intro = f"""Hi {name},<br><br>
+        """)
+
+OWNER_BODY = HtmlTemplate("""Hi {name},<br><br>
 Please find below your weekly diligence report for <b>Hot Deals</b>, highlighting gaps in data quality and commercial hygiene.<br>
 This is critical for ensuring every Hot Deal is dealroom-ready and qualified for conversion.<br><br>
-🛑 <b>Diligence Gaps Identified</b><br><br>"""
-
-        stats_html = f"""
-    1. 🧍‍♂️ Hot Deals Missing 2+ Contacts: <b>{stats.get("X1_HotDealsMissingContacts", 0)}</b><br>
-    2. 🪪 Hot Deals Missing Designations: <b>{stats.get("X2_HotDealsMissingDesignations", 0)}</b><br>
-    3. 💰 Hot Deals with No Valid MBR (&lt; ₹1,000): <b>{stats.get("X3_HotDealsLowMBR", 0)}</b><br>
-    4. ❓ Deals with No Deal Type: <b>{stats.get("X4_DealsMissingType", 0)}</b><br><br>
+🛑 <b>Diligence Gaps Identified</b><br><br>
+    1. 🧍‍♂️ Hot Deals Missing 2+ Contacts: <b>{X1_HotDealsMissingContacts}</b><br>
+    2. 🪪 Hot Deals Missing Designations: <b>{X2_HotDealsMissingDesignations}</b><br>
+    3. 💰 Hot Deals with No Valid MBR (&lt; ₹1,000): <b>{X3_HotDealsLowMBR}</b><br>
+    4. ❓ Deals with No Deal Type: <b>{X4_DealsMissingType}</b><br><br>
+    {trend_html}
     📎 The attached sheet lists each flagged deal, ownership, and exact missing details.<br>
     Please update them within the week to keep your pipeline clean and leadership-ready.<br><br>
     Thanks,<br>Prozo Performance Manager
+    """)
+
+def build_email_body(owner_email, counters, is_summary=False, trends=None, rollup=None):
+    # The summary goes out as one message to several people
+    name = owner_email.split("@")[0].split(".")[0].capitalize() if owner_email else "all"
+    trends = trends or {}
+    if is_summary:
+        trend_html = build_trend_html(trends, [owner for owner in trends if owner not in exclude_emails])
+        totals = (rollup or Rollup(counters, exclude=exclude_emails)).org
+        return SUMMARY_BODY.render(name=name, trend_html=trend_html, **{key: totals.get(key, 0) for key in STAT_KEYS})
+
+    trend_html = build_trend_html(trends, [owner_email] if owner_email in trends else [])
+    stats = counters.get(owner_email, {})
+    return OWNER_BODY.render(name=name, trend_html=trend_html, **{key: stats.get(key, 0) for key in STAT_KEYS})
+
+def alert_row(item):
+    _, alert, deal = item
+    deal_type_display = deal.type.label if deal else "unknown"
+    return [
+        deal.get("name", ""),
+        "",
+        deal.get("owner_email", ""),
+        "",
+        deal_type_display,
+        deal.get("num_associated_contacts", ""),
+        deal.get("amount", ""),
+        "; ".join(alert.get("alerts", [])),
+        "", "", "","",""
+    ]
+
+ALERT_SHEET = CsvLayout(
+    ["Deal Name", "", "Owner Email", "","Deal Type", "No. of Contacts", "Amount", "Alerts", "", "", "","",""], alert_row
+)
+
+class WeeklyReports:
+    """Every weekly email, rendered from one pass over the alerts.
+
+    Deals are looked up by id instead of scanning the owner's list per
+    alert, and the summary sheet reuses the owners' rows.
     """
-    return intro + stats_html
-
-def create_csv_content(alerts, grouped_deals, owner_email):
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Deal Name", "", "Owner Email", "","Deal Type", "No. of Contacts", "Amount", "Alerts", "", "", "","",""])
-
-    for alert in alerts.get(owner_email, []):
-        deal_id = alert["deal_id"]
-        deal = next((d for d in grouped_deals.get(owner_email, []) if d["id"] == deal_id), {})
-        raw_type = deal.get("deal_type", "").lower()
-        if raw_type == "true":
-            deal_type_display = "hot"
-        elif raw_type == "false":
-            deal_type_display = "warm"
-        elif raw_type == "cold":
-            deal_type_display = "cold"
-        else:
-            deal_type_display = "unknown"
-        writer.writerow([
-            deal.get("name", ""),
-            "",
-            deal.get("owner_email", ""),
-            "",
-            deal_type_display,
-            deal.get("num_associated_contacts", ""),
-            deal.get("amount", ""),
-            "; ".join(alert.get("alerts", [])),
-            "", "", "","",""
-        ])
-
-    return output.getvalue()
-
-def send_email_with_attachment(to_email, body_html, csv_content, role="OWNER"):
+
+    def __init__(self, alerts, counters, grouped_deals, trends=None):
+        self.counters = counters
+        self.trends = trends
+        self.rollup = Rollup(counters, exclude=exclude_emails)
+        deals = index_deals(grouped_deals)
+        self.rows = RenderedRows(ALERT_SHEET, (
+            (owner_email, alert, deals.get(alert["deal_id"], {}))
+            for owner_email, alert_list in alerts.items() if owner_email not in exclude_emails
+            for alert in alert_list
+        ), lambda item: item[0])
+
+    def owners(self):
+        return self.rows.owners()
+
+    def owner_message(self, email):
+        body = build_email_body(email, self.counters, trends=self.trends)
+        return build_message(email, body, self.rows.owner_sheet(email, "deal_alerts.csv"), role="OWNER")
+
+    def summary_message(self, recipients=None):
+        """The summary rendered once, addressed to every summary recipient"""
+        body = build_email_body(None, self.counters, is_summary=True, trends=self.trends, rollup=self.rollup)
+        return build_message(recipients or SUMMARY_RECEIVER, body, self.rows.sheet("deal_alerts.csv"), role="SUMMARY")
+
+def send_email_with_attachment(to_email, body_html, attachment, role="OWNER"):
+    send_message(build_message(to_email, body_html, attachment, role=role))
+
+def build_message(to_email, body_html, attachment, role="OWNER"):
     today_str = datetime.now().strftime("%d %b %Y")
     subject = {
         "SUMMARY": f"📢 WEEKLY SUMMARY || HOT DEALS PERFORMANCE || {today_str}",
@@ -115,7 +155,8 @@ def send_email_with_attachment(to_email, body_html, csv_content, role="OWNER"):
     }.get(role, f"📢 Deal Alert Summary – {today_str}")
 
     from_email = formataddr(("Prozo Performance Manager", EMAIL_USERNAME))
-    to_email_clean = to_email.strip().replace("\n", "").replace("\r", "")
+    recipients = [to_email] if isinstance(to_email, str) else to_email
+    to_email_clean = ", ".join(email.strip().replace("\n", "").replace("\r", "") for email in recipients)
 
     msg = EmailMessage()
     msg["Subject"] = subject
@@ -124,67 +165,34 @@ def send_email_with_attachment(to_email, body_html, csv_content, role="OWNER"):
     msg.set_content("This is a multi-part message in HTML and CSV.")
     msg.add_alternative(body_html, subtype="html")
 
-    print(f"📤 From: {from_email}")
-    print(f"📥 To: {to_email_clean}")
-    
+    log.info(f"📤 From: {from_email}")
+    log.info(f"📥 To: {to_email_clean}")
 
     msg.add_attachment(
-        csv_content.encode("utf-8"),
-        maintype="application",
-        subtype="octet-stream",
-        filename="deal_alerts.csv"
+        attachment.data,
+        maintype=attachment.maintype,
+        subtype=attachment.subtype,
+        filename=attachment.filename
     )
-
-    # Retry sending the email once on failure
-    for attempt in range(2):
-        try:
-            with smtplib.SMTP("smtp.gmail.com", 587, timeout=30) as server:
-                server.starttls()
-                server.login(EMAIL_USERNAME, EMAIL_PASSWORD)
-                server.send_message(msg)
-            print(f"✅ Email sent to {to_email}")
-            return
-        except Exception as e:
-            print(f"❌ Attempt {attempt + 1}: Failed to send email to {to_email}: {e}")
-            if attempt == 0:
-                print("⏳ Retrying in 5 seconds...")
-                time.sleep(5)
-            else:
-                raise
-
-def safe_send_email(email, alerts, grouped_deals, role="OWNER", counters=None):
-    try:
-        body = build_email_body(email, counters, is_summary=(role == "SUMMARY"))
-        csv_content = create_csv_content(alerts, grouped_deals, email)
-        send_email_with_attachment(email, body, csv_content, role=role)
-    except Exception as e:
-        print(f"❌ Final failure: Could not send email to {email}: {e}")
-
-def export_and_email(alerts, counters, grouped_deals):
-    # 1️⃣ Send per-owner reports
-    for owner_email, alert_list in alerts.items():
-        if not alert_list or owner_email in exclude_emails:
-            continue
-        safe_send_email(owner_email, alerts, grouped_deals, role="OWNER", counters=counters)
-
-    # 2️⃣ Summary for Kuldeep
-    combined_alerts = {SUMMARY_RECEIVER[0]: [], SUMMARY_RECEIVER[1]: []}
-    combined_deals = {SUMMARY_RECEIVER[0]: [], SUMMARY_RECEIVER[1]: []}
-
-    for owner_email, alert_list in alerts.items():
-        if owner_email in exclude_emails:
-            continue
-        combined_alerts[SUMMARY_RECEIVER[0]].extend(alert_list)
-        combined_alerts[SUMMARY_RECEIVER[1]].extend(alert_list)
-        combined_deals[SUMMARY_RECEIVER[0]].extend(grouped_deals.get(owner_email, []))
-        combined_deals[SUMMARY_RECEIVER[1]].extend(grouped_deals.get(owner_email, []))
-    
-    combined_deals[SUMMARY_RECEIVER[2]] = combined_deals[SUMMARY_RECEIVER[0]].copy()
-    combined_alerts[SUMMARY_RECEIVER[2]] = combined_alerts[SUMMARY_RECEIVER[0]].copy()
-    combined_deals[SUMMARY_RECEIVER[3]] = combined_deals[SUMMARY_RECEIVER[0]].copy()
-    combined_alerts[SUMMARY_RECEIVER[3]] = combined_alerts[SUMMARY_RECEIVER[0]].copy()
-
-    safe_send_email(SUMMARY_RECEIVER[0], combined_alerts, combined_deals, role="SUMMARY", counters=counters)
-    safe_send_email(SUMMARY_RECEIVER[1], combined_alerts, combined_deals, role="SUMMARY", counters=counters)
-    safe_send_email(SUMMARY_RECEIVER[2], combined_alerts, combined_deals, role="SUMMARY", counters=counters)
-    safe_send_email(SUMMARY_RECEIVER[3], combined_alerts, combined_deals, role="SUMMARY", counters=counters)
+    return msg
+
+def send_message(msg):
+    """Send a built message; a retry from the dispatch queue resends the same message"""
+    # Shared logged-in connections; failures go back to the dispatch queue, which retries
+    refused = smtp_pool(EMAIL_USERNAME, EMAIL_PASSWORD).send(msg)
+    # Some recipients refused is not a failure: retrying would resend to the rest
+    for email, (code, reason) in (refused or {}).items():
+        log.warning(f"⚠️ {email} refused by the server ({code}): {reason!r}")
+
+def export_and_email(alerts, counters, grouped_deals, trends=None):
+    # Every report is rendered up front; the queue sends them concurrently
+    reports = WeeklyReports(alerts, counters, grouped_deals, trends)
+    with DispatchQueue() as mail:
+        # 1️⃣ Send per-owner reports
+        for owner_email in reports.owners():
+            mail.submit(owner_email, "OWNER", send_message, reports.owner_message(owner_email))
+
+        # 2️⃣ Summary, rendered once and sent as one message to every SUMMARY_RECEIVER
+        if SUMMARY_RECEIVER:
+            mail.submit(", ".join(SUMMARY_RECEIVER), "SUMMARY", send_message, reports.summary_message())
+    return mail.report
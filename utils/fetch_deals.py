@@ -1,14 +1,22 @@
 import os
 import time
-import requests
 from dotenv import load_dotenv
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from src.deal_record import Deal
+from src.deal_store import DealStore
+from src.deal_table import DealTable
+from src.log import get_logger, trace
+from src.owners import owner_directory
+from src.throttle import hubspot_limiter
+from src.transport import HUBSPOT_BASE_URL, new_session
+
 load_dotenv()
 
 HUBSPOT_TOKEN = os.getenv("HUBSPOT_TOKEN")
-BASE_URL = "https://api.hubapi.com"
+BASE_URL = HUBSPOT_BASE_URL
+
+log = get_logger("weekly.fetch")
 
 HEADERS = {
     "Authorization": f"Bearer {HUBSPOT_TOKEN}",
@@ -21,22 +29,108 @@ def requests_retry_session():
         total=5,
         backoff_factor=1,
         status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET"]
+        # POST is only used for read-only batch endpoints, so it is safe to retry
+        allowed_methods=["GET", "POST"]
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session = requests.Session()
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
+    return new_session(max_retries=retry_strategy)
 
 session = requests_retry_session()
 
-def get_owner_email_map():
-    url = f"{BASE_URL}/crm/v3/owners"
-    res = session.get(url, headers=HEADERS)
-    return {owner["id"]: owner["email"] for owner in res.json().get("results", [])}
+BATCH_SIZE = 100  # HubSpot caps batch endpoints at 100 inputs
+SEARCH_RESULT_CEILING = 10000  # search stops paging after this many results
+WEEKLY_SCOPE = "weekly_all"
+DEAL_PROPERTIES = [
+    "dealname",
+    "hubspot_owner_id",
+    "hs_lastmodifieddate",
+    "deal_type__hot__warm___cold_",
+    "amount",
+    "num_associated_contacts"
+]
+CONTACT_PROPERTIES = ["firstname", "lastname", "email", "jobtitle"]
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def fetch_contact_ids_batch(deal_ids):
+    """Return {deal_id: [contact_id, ...]} for up to BATCH_SIZE deals"""
+    url = f"{BASE_URL}/crm/v4/associations/deals/contacts/batch/read"
+    hubspot_limiter.acquire()
+    res = session.post(url, headers=HEADERS, json={"inputs": [{"id": d} for d in deal_ids]})
+    associations = {deal_id: [] for deal_id in deal_ids}
+    if res.status_code not in (200, 207):
+        log.warning(f"⚠️ Failed to fetch contact associations ({res.status_code})")
+        return associations
+
+    for result in res.json().get("results", []):
+        deal_id = str(result.get("from", {}).get("id"))
+        contact_ids = [str(to["toObjectId"]) for to in result.get("to", [])]
+        # The batch read returns one page per deal; follow the rest one deal at a time
+        after = result.get("paging", {}).get("next", {}).get("after")
+        while after:
+            hubspot_limiter.acquire()
+            page = session.get(
+                f"{BASE_URL}/crm/v4/objects/deals/{deal_id}/associations/contacts?limit=500&after={after}",
+                headers=HEADERS
+            )
+            if page.status_code != 200:
+                log.warning(f"⚠️ Failed to page contacts for deal {deal_id} ({page.status_code})")
+                break
+            data = page.json()
+            contact_ids.extend(str(to["toObjectId"]) for to in data.get("results", []))
+            after = data.get("paging", {}).get("next", {}).get("after")
+        associations[deal_id] = contact_ids
+    return associations
+
+def fetch_contacts_batch(contact_ids):
+    """Return {contact_id: contact} for up to BATCH_SIZE contacts"""
+    url = f"{BASE_URL}/crm/v3/objects/contacts/batch/read"
+    hubspot_limiter.acquire()
+    res = session.post(url, headers=HEADERS, json={
+        "properties": CONTACT_PROPERTIES,
+        "inputs": [{"id": cid} for cid in contact_ids]
+    })
+    if res.status_code not in (200, 207):
+        log.warning(f"⚠️ Failed to fetch {len(contact_ids)} contacts ({res.status_code})")
+        return {}
+
+    contacts = {}
+    for result in res.json().get("results", []):
+        c = result.get("properties", {})
+        contacts[str(result.get("id"))] = {
+            "firstname": c.get("firstname", ""),
+            "lastname": c.get("lastname", ""),
+            "email": c.get("email", ""),
+            "jobtitle": c.get("jobtitle", "")
+        }
+    return contacts
 
-def get_all_deals_grouped_by_owner():
+def fetch_deal_contacts(deal_ids):
+    """Resolve deal -> contacts for every deal in chunks of BATCH_SIZE.
+
+    Returns {deal_id: [contact, ...]} keeping HubSpot's association order;
+    contacts shared between deals are only read once.
+    """
+    contact_ids_by_deal = {}
+    for chunk in chunked(deal_ids, BATCH_SIZE):
+        contact_ids_by_deal.update(fetch_contact_ids_batch(chunk))
+
+    unique_ids = list(dict.fromkeys(cid for ids in contact_ids_by_deal.values() for cid in ids))
+    contacts = {}
+    for chunk in chunked(unique_ids, BATCH_SIZE):
+        contacts.update(fetch_contacts_batch(chunk))
+    log.info(f"👥 Loaded {len(contacts)} contacts for {len(deal_ids)} deals")
+
+    return {
+        deal_id: [contacts[cid] for cid in ids if cid in contacts]
+        for deal_id, ids in contact_ids_by_deal.items()
+    }
+
+def get_owner_email_map(owner_ids=()):
+    return owner_directory.email_map(owner_ids)
+
+def list_all_deals():
     url = f"{BASE_URL}/crm/v3/objects/deals"
     limit = 100
     after = None
@@ -45,82 +139,98 @@ def get_all_deals_grouped_by_owner():
     while True:
         params = {
             "limit": limit,
-            "properties": "dealname,hubspot_owner_id,deal_type__hot__warm___cold_,amount,num_associated_contacts"
+            "properties": ",".join(DEAL_PROPERTIES)
         }
         if after:
             params["after"] = after
 
+        hubspot_limiter.acquire()
         res = session.get(url, headers=HEADERS, params=params)
         res.raise_for_status()
         data = res.json()
         all_deals.extend(data.get("results", []))
         after = data.get("paging", {}).get("next", {}).get("after")
         if not after:
-            break
-        time.sleep(0.4)
+            return all_deals
+
+def search_deals_modified_since(modified_since_ms):
+    """Deals touched since the watermark, or None if the delta is too big for search"""
+    url = f"{BASE_URL}/crm/v3/objects/deals/search"
+    after = None
+    changed = []
+
+    while True:
+        payload = {
+            "filterGroups": [{"filters": [{
+                "propertyName": "hs_lastmodifieddate",
+                "operator": "GTE",
+                "value": str(modified_since_ms)
+            }]}],
+            "properties": DEAL_PROPERTIES,
+            "limit": 100
+        }
+        if after:
+            payload["after"] = after
+
+        hubspot_limiter.acquire()
+        res = session.post(url, headers=HEADERS, json=payload)
+        res.raise_for_status()
+        data = res.json()
+        if data.get("total", 0) >= SEARCH_RESULT_CEILING:
+            return None
+        changed.extend(data.get("results", []))
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            return changed
+
+def sync_all_deals(store):
+    """Bring the local store's weekly scope up to date"""
+    started_ms = int(time.time() * 1000)
+    since_ms = store.delta_since(WEEKLY_SCOPE)
+    changed = search_deals_modified_since(since_ms) if since_ms is not None else None
+    full = changed is None
+    if full:
+        log.info("🔄 Full reconcile of all deals...")
+        changed = list_all_deals()
+
+    store.upsert(WEEKLY_SCOPE, [{"id": d["id"], "properties": d.get("properties", {})} for d in changed])
+    store.finish_sync(WEEKLY_SCOPE, started_ms, full=full, seen_ids=[d["id"] for d in changed])
+    log.info(f"💾 Synced {len(changed)} changed deal(s) into the local store")
 
-    print(f"📦 Fetched {len(all_deals)} total deals")
+def get_all_deals_grouped_by_owner():
+    store = DealStore()
+    sync_all_deals(store)
+    deal_ids = store.ids(WEEKLY_SCOPE)
+
+    log.info(f"📦 Fetched {len(deal_ids)} total deals")
 
     owners = get_owner_email_map()
+    contacts_by_deal = fetch_deal_contacts(deal_ids)
+    table = DealTable()
     grouped = {}
 
-    for i, deal in enumerate(all_deals, 1):
+    # Records stream out of the store straight into the table's columns
+    for i, deal in enumerate(store.iter_records(WEEKLY_SCOPE), 1):
         props = deal.get('properties', {})
         owner_id = props.get('hubspot_owner_id')
-        owner_email = owners.get(owner_id, 'unknown@prozo.com')
-
-        # Get associated contact IDs
-        contact_url = f"{BASE_URL}/crm/v3/objects/deals/{deal['id']}/associations/contacts"
-        contact_res = session.get(contact_url, headers=HEADERS, params={"limit": 100})
-        contact_ids = [r['id'] for r in contact_res.json().get('results', [])]
-
-        # Fetch contact details
-        contacts = []
-        for cid in contact_ids:
-            try:
-                contact_detail_url = f"{BASE_URL}/crm/v3/objects/contacts/{cid}"
-                detail_res = session.get(contact_detail_url, headers=HEADERS, params={
-                    "properties": "firstname,lastname,email,jobtitle"
-                })
-                c = detail_res.json().get("properties", {})
-                contacts.append({
-                    "firstname": c.get("firstname", ""),
-                    "lastname": c.get("lastname", ""),
-                    "email": c.get("email", ""),
-                    "jobtitle": c.get("jobtitle", "")
-                })
-                time.sleep(0.4)
-            except Exception as e:
-                print(f"⚠️ Failed to fetch contact {cid}: {e}")
-                continue
-
-        deal_data = {
-            "id": deal.get("id"),
-            "name": props.get("dealname", "No Name"),
-            "owner_email": owner_email,
-            "deal_type": props.get("deal_type__hot__warm___cold_") or "N/A",
-            "amount": props.get("amount") or "N/A",
-            "num_associated_contacts": props.get("num_associated_contacts") or 0,
-            "associated_contacts": contacts
-        }
+        # An owner missing from the map reloads the directory once, so new owners' reports are not lost
+        owner_email = owners.get(owner_id) or owner_directory.email_for(owner_id) or 'unknown@prozo.com'
 
-        print(f"\n📦 Deal {i}")
-        print(f"🆔 ID: {deal_data['id']}")
-        
-       # print(f"📛 Name: {deal_data['name']}")
-        #print(f"👤 Owner Email: {deal_data['owner_email']}")
-        #print(f"🔖 Deal Type: {deal_data['deal_type']}")
-        #print(f"💰 Amount: ₹{deal_data['amount']}")
-        #print(f"👥 Total Contacts: {len(contacts)} (API) / {deal_data['num_associated_contacts']} (Property)")
-        #for contact in contacts:
-         #   print(f"   - {contact['firstname']} {contact['lastname']} | {contact['email']} | {contact['jobtitle']}")   
+        contacts = contacts_by_deal.pop(str(deal.get("id")), [])
 
-        grouped.setdefault(owner_email, []).append(deal_data)
+        deal_data = table.append(Deal(
+            id=deal.get("id"),
+            name=props.get("dealname", "No Name"),
+            owner_email=owner_email,
+            deal_type=props.get("deal_type__hot__warm___cold_") or "N/A",
+            amount=props.get("amount") or "N/A",
+            num_associated_contacts=props.get("num_associated_contacts") or 0
+        ), contacts=contacts)
+
+        trace(deal_data['id'], "📦 Deal %d", i, owner=owner_email, type=deal_data.type.label,
+              amount=deal_data['amount'], contacts=len(contacts))
 
-        # Delay to prevent rate limit
-        time.sleep(0.4)
-        if i % 10 == 0:
-            time.sleep(3)
+        grouped.setdefault(owner_email, []).append(deal_data)
 
-    print(f"\n✅ Grouped {len(all_deals)} deals by {len(grouped)} owners")
+    log.info(f"✅ Grouped {len(table)} deals by {len(grouped)} owners")
     return grouped
@@ -4,17 +4,27 @@ load_dotenv()
 from utils.fetch_deals import get_all_deals_grouped_by_owner
 from utils.analyze import analyze_deals
 from utils.emailer import export_and_email
+from src.metric_history import MetricHistory
+from src.log import get_logger, stage
+
+log = get_logger("weekly.main")
 
 if __name__ == "__main__":
-    print("🚀 Fetching all deals...")
-    grouped_deals = get_all_deals_grouped_by_owner()
+    with stage(log, "🚀 Fetching all deals") as counts:
+        grouped_deals = get_all_deals_grouped_by_owner()
+        counts["owners"] = len(grouped_deals or {})
 
     if not grouped_deals:
-        print("⚠️ No deals found.")
+        log.warning("⚠️ No deals found.")
         exit()
 
-    print("🧠 Analyzing deals...")
-    alerts, counters = analyze_deals(grouped_deals)
+    with stage(log, "🧠 Analyzing deals") as counts:
+        alerts, counters = analyze_deals(grouped_deals)
+        counts["alerted_deals"] = sum(map(len, alerts.values()))
+
+    # 📈 Trends come from the daily runs' local history, no HubSpot calls
+    trends = MetricHistory().summary()
+    log.info(f"📈 Loaded daily alert trends for {len(trends)} owner(s)")
 
-    print("📧 Sending emails to owners and summary to Kuldeep...")
-    export_and_email(alerts, counters ,grouped_deals)
+    with stage(log, "📧 Sending emails to owners and summary to Kuldeep"):
+        export_and_email(alerts, counters ,grouped_deals, trends=trends)